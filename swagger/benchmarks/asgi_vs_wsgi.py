@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Сравнение задержек сводных эндпоинтов под WSGI и ASGI.
+
+Синхронные эндпоинты вызываются через WSGI-обработчик (django.test.Client)
+из пула потоков, асинхронные - через ASGI-обработчик (AsyncClient)
+конкурентными корутинами. Оба варианта пользуются одним кешем сводок,
+поэтому перед каждым запросом кеш очищается: сравнивается расчёт, а не
+чтение из кеша. Данные создаются во временной тестовой БД.
+
+Запустите из каталога проекта:
+    python benchmarks/asgi_vs_wsgi.py --requests 300 --concurrency 8 --transactions 20000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from configapp import rollups  # noqa: E402
+from configapp.models import Account, Category, Transaction  # noqa: E402
+
+ENDPOINTS = [
+    ('accounts summary', '/api/accounts/summary/', '/api/async/accounts/summary/'),
+    ('transactions statistics', '/api/transactions/statistics/', '/api/async/transactions/statistics/'),
+]
+
+
+def seed(transactions):
+    """Пользователь с тремя счетами и историей транзакций"""
+    user = User.objects.create_user(username='bench', password='bench')
+    accounts = [
+        Account.objects.create(user=user, name=f'Account {i}', balance=Decimal('100000'))
+        for i in range(3)
+    ]
+    categories = [
+        Category.objects.create(user=user, name=f'Category {i}', type='expense')
+        for i in range(8)
+    ]
+    now = timezone.now()
+    rng = random.Random(42)
+    Transaction.objects.bulk_create([
+        Transaction(
+            account=rng.choice(accounts),
+            category=rng.choice(categories),
+            type=rng.choice(['expense', 'expense', 'income']),
+            amount=Decimal(rng.randint(100, 100000)) / 100,
+            date=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+        )
+        for _ in range(transactions)
+    ], batch_size=2000)
+    rollups.rebuild()
+    return Token.objects.get(user=user).key
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]  # noqa: E731
+    return pick(0.50) * 1000, pick(0.99) * 1000, statistics.mean(samples) * 1000
+
+
+def bench_wsgi(path, token, requests, concurrency):
+    def one(_):
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        cache.clear()
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.status_code
+        connection.close()
+        return elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(requests)))
+
+
+async def bench_asgi(path, token, requests, concurrency):
+    client = AsyncClient()
+    headers = {'Authorization': f'Token {token}'}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await cache.aclear()
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            elapsed = time.perf_counter() - started
+            assert response.status_code == 200, response.status_code
+            return elapsed
+
+    return await asyncio.gather(*(one() for _ in range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--transactions', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        token = seed(args.transactions)
+        print(f"{'endpoint':<26}{'entry':<7}{'p50, ms':>10}{'p99, ms':>10}{'mean, ms':>10}")
+        for name, sync_path, async_path in ENDPOINTS:
+            wsgi = bench_wsgi(sync_path, token, args.requests, args.concurrency)
+            asgi = asyncio.run(bench_asgi(async_path, token, args.requests, args.concurrency))
+            for entry, samples in (('WSGI', wsgi), ('ASGI', asgi)):
+                p50, p99, mean = percentiles(samples)
+                print(f"{name:<26}{entry:<7}{p50:>10.2f}{p99:>10.2f}{mean:>10.2f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Пропускная способность при смешанной нагрузке чтение/запись для профилей
+SQLite: по умолчанию и производственного (DJANGO_DB_PROFILE=production -
+WAL, synchronous=NORMAL, mmap, BEGIN IMMEDIATE, постоянные соединения).
+
+Запросы идут через WSGI-обработчик (django.test.Client) из пула потоков:
+доля --write-ratio - создание транзакций, остальное - список транзакций,
+сводка по счетам и история баланса. После каждого запроса соединения
+закрываются по правилам CONN_MAX_AGE, как в конце запроса под WSGI.
+Данные создаются во временной тестовой БД.
+
+Запустите из каталога проекта (--compare - оба профиля в отдельных процессах):
+    python benchmarks/sqlite_profiles.py --compare --requests 2000 --concurrency 8
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import OperationalError, close_old_connections, connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from configapp import balances, ledger, metrics  # noqa: E402
+from configapp.models import Account, Category, Transaction  # noqa: E402
+
+PROFILES = ('default', 'production')
+
+READ_PATHS = [
+    '/api/transactions/?account_id={account}',
+    '/api/accounts/summary/',
+    '/api/accounts/{account}/balance-history/?step=week',
+]
+
+
+def seed(transactions, accounts_count):
+    """Пользователь со счетами и историей транзакций"""
+    user = User.objects.create_user(username='bench', password='bench')
+    accounts = [
+        Account.objects.create(user=user, name=f'Account {i}', balance=Decimal('100000'))
+        for i in range(accounts_count)
+    ]
+    categories = [
+        Category.objects.create(user=user, name=f'Category {i}', type='expense')
+        for i in range(8)
+    ]
+    now = timezone.now()
+    rng = random.Random(42)
+    created = Transaction.objects.bulk_create([
+        Transaction(
+            account=rng.choice(accounts),
+            category=rng.choice(categories),
+            type='expense',
+            amount=Decimal(rng.randint(100, 100000)) / 100,
+            date=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+            balance_after=0,
+        )
+        for _ in range(transactions)
+    ], batch_size=2000)
+    for account in accounts:
+        ledger.apply_balance_delta(account.pk, -sum(t.amount for t in created if t.account_id == account.pk))
+        balances.rebuild(account.pk)
+    return (
+        Token.objects.get(user=user).key,
+        [account.pk for account in accounts],
+        [category.pk for category in categories],
+    )
+
+
+def run_mixed(token, account_ids, category_ids, requests, concurrency, write_ratio):
+    """Выполнить requests запросов; возвращает замеры по чтению/записи и число ошибок"""
+    plan = random.Random(7)
+    tasks = [
+        ('write' if plan.random() < write_ratio else 'read', plan.choice(account_ids), plan.choice(category_ids),
+         plan.choice(READ_PATHS))
+        for _ in range(requests)
+    ]
+
+    def one(task):
+        kind, account, category, path = task
+        client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        started = time.perf_counter()
+        try:
+            if kind == 'write':
+                response = client.post('/api/transactions/', {
+                    'account': account, 'category': category, 'type': 'expense', 'amount': '1.25',
+                    'description': 'load',
+                })
+            else:
+                response = client.get(path.format(account=account))
+            ok = response.status_code < 500
+        except OperationalError:
+            ok = False
+        finally:
+            # Конец запроса под WSGI: закрыть соединение, если истёк CONN_MAX_AGE
+            close_old_connections()
+        return kind, time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, tasks))
+    elapsed = time.perf_counter() - started
+    connection.close()
+    return results, elapsed
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 if samples else 0.0
+
+
+def summarize(profile, results, elapsed):
+    lock_retries = sum(int(line.rsplit(' ', 1)[1]) for line in metrics.db_lock_retries.collect())
+    summary = {
+        'profile': profile,
+        'requests': len(results),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'errors': sum(1 for _, _, ok in results if not ok),
+        'lock_retries': lock_retries,
+    }
+    for kind in ('read', 'write'):
+        samples = [duration for k, duration, ok in results if k == kind and ok]
+        summary[f'{kind}_p50_ms'] = round(percentile(samples, 0.50), 2)
+        summary[f'{kind}_p99_ms'] = round(percentile(samples, 0.99), 2)
+        summary[f'{kind}_mean_ms'] = round(statistics.mean(samples) * 1000, 2) if samples else 0.0
+    return summary
+
+
+def run_profile(args):
+    profile = os.environ.get('DJANGO_DB_PROFILE') or 'default'
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        token, account_ids, category_ids = seed(args.transactions, args.accounts)
+        connection.close()
+        results, elapsed = run_mixed(
+            token, account_ids, category_ids, args.requests, args.concurrency, args.write_ratio,
+        )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+    return summarize(profile, results, elapsed)
+
+
+COLUMNS = [
+    ('profile', 'profile', '<12', ''),
+    ('throughput_rps', 'req/s', '>9', '.1f'),
+    ('read_p50_ms', 'read p50', '>10', '.2f'),
+    ('read_p99_ms', 'read p99', '>10', '.2f'),
+    ('write_p50_ms', 'write p50', '>11', '.2f'),
+    ('write_p99_ms', 'write p99', '>11', '.2f'),
+    ('errors', 'errors', '>8', ''),
+    ('lock_retries', 'retries', '>9', ''),
+]
+
+
+def print_table(summaries):
+    print(''.join(f'{title:{align}}' for _, title, align, _ in COLUMNS))
+    for summary in summaries:
+        print(''.join(f'{summary[key]:{align}{fmt}}' for key, _, align, fmt in COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--accounts', type=int, default=4)
+    parser.add_argument('--compare', action='store_true', help='Запустить оба профиля и сравнить')
+    parser.add_argument('--json', action='store_true', help='Вывести результат одной строкой JSON')
+    args = parser.parse_args()
+
+    if not args.compare:
+        summary = run_profile(args)
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            print_table([summary])
+        return
+
+    # Профиль выбирается при загрузке настроек, поэтому каждый - в своём процессе
+    argv = [arg for arg in sys.argv[1:] if arg != '--compare']
+    summaries = []
+    for profile in PROFILES:
+        env = {**os.environ, 'DJANGO_DB_PROFILE': profile}
+        output = subprocess.run(
+            [sys.executable, __file__, *argv, '--json'], env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        summaries.append(json.loads(output.strip().splitlines()[-1]))
+    print_table(summaries)
+    base, production = summaries
+    if base['throughput_rps']:
+        print(f"throughput: x{production['throughput_rps'] / base['throughput_rps']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
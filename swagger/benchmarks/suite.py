@@ -0,0 +1,176 @@
+"""
+Бенчмарки основных эндпоинтов через тестовый клиент Django.
+
+Для каждого сценария сначала выполняется один запрос под tracemalloc и
+CaptureQueriesContext (число SQL-запросов и пиковая память), затем серия
+запросов только с замером времени (p50/p95/p99). Кеш очищается перед каждым
+запросом, поэтому измеряется некешированный путь. Результат сравнивается
+с сохранённым базовым JSON: рост задержки или памяти больше допуска и любое
+увеличение числа запросов считаются регрессией.
+
+Запускается командой: python manage.py run_benchmarks
+"""
+
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from configapp import currency, loadgen
+from configapp.models import Account
+
+Scenario = namedtuple('Scenario', 'name method path auth data', defaults=(None,))
+
+SCENARIOS = [
+    Scenario('dashboard', 'get', '/dashboard/', 'session'),
+    Scenario('account_detail', 'get', '/account/{account}/', 'session'),
+    Scenario('statistics', 'get', '/statistics/', 'session'),
+    Scenario('accounts_summary', 'get', '/api/accounts/summary/', 'token'),
+    Scenario('balance_history', 'get', '/api/accounts/{account}/balance-history/', 'token'),
+    Scenario('transactions_list', 'get', '/api/transactions/', 'token'),
+    Scenario('transactions_statistics', 'get', '/api/transactions/statistics/', 'token'),
+    Scenario('transactions_search', 'get', '/api/transactions/search/?q=маг', 'token'),
+    Scenario(
+        'transaction_create', 'post', '/api/transactions/', 'token',
+        {'account': '{account}', 'type': 'expense', 'amount': '12.50', 'description': 'benchmark'},
+    ),
+]
+
+# Метрики, которые сравниваются с базовыми с допуском (время и память)
+TOLERATED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'peak_memory_kb')
+
+
+def seed(users, accounts_per_user, transactions_per_account, seed=0, workers=None):
+    """Набор данных для бенчмарка; возвращает пользователя и id его первого счета"""
+    # Курсы нужны, чтобы общий баланс считался с пересчётом валют
+    currency.load_rates(settings.CURRENCY_RATES_FILE)
+    loadgen.generate(
+        users, accounts_per_user, transactions_per_account,
+        seed=seed, workers=workers, prefix='bench',
+    )
+    user = User.objects.filter(username__startswith='bench_').order_by('id').first()
+    account = Account.objects.filter(user=user).order_by('id').first()
+    return user, account.pk
+
+
+def make_clients(user):
+    session = Client()
+    session.force_login(user)
+    token = Client(headers={'Authorization': f'Token {Token.objects.get(user=user).key}'})
+    return {'session': session, 'token': token}
+
+
+def percentile(samples, q):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _request(client, scenario, context):
+    path = scenario.path.format(**context)
+    if scenario.data is None:
+        response = getattr(client, scenario.method)(path)
+    else:
+        data = {key: str(value).format(**context) for key, value in scenario.data.items()}
+        response = getattr(client, scenario.method)(path, data)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{scenario.name}: {scenario.method.upper()} {path} -> {response.status_code}')
+    return response
+
+
+def run_scenario(scenario, clients, context, requests, warmup=3):
+    """Метрики одного сценария"""
+    client = clients[scenario.auth]
+    for _ in range(warmup):
+        cache.clear()
+        _request(client, scenario, context)
+
+    cache.clear()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            _request(client, scenario, context)
+        # Следующий запрос очистит журнал соединения (reset_queries)
+        query_count = len(queries)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    samples = []
+    for _ in range(requests):
+        cache.clear()
+        started = time.perf_counter()
+        _request(client, scenario, context)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    return {
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(user, account_id, requests, warmup=3, names=None, log=None):
+    """Прогнать сценарии; возвращает {имя сценария: метрики}"""
+    log = log or (lambda name, metrics: None)
+    clients = make_clients(user)
+    context = {'account': account_id}
+    results = {}
+    for scenario in SCENARIOS:
+        if names and scenario.name not in names:
+            continue
+        results[scenario.name] = run_scenario(scenario, clients, context, requests, warmup)
+        log(scenario.name, results[scenario.name])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базовых метрик"""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if metrics['queries'] > base['queries']:
+            regressions.append(f"{name}: запросов {metrics['queries']} > {base['queries']}")
+        for metric in TOLERATED_METRICS:
+            limit = base[metric] * (1 + tolerance)
+            if metrics[metric] > limit:
+                regressions.append(f'{name}: {metric} {metrics[metric]} > {base[metric]} (+{tolerance:.0%})')
+    return regressions
+
+
+def report(dataset, results):
+    return {
+        'dataset': dataset,
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'database': connection.vendor,
+        },
+        'results': results,
+    }
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
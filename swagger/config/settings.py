@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.utils.translation import gettext_lazy as _
 
@@ -45,12 +46,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'configapp.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'configapp.middleware.ShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,9 +85,91 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая БД в файле: общий in-memory кеш SQLite не ждёт блокировок,
+        # а тесты параллельной записи должны проверять настоящие блокировки файла
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Производственный профиль SQLite (DJANGO_DB_PROFILE=production):
+# WAL - читатели не ждут писателя, synchronous=NORMAL - fsync только на
+# контрольных точках WAL, mmap и кеш страниц ускоряют чтение. Транзакции
+# начинаются с BEGIN IMMEDIATE: блокировка записи берётся сразу и ждёт
+# timeout секунд, а не падает с "database is locked" при повышении блокировки.
+# Соединения живут CONN_MAX_AGE секунд вместо открытия на каждый запрос.
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-32000;'
+        'PRAGMA temp_store=MEMORY'
+    ),
+}
+
+if os.environ.get('DJANGO_DB_PROFILE') == 'production':
+    DATABASES['default'].update({
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    })
+
+
+# Реплика для отчётов: копия основной БД, которую обновляет команда
+# refresh_analytics_db. Статистика и дашборд читают из неё, пока она не
+# старше ANALYTICS_MAX_STALENESS секунд, иначе - из основной БД.
+ANALYTICS_DB_PATH = Path(os.environ.get('DJANGO_ANALYTICS_DB', BASE_DIR / 'analytics.sqlite3'))
+ANALYTICS_MAX_STALENESS = 300
+
+DATABASES['analytics'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': f'file:{ANALYTICS_DB_PATH}?mode=ro',
+    'OPTIONS': {'uri': True},
+    'TEST': {'MIRROR': 'default'},
+}
+
+# Шардирование данных пользователей (DJANGO_SHARDS=N): счета, категории,
+# транзакции, платежи и сводка каждого пользователя живут в одном из N
+# файлов shard_<i>.sqlite3 (см. configapp.sharding). default хранит
+# пользователей, токены, сессии и курсы. После изменения N (в том числе
+# при включении шардирования на существующей БД) выполните
+# python manage.py migrate --database shard_<i> для новых шардов и
+# python manage.py rebalance_shards.
+SHARDS = [f'shard_{i}' for i in range(int(os.environ.get('DJANGO_SHARDS', 0)))]
+
+for _alias in SHARDS:
+    DATABASES[_alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'{_alias}.sqlite3',
+        'TEST': {'NAME': BASE_DIR / f'test_{_alias}.sqlite3'},
+    }
+
+DATABASE_ROUTERS = ['configapp.routers.ShardRouter', 'configapp.routers.AnalyticsRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# По умолчанию кеш в памяти процесса; при нескольких воркерах задайте
+# DJANGO_CACHE_DIR, чтобы процессы делили файловый кеш. Реплика для отчётов
+# используется только с общим кешем (см. configapp.analytics)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bank',
+    }
+}
+
+if os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -145,6 +230,21 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Валюты: курсы хранятся относительно базовой валюты и загружаются командой
+# load_currency_rates из CURRENCY_RATES_FILE; в памяти процесса живут
+# CURRENCY_RATES_TTL секунд. Итоги по счетам показываются в валюте отчёта
+# (по умолчанию REPORTING_CURRENCY, пользователь может выбрать другую)
+BASE_CURRENCY = 'UZS'
+REPORTING_CURRENCY = 'UZS'
+CURRENCY_RATES_FILE = BASE_DIR / 'currency_rates.json'
+CURRENCY_RATES_TTL = 300
+
+# Сколько последних транзакций встраивается в GET /api/accounts/{id}/
+ACCOUNT_DETAIL_TRANSACTIONS = 20
+
+# /metrics/ доступны персоналу и без входа - только с этих адресов (Prometheus)
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('DJANGO_METRICS_ALLOWED_IPS', '').split(',') if ip]
+
 # Swagger/OpenAPI
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Bank Management API',
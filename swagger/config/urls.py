@@ -11,6 +11,7 @@ from configapp.api_views import (
     UserRegisterViewSet, UserViewSet, CategoryViewSet,
     AccountViewSet, TransactionViewSet, RecurringPaymentViewSet
 )
+from configapp import async_views
 from rest_framework.authtoken.views import obtain_auth_token
 from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView, SpectacularRedocView
 
@@ -34,6 +35,13 @@ urlpatterns = [
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     
+    # Асинхронные (ASGI) варианты сводных эндпоинтов
+    path('api/async/accounts/summary/', async_views.accounts_summary, name='async-account-summary'),
+    path('api/async/transactions/statistics/', async_views.transactions_statistics, name='async-transaction-statistics'),
+    
     # API Endpoints
     path('api/', include(router.urls)),
+    
+    # HTML-интерфейс
+    path('', include('configapp.urls')),
 ]
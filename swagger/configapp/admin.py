@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Account, Category, Transaction, RecurringPayment
+from . import ledger
+from .models import Account, Category, CurrencyRate, Transaction, RecurringPayment
 
 
 @admin.register(Account)
@@ -9,6 +10,11 @@ class AccountAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+@admin.register(CurrencyRate)
+class CurrencyRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate', 'updated_at')
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'type', 'icon')
@@ -18,15 +24,29 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('account', 'type', 'amount', 'category', 'date')
+    list_display = ('account', 'type', 'amount', 'balance_after', 'category', 'date')
     list_filter = ('type', 'account', 'category', 'date')
     search_fields = ('description', 'account__name')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('balance_after', 'created_at')
+
+    def save_model(self, request, obj, form, change):
+        # Баланс счета и остатки меняются так же, как через API
+        if change:
+            ledger.update_transaction(obj)
+        else:
+            ledger.post_transaction(obj)
+
+    def delete_model(self, request, obj):
+        ledger.delete_transaction(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            ledger.delete_transaction(obj)
 
 
 @admin.register(RecurringPayment)
 class RecurringPaymentAdmin(admin.ModelAdmin):
-    list_display = ('description', 'account', 'amount', 'frequency', 'is_active')
+    list_display = ('description', 'account', 'amount', 'frequency', 'is_active', 'next_run_at')
     list_filter = ('frequency', 'is_active', 'account')
     search_fields = ('description',)
-    readonly_fields = ('last_executed',)
+    readonly_fields = ('last_executed', 'next_run_at')
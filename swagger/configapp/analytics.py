@@ -0,0 +1,109 @@
+"""
+Реплика основной БД для отчётов.
+
+Тяжёлые агрегаты (статистика, дашборд) читают из копии основной БД, чтобы
+не мешать проводкам. Копию делает refresh() через sqlite3 backup API:
+страницы пишутся во временный файл, который затем атомарно заменяет
+реплику, поэтому читатели видят либо старый снимок, либо новый целиком.
+Время модификации файла реплики - момент снимка.
+
+Чтение идёт в реплику только внутри reporting() и только если она не
+старше ANALYTICS_MAX_STALENESS и пользователь ничего не записывал после
+снимка (иначе он не увидел бы свою же запись). Время записи хранится в
+кеше (user_cache.written_at), поэтому реплика используется только с кешем,
+общим для всех процессов: кеш в памяти процесса не знает о записях,
+обработанных другими воркерами. В остальных случаях - основная БД. Выбор
+БД делает роутер AnalyticsRouter.
+"""
+
+import contextvars
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import sharding, user_cache
+
+ALIAS = 'analytics'
+
+_reporting_alias = contextvars.ContextVar('analytics_alias', default=None)
+
+
+def replica_path():
+    return Path(settings.ANALYTICS_DB_PATH)
+
+
+def snapshot_time():
+    """Момент снимка реплики (unix time) или None, если реплики нет"""
+    try:
+        return os.path.getmtime(replica_path())
+    except OSError:
+        return None
+
+
+def shared_cache():
+    """Общий ли кеш у всех процессов (иначе время записи пользователя известно не везде)"""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def replica_alias(user_id=None):
+    """БД для отчётов пользователя: реплика, если она достаточно свежа, иначе основная"""
+    taken = snapshot_time()
+    # Реплика копирует только default: при шардировании данные пользователей не в ней
+    if ALIAS not in settings.DATABASES or taken is None or sharding.enabled() or not shared_cache():
+        return DEFAULT_DB_ALIAS
+    if time.time() - taken > settings.ANALYTICS_MAX_STALENESS:
+        return DEFAULT_DB_ALIAS
+    written = user_cache.written_at(user_id) if user_id is not None else None
+    if written is not None and written >= taken:
+        return DEFAULT_DB_ALIAS
+    return ALIAS
+
+
+@contextmanager
+def reporting(user_id=None):
+    """Чтения внутри блока идут в реплику (если она подходит); отдаёт выбранный псевдоним"""
+    alias = replica_alias(user_id)
+    token = _reporting_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _reporting_alias.reset(token)
+
+
+def current_alias():
+    """Псевдоним БД, выбранный ближайшим reporting(), или None вне отчёта"""
+    return _reporting_alias.get()
+
+
+def refresh(path=None, pages=-1):
+    """
+    Скопировать основную БД в реплику; возвращает момент снимка.
+    pages - страниц за шаг backup (-1 - все за один шаг).
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != 'sqlite':
+        raise ValueError('Реплика поддерживается только для SQLite')
+    path = Path(path or replica_path())
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.unlink(missing_ok=True)
+
+    source.ensure_connection()
+    taken = time.time()
+    target = sqlite3.connect(temporary)
+    try:
+        source.connection.backup(target, pages=pages)
+        # Реплика открывается только на чтение: без WAL ей не нужны файлы -wal/-shm
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+    os.utime(temporary, (taken, taken))
+    os.replace(temporary, path)
+    return taken
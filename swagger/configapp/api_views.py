@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -5,16 +7,36 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from django.db.models import Sum, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
 from drf_spectacular.utils import extend_schema
 
-from .models import Account, Category, Transaction, RecurringPayment
+from .models import Account, ArchivedTransaction, Category, Transaction, RecurringPayment
 from .serializers import (
     UserSerializer, UserRegisterSerializer, CategorySerializer,
     AccountSerializer, TransactionSerializer, RecurringPaymentSerializer,
     AccountDetailSerializer
 )
+from .export import CSVExportRenderer, NDJSONExportRenderer, STREAMS
+from .bulk import CSVStreamParser, NDJSONStreamParser, TransactionImporter, iter_rows
+from .pagination import KeysetPagination
+from . import analytics, archive, balances, choices, currency, etags, ledger, periods, rollups, search as transaction_search, user_cache
+
+# Сводки в кеше пользователя - общие с асинхронными вариантами (async_views)
+SUMMARY_CACHE = 'accounts-summary'
+STATISTICS_CACHE = 'transactions-statistics'
+
+
+def summary_params(reporting_currency):
+    """Параметры ключа кеша сводки по счетам: месяц, валюта отчёта и курсы"""
+    return '|'.join((
+        rollups.month_start().isoformat(), reporting_currency, currency.rates_token(currency.get_rates()),
+    ))
+
+
+def statistics_params():
+    """Параметры ключа кеша статистики: текущий месяц"""
+    return rollups.month_start().isoformat()
 
 
 class UserRegisterViewSet(viewsets.ModelViewSet):
@@ -103,8 +125,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        """Фильтруем категории по типу если передан параметр"""
-        queryset = Category.objects.all()
+        """Категории пользователя, с фильтром по типу если передан параметр"""
+        queryset = Category.objects.filter(user=self.request.user).order_by('name')
         category_type = self.request.query_params.get('type', None)
         
         if category_type:
@@ -112,6 +134,17 @@ class CategoryViewSet(viewsets.ModelViewSet):
         
         return queryset
 
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """Список категорий из общего с формами кеша (choices)"""
+        categories = choices.categories(request.user.pk, request.query_params.get('type') or None)
+        page = self.paginate_queryset(categories)
+        if page is not None:
+            return self.get_paginated_response(page)
+        return Response(categories)
+
     @extend_schema(description="Получить категории по типу (expense или income)")
     @action(detail=False, methods=['get'])
     def by_type(self, request):
@@ -124,9 +157,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        categories = self.get_queryset().filter(type=category_type)
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        return Response(choices.categories(request.user.pk, category_type))
 
 
 class AccountViewSet(viewsets.ModelViewSet):
@@ -136,11 +167,14 @@ class AccountViewSet(viewsets.ModelViewSet):
     Методы:
     - GET /api/accounts/ - Список счетов
     - POST /api/accounts/ - Создать новый счет
-    - GET /api/accounts/{id}/ - Детали счета с историей транзакций
+    - GET /api/accounts/{id}/ - Детали счета с последними транзакциями
     - PUT /api/accounts/{id}/ - Обновить счет
     - DELETE /api/accounts/{id}/ - Удалить счет
     - GET /api/accounts/summary/ - Общая сводка по всем счетам
-    - GET /api/accounts/{id}/transactions/ - История транзакций счета
+    - GET /api/accounts/{id}/transactions/ - История транзакций счета (курсорная пагинация)
+    - GET /api/accounts/{id}/balance-history/ - Баланс счета на конец каждого дня/недели/месяца
+
+    Список, детали счета и история баланса отдают ETag; при совпадении If-None-Match - 304.
     """
     queryset = Account.objects.all()
     serializer_class = AccountSerializer
@@ -152,41 +186,113 @@ class AccountViewSet(viewsets.ModelViewSet):
             return AccountDetailSerializer
         return AccountSerializer
 
-    @extend_schema(description="Получить общую сводку по всем счетам и финансовым показателям")
+    def get_queryset(self):
+        """Только счета текущего пользователя"""
+        queryset = Account.objects.filter(user=self.request.user).order_by('id')
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(AccountDetailSerializer.prefetch_transactions())
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """Список счетов с ETag (304 без сериализации при совпадении)"""
+        return etags.conditional(
+            request, etags.accounts_etag(request),
+            lambda: super(AccountViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Счет с транзакциями и ETag по его version"""
+        account_id = kwargs[self.lookup_field]
+        etag = etags.accounts_etag(request, account_id) if str(account_id).isdigit() else None
+        return etags.conditional(
+            request, etag,
+            lambda: super(AccountViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    @extend_schema(description=(
+        "Получить общую сводку по всем счетам и финансовым показателям. "
+        "Общий баланс - в валюте ?currency= (UZS, USD, EUR) или в валюте отчёта по умолчанию"
+    ))
     @action(detail=False, methods=['get'])
     def summary(self, request):
-        """Получить сводку по всем счетам"""
+        """Получить сводку по всем счетам (из кеша пользователя)"""
+        reporting_currency = currency.reporting_currency(request)
+        return Response(user_cache.cached(
+            request.user.pk, SUMMARY_CACHE, lambda: self._build_summary(reporting_currency),
+            params=summary_params(reporting_currency),
+        ))
+
+    def _build_summary(self, reporting_currency):
+        request = self.request
         accounts = self.get_queryset()
-        total_balance = accounts.aggregate(total=Sum('balance'))['total'] or 0
+        # Балансы в разных валютах пересчитываются по курсам в самом агрегате
+        total_balance = currency.total_balance(accounts, reporting_currency)
         
-        # Расходы и доходы за текущий месяц
-        today = timezone.now().date()
-        month_start = today.replace(day=1)
-        
-        month_expenses = Transaction.objects.filter(
-            type='expense',
-            date__date__gte=month_start
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        # Расходы и доходы за текущий месяц (из дневной сводки)
+        month_start = rollups.month_start()
+        month_expenses = rollups.period_total(request.user, 'expense', month_start)
+        month_income = rollups.period_total(request.user, 'income', month_start)
 
-        month_income = Transaction.objects.filter(
-            type='income',
-            date__date__gte=month_start
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        return Response({
+        return {
             'total_balance': total_balance,
+            'currency': reporting_currency,
             'accounts_count': accounts.count(),
             'month_expenses': month_expenses,
             'month_income': month_income,
             'accounts': AccountSerializer(accounts, many=True).data
-        })
+        }
+
+    @extend_schema(description=(
+        "Баланс счета на конец каждого шага (step: day, week, month) от from до to "
+        "(YYYY-MM-DD, по умолчанию - последние 30 дней)"
+    ))
+    @action(detail=True, methods=['get'], url_path='balance-history')
+    def balance_history(self, request, pk=None):
+        """История баланса по остаткам balance_after (поиск по индексу на точку)"""
+        params = request.query_params
+        step = params.get('step', 'day')
+        if step not in balances.STEPS:
+            return Response(
+                {'error': f"step must be one of: {', '.join(balances.STEPS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        date_to = periods.parse_day(params.get('to')) or timezone.localdate()
+        date_from = periods.parse_day(params.get('from')) or date_to - timedelta(days=30)
+        if date_from > date_to:
+            return Response({'error': 'from must not be after to'}, status=status.HTTP_400_BAD_REQUEST)
+        days = balances.history_days(date_from, date_to, step)
+        if len(days) > balances.MAX_POINTS:
+            return Response(
+                {'error': f'too many points (max {balances.MAX_POINTS}): use a larger step or a shorter range'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def build_response():
+            account = self.get_object()
+            return Response({
+                'account': account.pk,
+                'currency': account.currency,
+                'step': step,
+                'points': [
+                    {'date': day, 'balance': str(balance)}
+                    for day, balance in balances.balances_on(account.pk, days, account.archived_until)
+                ],
+            })
+        etag = etags.accounts_etag(request, pk) if str(pk).isdigit() else None
+        return etags.conditional(request, etag, build_response)
 
     @extend_schema(description="Получить историю транзакций счета с фильтрацией по типу и периоду")
     @action(detail=True, methods=['get'])
     def transactions(self, request, pk=None):
         """Получить транзакции счета с возможностью фильтрации"""
         account = self.get_object()
-        transactions = account.transactions.all()
+        transactions = archive.with_archive(
+            account.transactions.all(), account.archived_transactions.all(),
+            account.archived_until, request.query_params,
+        )
         
         # Фильтрация по типу
         transaction_type = request.query_params.get('type', None)
@@ -194,20 +300,15 @@ class AccountViewSet(viewsets.ModelViewSet):
             transactions = transactions.filter(type=transaction_type)
         
         # Фильтрация по периоду
-        period = request.query_params.get('period', 'all')
-        today = timezone.now().date()
+        transactions = periods.filter_by_params(transactions, request.query_params)
         
-        if period == 'today':
-            transactions = transactions.filter(date__date=today)
-        elif period == 'week':
-            week_ago = today - timedelta(days=7)
-            transactions = transactions.filter(date__date__gte=week_ago)
-        elif period == 'month':
-            month_start = today.replace(day=1)
-            transactions = transactions.filter(date__date__gte=month_start)
-        
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data)
+        # Курсорная пагинация по (date, id)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(
+            transactions.select_related('account', 'category'), request, view=self
+        )
+        serializer = TransactionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
@@ -221,20 +322,50 @@ class TransactionViewSet(viewsets.ModelViewSet):
     - PUT /api/transactions/{id}/ - Обновить транзакцию
     - DELETE /api/transactions/{id}/ - Удалить транзакцию
     - GET /api/transactions/statistics/ - Статистика по транзакциям
+    - POST /api/transactions/bulk/ - Массовый импорт из CSV или NDJSON
+    - GET /api/transactions/export/?format=csv|ndjson - Потоковый экспорт
+    - GET /api/transactions/search/?q= - Полнотекстовый поиск по описанию
     
     Параметры фильтрации:
     - account_id: ID счета
     - type: expense или income
     - category_id: ID категории
-    - period: today, week, month или all
+    - period: today, week, month, custom или all
+    - from, to: границы периода custom (YYYY-MM-DD, включительно)
+    - cursor: курсорная пагинация по (date, id) вместо номеров страниц
+      (пустое значение - первая страница)
+
+    Список отдает ETag по версиям счетов; при совпадении If-None-Match - 304.
     """
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
 
+    @property
+    def paginator(self):
+        """Курсорный режим включается параметром cursor"""
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)
+            if request is not None and KeysetPagination.cursor_query_param in request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
+
+    def perform_destroy(self, instance):
+        # Удаление меняет баланс счета и остатки после транзакции
+        ledger.delete_transaction(instance)
+
     def get_queryset(self):
         """Фильтруем транзакции по параметрам"""
-        queryset = Transaction.objects.all()
+        queryset = Transaction.objects.filter(account__user=self.request.user).select_related('account', 'category')
+        # Список и экспорт читают и архив, если период запроса заходит в него
+        if self.action in ('list', 'export'):
+            queryset = archive.with_archive(
+                queryset,
+                ArchivedTransaction.objects.filter(account__user=self.request.user).select_related('account', 'category'),
+                archive.boundary(self.request.user.pk), self.request.query_params,
+            )
         
         # Фильтрация по счету
         account_id = self.request.query_params.get('account_id', None)
@@ -252,53 +383,125 @@ class TransactionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category_id=category_id)
         
         # Фильтрация по периоду
-        period = self.request.query_params.get('period', None)
-        if period:
-            today = timezone.now().date()
-            if period == 'today':
-                queryset = queryset.filter(date__date=today)
-            elif period == 'week':
-                week_ago = today - timedelta(days=7)
-                queryset = queryset.filter(date__date__gte=week_ago)
-            elif period == 'month':
-                month_start = today.replace(day=1)
-                queryset = queryset.filter(date__date__gte=month_start)
+        queryset = periods.filter_by_params(queryset, self.request.query_params)
         
         return queryset.order_by('-date')
 
+    def list(self, request, *args, **kwargs):
+        """Список транзакций с ETag по версиям счетов (304 до выборки транзакций)"""
+        account_id = request.query_params.get('account_id')
+        if account_id and not account_id.isdigit():
+            etag = None
+        else:
+            etag = etags.accounts_etag(request, account_id or None)
+        return etags.conditional(
+            request, etag,
+            lambda: super(TransactionViewSet, self).list(request, *args, **kwargs),
+        )
+
     @extend_schema(description="Получить детальную статистику по транзакциям текущего месяца")
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Получить статистику по транзакциям за текущий месяц"""
-        today = timezone.now().date()
-        month_start = today.replace(day=1)
+        """Получить статистику по транзакциям за текущий месяц (из кеша пользователя)"""
+        return Response(user_cache.cached(
+            request.user.pk, STATISTICS_CACHE, self._build_statistics, params=statistics_params(),
+        ))
+
+    def _build_statistics(self):
+        with analytics.reporting(self.request.user.pk):
+            return self._statistics()
+
+    def _statistics(self):
+        request = self.request
+        month_start = rollups.month_start()
         
-        # Расходы по категориям за месяц
-        expenses_by_category = Transaction.objects.filter(
+        # Расходы по категориям за месяц (из дневной сводки)
+        expenses_by_category = rollups.for_user(request.user).filter(
             type='expense',
-            date__date__gte=month_start
+            day__gte=month_start
         ).values('category__name', 'category__icon').annotate(
-            total=Sum('amount')
+            total=Sum('total')
         ).order_by('-total')[:10]
         
         # Общие статистики
-        month_expenses = Transaction.objects.filter(
-            type='expense',
-            date__date__gte=month_start
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
+        month_expenses = rollups.period_total(request.user, 'expense', month_start)
+        month_income = rollups.period_total(request.user, 'income', month_start)
 
-        month_income = Transaction.objects.filter(
-            type='income',
-            date__date__gte=month_start
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        return Response({
+        return {
             'month_expenses': month_expenses,
             'month_income': month_income,
-            'expenses_by_category': expenses_by_category,
+            'expenses_by_category': list(expenses_by_category),
             'balance': month_income - month_expenses
+        }
+
+    @extend_schema(
+        description=(
+            "Массовый импорт транзакций. Тело - CSV с заголовком (text/csv) или "
+            "NDJSON (application/x-ndjson) с полями account, category, type, amount, "
+            "description, date. Ошибочные строки попадают в отчёт и не прерывают импорт."
+        ),
+        request={
+            'text/csv': {'type': 'string', 'format': 'binary'},
+            'application/x-ndjson': {'type': 'string', 'format': 'binary'},
+        },
+    )
+    @action(
+        detail=False, methods=['post'], url_path='bulk',
+        parser_classes=[CSVStreamParser, NDJSONStreamParser],
+    )
+    def bulk(self, request):
+        """Массовый импорт транзакций с потоковым разбором тела"""
+        rows = iter_rows(request.data, request.content_type.split(';')[0].strip())
+        report = TransactionImporter(request.user).run(rows)
+        status_code = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=status_code)
+
+    @extend_schema(description=(
+        "Поиск транзакций по словам описания (каждое слово - префикс), сначала "
+        "самые релевантные. Фильтры - как у списка; limit (до 100) и offset"
+    ))
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Полнотекстовый поиск по описаниям транзакций пользователя"""
+        params = request.query_params
+        q = params.get('q', '')
+        if not transaction_search.terms(q):
+            return Response({'error': 'q must contain at least one word'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(params.get('limit', transaction_search.DEFAULT_LIMIT)), transaction_search.MAX_LIMIT)
+            offset = int(params.get('offset', 0))
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1 or offset < 0:
+            return Response({'error': 'limit must be positive and offset non-negative'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = transaction_search.search(self.get_queryset(), request.user, q)[offset:offset + limit]
+        return Response({
+            'q': q,
+            'limit': limit,
+            'offset': offset,
+            'results': TransactionSerializer(results, many=True).data,
         })
 
+    @extend_schema(
+        description=(
+            "Потоковый экспорт транзакций в CSV или NDJSON (?format=csv|ndjson) "
+            "с теми же фильтрами, что и список"
+        ),
+    )
+    @action(detail=False, methods=['get'], renderer_classes=[CSVExportRenderer, NDJSONExportRenderer])
+    def export(self, request):
+        """Экспорт транзакций потоком, без пагинации"""
+        export_format = request.accepted_renderer.format
+        queryset = self.get_queryset()
+        # Поток читается после выхода из запроса: БД (шард) фиксируем сейчас
+        response = StreamingHttpResponse(
+            STREAMS[export_format](queryset.using(queryset.db)),
+            content_type=request.accepted_renderer.media_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+        return response
+
 
 class RecurringPaymentViewSet(viewsets.ModelViewSet):
     """
@@ -321,9 +524,9 @@ class RecurringPaymentViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        """Фильтруем активные/неактивные платежи"""
+        """Платежи пользователя с фильтром по активности"""
         is_active = self.request.query_params.get('is_active', None)
-        queryset = RecurringPayment.objects.all()
+        queryset = RecurringPayment.objects.filter(account__user=self.request.user).select_related('account', 'category')
         
         if is_active is not None:
             is_active = is_active.lower() == 'true'
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ConfigappConfig(AppConfig):
     name = 'configapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
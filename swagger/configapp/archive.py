@@ -0,0 +1,193 @@
+"""
+Холодный архив старых транзакций.
+
+archive_account() переносит транзакции счета старше cutoff из рабочей
+таблицы в ArchivedTransaction пачками по (date, id): каждая пачка -
+INSERT ... SELECT и DELETE в одной транзакции БД, без построения объектов
+и без сигналов, так что дневная сводка остаётся как есть. Сумма
+перенесённых транзакций прибавляется к opening_balance счета: остатки,
+пересчёт и сверка по рабочей таблице не меняются. Account.archived_until -
+граница архива счета. Транзакции вне остатков (balance_after = NULL,
+созданные в обход ledger) не переносятся: по ним сверка балансов
+показывает расхождение, и архив не должен его прятать.
+
+Список, экспорт и история баланса читают архив, только если запрошенный
+период начинается раньше границы архива пользователя: тогда рабочая
+таблица и архив объединяются через UNION ALL (Combined). Перенесённые
+транзакции только читаются и в полнотекстовый поиск не попадают.
+"""
+
+from django.db import connections
+from django.db.models import Exists, F, Max, OuterRef, Q
+
+from . import ledger, periods, retry, sharding, user_cache
+from .models import Account, ArchivedTransaction, Transaction
+
+CHUNK_SIZE = 5000
+
+
+class Combined:
+    """
+    Транзакции рабочей таблицы и архива как один набор только для чтения.
+    Фильтры применяются к обеим частям, сортировка и срезы - к их UNION ALL.
+    """
+
+    def __init__(self, hot, archived, ordering=()):
+        # Сортировка внутри частей UNION не допускается
+        self.hot = hot.order_by()
+        self.archived = archived.order_by()
+        self.ordering = tuple(ordering)
+        self.model = hot.model
+
+    def _both(self, method, *args, **kwargs):
+        return Combined(
+            getattr(self.hot, method)(*args, **kwargs),
+            getattr(self.archived, method)(*args, **kwargs),
+            self.ordering,
+        )
+
+    def filter(self, *args, **kwargs):
+        return self._both('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._both('exclude', *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._both('select_related', *fields)
+
+    def values_list(self, *fields, **kwargs):
+        return self._both('values_list', *fields, **kwargs)
+
+    def using(self, alias):
+        return self._both('using', alias)
+
+    def order_by(self, *fields):
+        return Combined(self.hot, self.archived, fields)
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    @property
+    def db(self):
+        return self.hot.db
+
+    def union(self):
+        queryset = self.hot.union(self.archived, all=True)
+        return queryset.order_by(*self.ordering) if self.ordering else queryset
+
+    def count(self):
+        return self.union().count()
+
+    def iterator(self, chunk_size=None):
+        return self.union().iterator(chunk_size=chunk_size)
+
+    def __getitem__(self, key):
+        return self.union()[key]
+
+    def __iter__(self):
+        return iter(self.union())
+
+    def __len__(self):
+        return len(self.union())
+
+
+def boundary(user_id):
+    """Самая поздняя граница архива среди счетов пользователя или None"""
+    # Кортеж: None тоже кешируется
+    return user_cache.cached(user_id, 'archive-boundary', lambda: (
+        Account.objects.filter(user_id=user_id).aggregate(until=Max('archived_until'))['until'],
+    ))[0]
+
+
+def reaches(until, params):
+    """Начинается ли период из параметров запроса раньше границы архива until"""
+    if until is None:
+        return False
+    start, _ = periods.period_range(params.get('period', 'all'), params.get('from'), params.get('to'))
+    return start is None or start < until
+
+
+def with_archive(hot, archived, until, params):
+    """hot, а если период запроса заходит в архив - hot вместе с archived"""
+    if reaches(until, params):
+        return Combined(hot, archived)
+    return hot
+
+
+def _columns():
+    # ArchivedTransaction повторяет поля Transaction в том же порядке
+    return [field.attname for field in Transaction._meta.concrete_fields]
+
+
+def _move_sql(chunk):
+    """INSERT ... SELECT в архив и DELETE из рабочей таблицы для пачки"""
+    connection = connections[chunk.db]
+    quote = connection.ops.quote_name
+    select, params = chunk.order_by().values_list(*_columns()).query.sql_with_params()
+    ids, id_params = chunk.order_by().values('pk').query.sql_with_params()
+    columns = ', '.join(quote(ArchivedTransaction._meta.get_field(name).column) for name in _columns())
+    return [
+        (f'INSERT INTO {quote(ArchivedTransaction._meta.db_table)} ({columns}) {select}', params),
+        (
+            f'DELETE FROM {quote(Transaction._meta.db_table)} '
+            f'WHERE {quote(Transaction._meta.pk.column)} IN ({ids})',
+            id_params,
+        ),
+    ]
+
+
+def move(chunk):
+    """Перенести транзакции queryset chunk в архив как есть; возвращает число строк"""
+    (insert, insert_params), (delete, delete_params) = _move_sql(chunk)
+    with connections[chunk.db].cursor() as cursor:
+        cursor.execute(insert, insert_params)
+        moved = cursor.rowcount
+        cursor.execute(delete, delete_params)
+    return moved
+
+
+@retry.on_lock
+def archive_chunk(account_id, cutoff, chunk_size=CHUNK_SIZE):
+    """Перенести в архив следующую пачку транзакций счета старше cutoff; возвращает число строк"""
+    older = Transaction.objects.filter(account_id=account_id, date__lt=cutoff, balance_after__isnull=False)
+    with sharding.atomic():
+        # Последняя транзакция пачки в порядке (date, id) задаёт её границу
+        last = older.order_by('date', 'pk').values_list('date', 'pk')[chunk_size - 1:chunk_size].first()
+        chunk = older if last is None else older.filter(Q(date__lt=last[0]) | Q(date=last[0], pk__lte=last[1]))
+        delta = chunk.aggregate(delta=ledger.delta_sum())['delta']
+        moved = move(chunk)
+        if not moved:
+            return 0
+        until = Account.objects.values_list('archived_until', flat=True).get(pk=account_id)
+        Account.objects.filter(pk=account_id).update(
+            opening_balance=F('opening_balance') + delta,
+            archived_until=cutoff if until is None else max(until, cutoff),
+            version=F('version') + 1,
+        )
+    return moved
+
+
+def archive_account(account_id, cutoff, chunk_size=CHUNK_SIZE):
+    """Перенести в архив все транзакции счета старше cutoff; возвращает число строк"""
+    user_id = Account.objects.values_list('user_id', flat=True).get(pk=account_id)
+    total = 0
+    while True:
+        moved = archive_chunk(account_id, cutoff, chunk_size)
+        if not moved:
+            return total
+        total += moved
+        # Граница архива в кеше пользователя должна обновиться уже после первой пачки
+        user_cache.bump(user_id)
+
+
+def archive(cutoff, user_ids=None, chunk_size=CHUNK_SIZE):
+    """Перенести в архив транзакции старше cutoff во всех шардах; отдаёт (account_id, строк) по счетам"""
+    for _ in sharding.each_shard():
+        accounts = Account.objects.filter(
+            Exists(Transaction.objects.filter(account=OuterRef('pk'), date__lt=cutoff, balance_after__isnull=False))
+        ).order_by('pk')
+        if user_ids:
+            accounts = accounts.filter(user_id__in=user_ids)
+        for account_id in list(accounts.values_list('pk', flat=True)):
+            yield account_id, archive_account(account_id, cutoff, chunk_size)
@@ -0,0 +1,151 @@
+"""
+Асинхронные (ASGI) варианты дашборда и сводных API.
+
+Независимые запросы каждого представления выполняются одновременно.
+Методы async ORM (aaggregate, async for) в Django по-прежнему выполняют
+SQL через один общий поток (thread_sensitive), поэтому для настоящей
+параллельности каждый запрос запускается в собственном потоке со своим
+соединением с БД. Сводные API читают и пишут тот же кеш пользователя
+(user_cache), что и их синхронные варианты.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.http import JsonResponse
+from django.shortcuts import render
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import currency, rollups, sharding, snapshots, user_cache
+from .api_views import STATISTICS_CACHE, SUMMARY_CACHE, statistics_params, summary_params
+from .models import Account, Transaction
+from .serializers import AccountSerializer
+
+
+def _in_own_thread(query):
+    """Запрос в отдельном потоке; соединение потока закрывается по CONN_MAX_AGE"""
+    def run():
+        try:
+            return query()
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def gather_queries(*queries):
+    """Выполнить независимые запросы одновременно"""
+    return await asyncio.gather(*(_in_own_thread(query)() for query in queries))
+
+
+async def _api_user(request):
+    """Пользователь по токену (как в DRF) или по сессии"""
+    try:
+        authenticated = await sync_to_async(TokenAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if authenticated is not None:
+        return authenticated[0]
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+@login_required(login_url='login')
+async def dashboard(request):
+    """Главная страница: счета, последние операции и итоги запрашиваются параллельно"""
+    user = await request.auser()
+    reporting_currency = await sync_to_async(currency.reporting_currency)(request)
+    key = await sync_to_async(snapshots.snapshot_key)(user.pk, reporting_currency)
+    context = await cache.aget(key)
+    if context is None:
+        with sharding.for_user(user.pk):
+            accounts, total_balance, recent_transactions, totals = await gather_queries(
+                lambda: list(Account.objects.filter(user=user).order_by('id')),
+                lambda: currency.total_balance(Account.objects.filter(user=user), reporting_currency),
+                lambda: list(
+                    Transaction.objects.filter(account__user=user)
+                    .select_related('account', 'category')
+                    .order_by('-date')[:snapshots.RECENT_TRANSACTIONS]
+                ),
+                lambda: snapshots.period_totals(user),
+            )
+        context = {
+            'accounts': accounts,
+            'first_account': accounts[0] if accounts else None,
+            'total_balance': total_balance,
+            'reporting_currency': reporting_currency,
+            'recent_transactions': recent_transactions,
+            **totals,
+        }
+        await cache.aset(key, context, snapshots.SNAPSHOT_TIMEOUT)
+    # Шаблон обращается к ленивому request.user и сообщениям - рендерим в потоке
+    return await sync_to_async(render)(request, 'configapp/dashboard.html', context)
+
+
+async def accounts_summary(request):
+    """Асинхронный вариант GET /api/accounts/summary/ (тот же кеш; JSON кодируется как в DRF)"""
+    user = await _api_user(request)
+    if user is None:
+        return _unauthorized()
+    month_start = rollups.month_start()
+    reporting_currency = await sync_to_async(currency.reporting_currency)(request)
+
+    async def build():
+        with sharding.for_user(user.pk):
+            accounts, total_balance, month_expenses, month_income = await gather_queries(
+                lambda: list(Account.objects.filter(user=user).order_by('id')),
+                lambda: currency.total_balance(Account.objects.filter(user=user), reporting_currency),
+                lambda: rollups.period_total(user, 'expense', month_start),
+                lambda: rollups.period_total(user, 'income', month_start),
+            )
+        return {
+            'total_balance': total_balance,
+            'currency': reporting_currency,
+            'accounts_count': len(accounts),
+            'month_expenses': month_expenses,
+            'month_income': month_income,
+            'accounts': AccountSerializer(accounts, many=True).data,
+        }
+
+    params = await sync_to_async(summary_params)(reporting_currency)
+    data = await user_cache.acached(user.pk, SUMMARY_CACHE, build, params=params)
+    return JsonResponse(data, encoder=JSONEncoder)
+
+
+async def transactions_statistics(request):
+    """Асинхронный вариант GET /api/transactions/statistics/ (тот же кеш; JSON кодируется как в DRF)"""
+    user = await _api_user(request)
+    if user is None:
+        return _unauthorized()
+    month_start = rollups.month_start()
+
+    async def build():
+        with sharding.for_user(user.pk):
+            expenses_by_category, month_expenses, month_income = await gather_queries(
+                lambda: list(
+                    rollups.for_user(user).filter(type='expense', day__gte=month_start)
+                    .values('category__name', 'category__icon')
+                    .annotate(total=Sum('total'))
+                    .order_by('-total')[:10]
+                ),
+                lambda: rollups.period_total(user, 'expense', month_start),
+                lambda: rollups.period_total(user, 'income', month_start),
+            )
+        return {
+            'month_expenses': month_expenses,
+            'month_income': month_income,
+            'expenses_by_category': expenses_by_category,
+            'balance': month_income - month_expenses,
+        }
+
+    data = await user_cache.acached(user.pk, STATISTICS_CACHE, build, params=statistics_params())
+    return JsonResponse(data, encoder=JSONEncoder)
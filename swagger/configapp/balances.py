@@ -0,0 +1,192 @@
+"""
+Остаток счета после каждой транзакции и баланс на дату.
+
+Транзакции счета упорядочены по (date, id), balance_after - баланс после
+транзакции: начальный баланс счета (opening_balance) плюс изменения всех
+транзакций до неё включительно. Новая транзакция берёт остаток предыдущей
+одним поиском по индексу (account, date), а транзакциям позже неё (вставка
+задним числом) остаток сдвигается одним UPDATE суффикса. Изменение и
+удаление транзакции пересчитывают остатки её счетов с более ранней из
+прежней и новой дат (ledger). Баланс на момент -
+balance_after последней транзакции до него, тоже один поиск по индексу.
+
+Транзакции, созданные в обход ledger (balance_after = NULL), баланс счета
+не меняли и в остатках не участвуют.
+
+Транзакции из архива (archive) сохраняют свой balance_after, а
+opening_balance после архивации - баланс на границе архива. Баланс на
+момент раньше границы ищется и в архиве.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, connections, router
+from django.db.models import F
+
+from . import ledger, periods, schedules
+from .models import Account, ArchivedTransaction, Transaction
+
+BATCH_SIZE = 1000
+CENT = Decimal('0.01')
+STEPS = ('day', 'week', 'month')
+# Не больше стольких точек в одном ответе balance-history
+MAX_POINTS = 400
+
+
+def posted(account_id):
+    """Транзакции счета, участвующие в остатках"""
+    return Transaction.objects.filter(account_id=account_id, balance_after__isnull=False)
+
+
+def balance_before(account_id, moment, inclusive=False):
+    """Баланс счета перед моментом moment (inclusive - с транзакциями ровно в moment)"""
+    lookup = 'date__lte' if inclusive else 'date__lt'
+    balance = (
+        posted(account_id).filter(**{lookup: moment})
+        .order_by('-date', '-pk').values_list('balance_after', flat=True).first()
+    )
+    if balance is None:
+        balance = Account.objects.values_list('opening_balance', flat=True).get(pk=account_id)
+    return balance
+
+
+def place(txn, delta):
+    """
+    Остаток для новой, ещё не сохранённой транзакции. Новая строка получит
+    наибольший id, поэтому все транзакции с той же датой идут раньше неё.
+    """
+    txn.balance_after = balance_before(txn.account_id, txn.date, inclusive=True) + delta
+
+
+def shift_later(txn, delta):
+    """Сдвинуть остатки транзакций после txn (вставка задним числом); возвращает число строк"""
+    if not delta:
+        return 0
+    return (
+        posted(txn.account_id).filter(date__gte=txn.date)
+        .exclude(date=txn.date, pk__lte=txn.pk)
+        .update(balance_after=F('balance_after') + delta)
+    )
+
+
+def recalculate(account_id, start=None, batch_size=BATCH_SIZE):
+    """Пересчитать остатки транзакций счета с момента start (None - все); возвращает изменённых"""
+    transactions = posted(account_id).order_by('date', 'pk').only('type', 'amount', 'balance_after')
+    if start is None:
+        balance = Account.objects.values_list('opening_balance', flat=True).get(pk=account_id)
+    else:
+        balance = balance_before(account_id, start)
+        transactions = transactions.filter(date__gte=start)
+
+    changed = []
+    updated = 0
+    for txn in transactions.iterator(chunk_size=batch_size):
+        balance += ledger.balance_delta(txn.type, txn.amount)
+        if txn.balance_after != balance:
+            txn.balance_after = balance
+            changed.append(txn)
+        if len(changed) >= batch_size:
+            updated += Transaction.objects.bulk_update(changed, ['balance_after'])
+            changed = []
+    if changed:
+        updated += Transaction.objects.bulk_update(changed, ['balance_after'])
+    return updated
+
+
+def rebuild(account_id):
+    """Включить в остатки все транзакции счета (в том числе созданные в обход ledger) и пересчитать их"""
+    Transaction.objects.filter(account_id=account_id, balance_after__isnull=True).update(balance_after=0)
+    return recalculate(account_id)
+
+
+def recalculate_from(starts):
+    """Пересчитать остатки по {account_id: самая ранняя изменённая дата}"""
+    return sum(recalculate(account_id, start) for account_id, start in starts.items())
+
+
+def history_days(date_from, date_to, step):
+    """Дни точек графика: от date_from с шагом step, последняя точка - date_to"""
+    days = []
+    day = date_from
+    index = 0
+    while day < date_to:
+        days.append(day)
+        index += 1
+        if step == 'month':
+            day = schedules.add_months(date_from, index)
+        else:
+            day = date_from + timedelta(days=index * (7 if step == 'week' else 1))
+    days.append(date_to)
+    return days
+
+
+def _point_sql(model=Transaction):
+    """Скалярный подзапрос: остаток последней транзакции счета до момента (account_id, момент)"""
+    quote = connection.ops.quote_name
+    field = model._meta.get_field
+
+    def column(name):
+        return quote(field(name).column)
+
+    return (
+        f'(SELECT {column("balance_after")} FROM {quote(model._meta.db_table)}'
+        f' WHERE {column("account")} = %s AND {column("balance_after")} IS NOT NULL AND {column("date")} < %s'
+        f' ORDER BY {column("date")} DESC, {column("id")} DESC LIMIT 1)'
+    )
+
+
+def archived_opening(account_id):
+    """Баланс счета до первой транзакции архива (None - архив счета пуст)"""
+    first = (
+        ArchivedTransaction.objects.filter(account_id=account_id, balance_after__isnull=False)
+        .order_by('date', 'pk').values_list('balance_after', 'type', 'amount').first()
+    )
+    if first is None:
+        return None
+    balance_after, type, amount = first
+    return balance_after - ledger.balance_delta(type, amount)
+
+
+def balances_on(account_id, days, archived_until=None):
+    """
+    Баланс на конец каждого дня из days одним SQL-запросом: по скалярному
+    подзапросу на точку, каждый - поиск последней транзакции по индексу
+    (account, date). SQL собирается без компилятора ORM: сотни подзапросов
+    через Subquery компилировались бы дольше, чем выполняются.
+
+    archived_until - граница архива счета: точки раньше неё ищутся и в
+    архиве (COALESCE вычисляет второй подзапрос, только если первый пуст).
+    """
+    quote = connection.ops.quote_name
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    moments = [periods.day_start(day + timedelta(days=1)) for day in days]
+    reaches = archived_until is not None and moments[0] <= archived_until
+    point = _point_sql()
+    if reaches:
+        point = f'COALESCE({point}, {_point_sql(ArchivedTransaction)})'
+    sql = (
+        f'SELECT {quote(Account._meta.get_field("opening_balance").column)}, '
+        + ', '.join([point] * len(days))
+        + f' FROM {quote(Account._meta.db_table)} WHERE {quote(Account._meta.pk.column)} = %s'
+    )
+    params = []
+    for moment in moments:
+        params += [account_id, adapt_datetime(moment)] * (2 if reaches else 1)
+    params.append(account_id)
+    with connections[router.db_for_read(Account)].cursor() as cursor:
+        cursor.execute(sql, params)
+        opening, *values = cursor.fetchone()
+    if reaches and None in values:
+        # Точки раньше всей истории: баланс до первой транзакции архива
+        if (archived := archived_opening(account_id)) is not None:
+            opening = archived
+    return [
+        (day, _decimal(opening if value is None else value))
+        for day, value in zip(days, values)
+    ]
+
+
+def _decimal(value):
+    # SQLite возвращает числа, PostgreSQL - Decimal
+    return Decimal(str(value)).quantize(CENT)
@@ -0,0 +1,161 @@
+"""
+Массовый импорт транзакций из CSV или NDJSON.
+
+Тело запроса читается потоком построчно, строки проверяются пачками,
+вставляются через bulk_create, а баланс каждого счета меняется одним
+агрегированным F()-обновлением в конце импорта. Остатки balance_after
+пересчитываются один раз на счет - с самой ранней импортированной даты.
+Ошибки отдельных строк
+собираются в отчёт и не прерывают импорт.
+"""
+
+import codecs
+import csv
+import json
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import BaseParser
+
+from . import balances, ledger, rollups, sharding, user_cache
+from .models import Account, Category, Transaction
+from .serializers import TransactionImportRowSerializer
+
+CHUNK_SIZE = 1000
+
+
+class StreamParser(BaseParser):
+    """Не разбирает тело, а отдаёт поток как есть - строки читает импорт"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
+
+
+class CSVStreamParser(StreamParser):
+    media_type = 'text/csv'
+
+
+class NDJSONStreamParser(StreamParser):
+    media_type = 'application/x-ndjson'
+
+
+def iter_rows(stream, media_type):
+    """Построчно читает тело запроса и отдаёт (номер строки, словарь полей)"""
+    if stream is None:
+        return
+    lines = codecs.iterdecode(stream, 'utf-8')
+    if media_type == CSVStreamParser.media_type:
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            yield number, row
+        return
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class TransactionImporter:
+    """Импорт транзакций пользователя"""
+
+    def __init__(self, user, chunk_size=CHUNK_SIZE):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.account_ids = set(Account.objects.filter(user=user).values_list('id', flat=True))
+        self.category_ids = set(Category.objects.filter(user=user).values_list('id', flat=True))
+        self.created = 0
+        self.errors = []
+        self.deltas = defaultdict(Decimal)
+        self.starts = {}
+        self.rollup_deltas = None
+
+    def validate(self, number, row):
+        """Проверить строку; возвращает Transaction или None (ошибка записана в отчёт)"""
+        if not isinstance(row, dict):
+            self.errors.append({'row': number, 'errors': {'non_field_errors': ['Malformed row.']}})
+            return None
+        # Пустые ячейки CSV считаем отсутствующими полями
+        row = {key: value for key, value in row.items() if key and value not in ('', None)}
+        serializer = TransactionImportRowSerializer(data=row)
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as exc:
+            self.errors.append({'row': number, 'errors': exc.detail})
+            return None
+
+        errors = {}
+        if data['account'] not in self.account_ids:
+            errors['account'] = ['Invalid account.']
+        if data.get('category') is not None and data['category'] not in self.category_ids:
+            errors['category'] = ['Invalid category.']
+        if errors:
+            self.errors.append({'row': number, 'errors': errors})
+            return None
+
+        return Transaction(
+            account_id=data['account'],
+            category_id=data.get('category'),
+            type=data['type'],
+            amount=data['amount'],
+            description=data.get('description', ''),
+            date=data.get('date') or timezone.now(),
+        )
+
+    def import_chunk(self, chunk):
+        transactions = [
+            txn for txn in (self.validate(number, row) for number, row in chunk)
+            if txn is not None
+        ]
+        ledger.insert_transactions(transactions, self.starts)
+        for txn in transactions:
+            self.deltas[txn.account_id] += ledger.balance_delta(txn.type, txn.amount)
+        self.rollup_deltas = rollups.group_rows(
+            (
+                {
+                    'user_id': self.user.pk,
+                    'account_id': txn.account_id,
+                    'category_id': txn.category_id,
+                    'type': txn.type,
+                    'date': txn.date,
+                    'amount': txn.amount,
+                }
+                for txn in transactions
+            ),
+            deltas=self.rollup_deltas,
+        )
+        self.created += len(transactions)
+
+    def run(self, rows):
+        with sharding.for_user(self.user.pk) as alias, transaction.atomic(using=alias):
+            for chunk in _chunks(rows, self.chunk_size):
+                self.import_chunk(chunk)
+            # Один агрегированный сдвиг баланса на счет
+            for account_id, delta in self.deltas.items():
+                ledger.apply_balance_delta(account_id, delta)
+            balances.recalculate_from(self.starts)
+            if self.rollup_deltas:
+                rollups.apply_grouped(self.rollup_deltas)
+        if self.created:
+            user_cache.bump(self.user.pk)
+        return {
+            'created': self.created,
+            'failed': len(self.errors),
+            'errors': self.errors,
+        }
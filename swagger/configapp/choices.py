@@ -0,0 +1,59 @@
+"""
+Категории и счета пользователя для форм и списка категорий API.
+
+Строки кешируются в user_cache в отдельном пространстве версий 'choices':
+его увеличивают только записи счетов и категорий, а не проводки, которые
+меняют балансы и версию данных 'data' постоянно. В кеше лежат значения
+полей без переводов, подписи (тип категории) строятся при чтении на языке
+запроса. С прогретым кешем форма отрисовывается без запросов к БД.
+"""
+
+from . import user_cache
+from .models import Account, Category
+
+NAMESPACE = 'choices'
+CATEGORY_FIELDS = ('id', 'name', 'type', 'icon', 'color')
+ACCOUNT_FIELDS = ('id', 'name', 'currency')
+
+
+def bump(user_id):
+    """Сбросить закешированные списки пользователя"""
+    user_cache.bump(user_id, NAMESPACE)
+
+
+def categories(user_id, type=None):
+    """Категории пользователя по названию (поля CategorySerializer); type - фильтр по типу"""
+    rows = user_cache.cached(
+        user_id, 'categories',
+        lambda: list(Category.objects.filter(user_id=user_id).order_by('name', 'pk').values(*CATEGORY_FIELDS)),
+        namespace=NAMESPACE,
+    )
+    type_display = dict(Category.TYPE_CHOICES)
+    return [
+        {
+            'id': row['id'], 'name': row['name'], 'type': row['type'],
+            'type_display': str(type_display.get(row['type'], row['type'])),
+            'icon': row['icon'], 'color': row['color'],
+        }
+        for row in rows
+        if type is None or row['type'] == type
+    ]
+
+
+def accounts(user_id):
+    """Счета пользователя по названию"""
+    return user_cache.cached(
+        user_id, 'accounts',
+        lambda: list(Account.objects.filter(user_id=user_id).order_by('name', 'pk').values(*ACCOUNT_FIELDS)),
+        namespace=NAMESPACE,
+    )
+
+
+def category_choices(user_id, type=None):
+    """Варианты (id, подпись) для поля категории - подпись как у str(Category)"""
+    return [(row['id'], f"{row['name']} ({row['type_display']})") for row in categories(user_id, type)]
+
+
+def account_choices(user_id):
+    """Варианты (id, подпись) для поля счета - подпись как у str(Account)"""
+    return [(row['id'], f"{row['name']} ({row['currency']})") for row in accounts(user_id)]
@@ -0,0 +1,139 @@
+"""
+Курсы валют и пересчёт балансов в валюту отчёта.
+
+Курс хранится в таблице CurrencyRate как стоимость единицы валюты в базовой
+валюте (settings.BASE_CURRENCY) и загружается из локального файла командой
+load_currency_rates. В памяти процесса курсы кешируются на
+CURRENCY_RATES_TTL секунд. Итог по счетам считается в БД одним агрегатом
+Sum(balance * курс) с Case по валюте счета - счета в Python не загружаются.
+Если счета уже загружены (снимок дашборда), итог считается по ним в Python
+с теми же коэффициентами (loaded_total).
+"""
+
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+
+from .models import Account, CurrencyRate
+
+SESSION_KEY = 'reporting_currency'
+CENT = Decimal('0.01')
+# Точность коэффициента пересчёта между двумя валютами
+FACTOR_PRECISION = Decimal('1e-10')
+
+_lock = threading.Lock()
+_rates = {'value': None, 'expires': 0.0}
+
+
+def currencies():
+    return [code for code, _ in Account.CURRENCY_CHOICES]
+
+
+def get_rates():
+    """{валюта: курс к базовой}; кешируется в памяти процесса"""
+    now = time.monotonic()
+    with _lock:
+        if _rates['value'] is not None and now < _rates['expires']:
+            return _rates['value']
+    rates = dict(CurrencyRate.objects.values_list('currency', 'rate'))
+    rates[settings.BASE_CURRENCY] = Decimal(1)
+    with _lock:
+        _rates['value'] = rates
+        _rates['expires'] = now + settings.CURRENCY_RATES_TTL
+    return rates
+
+
+def clear_rates():
+    """Сбросить кеш курсов этого процесса"""
+    with _lock:
+        _rates['value'] = None
+
+
+def rates_token(rates):
+    """Строка, меняющаяся вместе с курсами (часть ключа кеша итогов)"""
+    return ','.join(f'{code}={rate.normalize()}' for code, rate in sorted(rates.items()))
+
+
+def reporting_currency(request):
+    """Валюта отчёта: параметр ?currency=, затем выбор в сессии, затем по умолчанию"""
+    session = getattr(request, 'session', None)
+    for value in (request.GET.get('currency'), session and session.get(SESSION_KEY)):
+        if value and value.upper() in currencies():
+            return value.upper()
+    return settings.REPORTING_CURRENCY
+
+
+def factor(rates, code, target):
+    """Коэффициент пересчёта из валюты code в target"""
+    return (rates[code] / rates[target]).quantize(FACTOR_PRECISION)
+
+
+def converted_sum(rates, target, field='balance'):
+    """Sum(field * курс) в валюте target по валюте счета"""
+    return Sum(
+        Case(
+            *[
+                When(currency=code, then=F(field) * Value(factor(rates, code, target)))
+                for code in sorted(rates)
+            ],
+            default=None,
+        ),
+        output_field=DecimalField(max_digits=20, decimal_places=2),
+    )
+
+
+def total_balance(accounts, target):
+    """
+    Сумма балансов счетов в валюте target одним запросом.
+    None - если для target или валюты какого-то счета нет курса.
+    """
+    rates = get_rates()
+    if target not in rates:
+        return None
+    aggregates = {'total': converted_sum(rates, target)}
+    missing = [code for code in currencies() if code not in rates]
+    if missing:
+        # Счета в валютах без курса делают итог неизвестным
+        aggregates['unconverted'] = Count('pk', filter=Q(currency__in=missing))
+    result = accounts.aggregate(**aggregates)
+    if result.get('unconverted'):
+        return None
+    return (result['total'] or Decimal(0)).quantize(CENT)
+
+
+def loaded_total(accounts, target):
+    """
+    Итог total_balance по уже загруженным счетам - без запроса к БД.
+    None - если для target или валюты какого-то счета нет курса.
+    """
+    rates = get_rates()
+    if target not in rates or any(account.currency not in rates for account in accounts):
+        return None
+    total = sum((account.balance * factor(rates, account.currency, target) for account in accounts), Decimal(0))
+    return total.quantize(CENT)
+
+
+def load_rates(path):
+    """
+    Загрузить курсы из JSON-файла {"base": "UZS", "rates": {"USD": "12650"}}.
+    Возвращает число записанных курсов.
+    """
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    if data.get('base') != settings.BASE_CURRENCY:
+        raise ValueError(f"Базовая валюта файла {data.get('base')!r}, ожидается {settings.BASE_CURRENCY!r}")
+    rates = []
+    for code, rate in data.get('rates', {}).items():
+        rate = Decimal(str(rate))
+        if code not in currencies() or rate <= 0:
+            raise ValueError(f'Некорректный курс {code}: {rate}')
+        rates.append(CurrencyRate(currency=code, rate=rate))
+    CurrencyRate.objects.bulk_create(
+        rates, update_conflicts=True, unique_fields=['currency'], update_fields=['rate', 'updated_at'],
+    )
+    clear_rates()
+    return len(rates)
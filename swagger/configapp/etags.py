@@ -0,0 +1,70 @@
+"""
+ETag и условные GET-запросы для счетов и транзакций.
+
+Каждый счет хранит счетчик изменений version: его увеличивают проводки,
+изменения транзакций и категорий, сохранение самого счета. ETag ответа
+строится из версий счетов и параметров запроса, поэтому If-None-Match
+проверяется одним лёгким запросом - до сериализации и до выборки
+транзакций.
+"""
+
+import hashlib
+
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Account
+
+
+def make_etag(*parts):
+    """Сильный ETag из произвольных частей"""
+    raw = '|'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode('utf-8'), usedforsecurity=False).hexdigest())
+
+
+def account_versions(user, account_id=None):
+    """Пары (id, version) счетов пользователя"""
+    accounts = Account.objects.filter(user=user)
+    if account_id is not None:
+        accounts = accounts.filter(pk=account_id)
+    return list(accounts.order_by('pk').values_list('pk', 'version'))
+
+
+def accounts_etag(request, account_id=None):
+    """ETag ответа по счетам пользователя; None - счет не найден"""
+    versions = account_versions(request.user, account_id)
+    if account_id is not None and not versions:
+        return None
+    # Представление зависит от формата и языка, а относительные периоды
+    # (today, week, month) - от текущей даты
+    return make_etag(
+        request.path, versions, request.query_params.urlencode(),
+        getattr(request, 'accepted_media_type', ''), getattr(request, 'LANGUAGE_CODE', ''),
+        timezone.localdate(),
+    )
+
+
+def not_modified(request, etag):
+    """Ответ 304, если клиент прислал совпадающий If-None-Match, иначе None"""
+    if etag is None:
+        return None
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    etags = parse_etags(header)
+    if etag in etags or '*' in etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+def conditional(request, etag, build_response):
+    """304 по If-None-Match либо ответ build_response() с заголовком ETag"""
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    response = build_response()
+    if etag is not None and response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+    return response
@@ -0,0 +1,85 @@
+"""
+Потоковый экспорт транзакций в CSV и NDJSON.
+
+Строки читаются через values_list(...).iterator(chunk_size=...) и сразу
+отдаются клиенту через StreamingHttpResponse, поэтому память не зависит
+от объёма истории.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('date', 'date'),
+    ('account', 'account_id'),
+    ('account_name', 'account__name'),
+    ('category', 'category_id'),
+    ('category_name', 'category__name'),
+    ('type', 'type'),
+    ('amount', 'amount'),
+    ('balance_after', 'balance_after'),
+    ('description', 'description'),
+)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Рендерер формата экспорта.
+
+    Сами данные отдаются потоком из view; рендерер нужен для выбора
+    формата (?format=csv|ndjson) и для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=DjangoJSONEncoder).encode(self.charset)
+
+
+class CSVExportRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONExportRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Кортежи значений транзакций без создания объектов модели"""
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def stream_csv(queryset, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in export_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def stream_ndjson(queryset, chunk_size=CHUNK_SIZE):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in export_rows(queryset, chunk_size):
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+STREAMS = {
+    CSVExportRenderer.format: stream_csv,
+    NDJSONExportRenderer.format: stream_ndjson,
+}
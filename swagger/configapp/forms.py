@@ -1,5 +1,14 @@
 from django import forms
 from .models import Transaction, RecurringPayment, Account, Category
+from . import choices
+
+
+def use_cached_choices(field, queryset, field_choices):
+    """Проверка значения - по queryset, варианты для отрисовки - из кеша (без запроса)"""
+    field.queryset = queryset
+    if field.empty_label is not None:
+        field_choices = [('', field.empty_label), *field_choices]
+    field.choices = field_choices
 
 
 class AccountForm(forms.ModelForm):
@@ -55,21 +64,21 @@ class TransactionForm(forms.ModelForm):
             }),
         }
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, user, **kwargs):
         super().__init__(*args, **kwargs)
-        # Изначально показываем все категории
-        self.fields['category'].queryset = Category.objects.all()
-        
-        # Если уже выбран тип транзакции, фильтруем категории
+        # Категории пользователя; если уже выбран тип транзакции - только этого типа
+        transaction_type = None
         if 'type' in self.data:
-            try:
-                transaction_type = self.data.get('type')
-                if transaction_type:
-                    self.fields['category'].queryset = Category.objects.filter(type=transaction_type)
-            except (ValueError, TypeError):
-                pass
+            transaction_type = self.data.get('type') or None
         elif self.instance.pk and self.instance.type:
-            self.fields['category'].queryset = Category.objects.filter(type=self.instance.type)
+            transaction_type = self.instance.type
+
+        categories = Category.objects.filter(user=user)
+        if transaction_type:
+            categories = categories.filter(type=transaction_type)
+        use_cached_choices(
+            self.fields['category'], categories, choices.category_choices(user.pk, transaction_type),
+        )
 
 
 class RecurringPaymentForm(forms.ModelForm):
@@ -105,3 +114,13 @@ class RecurringPaymentForm(forms.ModelForm):
             }),
             'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Только счета и категории пользователя
+        use_cached_choices(
+            self.fields['account'], Account.objects.filter(user=user), choices.account_choices(user.pk),
+        )
+        use_cached_choices(
+            self.fields['category'], Category.objects.filter(user=user), choices.category_choices(user.pk),
+        )
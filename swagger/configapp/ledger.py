@@ -0,0 +1,151 @@
+"""
+Проводка транзакций и изменение баланса счетов.
+
+Вставка транзакции и изменение баланса выполняются в одной транзакции БД,
+а баланс меняется выражением F(), которое пишет только колонки balance и
+version. Параллельные проводки по одному счету не теряют обновлений.
+Изменение и удаление транзакции так же в одной транзакции БД переносят
+разницу на баланс счета и пересчитывают остатки после неё. Остаток после
+транзакции (balance_after) ведёт модуль balances.
+"""
+
+from django.db.models import Case, DecimalField, F, Sum, When
+
+from . import balances, retry, sharding
+from .models import Account, Transaction
+
+# Поля, которые нужны, чтобы откатить прежнюю версию транзакции
+STORED_FIELDS = ('account_id', 'category_id', 'type', 'amount', 'date', 'balance_after')
+
+BALANCE_SIGNS = {
+    'income': 1,
+    'expense': -1,
+}
+
+
+def balance_delta(type, amount):
+    """Изменение баланса от транзакции (переводы баланс не меняют)"""
+    return BALANCE_SIGNS.get(type, 0) * amount
+
+
+def delta_sum(prefix=''):
+    """Сумма изменений баланса от транзакций в SQL (prefix - путь к транзакциям, например 'transactions__')"""
+    return Sum(
+        Case(
+            *[
+                When(**{f'{prefix}type': type}, then=F(f'{prefix}amount') * sign)
+                for type, sign in BALANCE_SIGNS.items()
+            ],
+            default=0,
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+        default=0,
+    )
+
+
+def apply_balance_delta(account_id, delta):
+    """Атомарно прибавить delta к балансу счета и увеличить его version"""
+    Account.objects.filter(pk=account_id).update(
+        balance=F('balance') + delta,
+        version=F('version') + 1,
+    )
+
+
+def touch_accounts(account_ids):
+    """Увеличить version счетов без изменения баланса"""
+    Account.objects.filter(pk__in=account_ids).update(version=F('version') + 1)
+
+
+def post_transaction(txn):
+    """Сохранить новую транзакцию, изменить баланс счета и остатки после неё"""
+    delta = balance_delta(txn.type, txn.amount)
+    pk, adding = txn.pk, txn._state.adding
+
+    @retry.on_lock
+    def post():
+        # Повтор после отката начинается с транзакции в исходном состоянии
+        txn.pk, txn._state.adding = pk, adding
+        with sharding.atomic(txn):
+            # Сначала обновляем счет: его блокировка упорядочивает проводки по счету
+            apply_balance_delta(txn.account_id, delta)
+            balances.place(txn, delta)
+            txn.save()
+            balances.shift_later(txn, delta)
+
+    post()
+    return txn
+
+
+def _stored_values(txn):
+    """Значения транзакции в БД до изменения (и для отката сводки)"""
+    return Transaction.objects.filter(pk=txn.pk).values(*STORED_FIELDS).get()
+
+
+def update_transaction(txn):
+    """
+    Сохранить изменённую транзакцию: перенести разницу прежней и новой суммы
+    на балансы счетов и пересчитать остатки с более ранней из двух дат
+    """
+    @retry.on_lock
+    def update():
+        with sharding.atomic(txn):
+            old = _stored_values(txn)
+            txn._loaded_values = old
+            if old['balance_after'] is None:
+                # Транзакция вне остатков баланс счета не меняла
+                txn.save()
+                return
+            deltas = {old['account_id']: -balance_delta(old['type'], old['amount'])}
+            deltas[txn.account_id] = deltas.get(txn.account_id, 0) + balance_delta(txn.type, txn.amount)
+            for account_id in sorted(deltas):
+                if deltas[account_id]:
+                    apply_balance_delta(account_id, deltas[account_id])
+            txn.save()
+            since = min(old['date'], txn.date)
+            for account_id in sorted(deltas):
+                balances.recalculate(account_id, since)
+            txn.balance_after = Transaction.objects.values_list('balance_after', flat=True).get(pk=txn.pk)
+
+    update()
+    return txn
+
+
+def delete_transaction(txn):
+    """Удалить транзакцию, вычесть её из баланса счета и пересчитать остатки после неё"""
+    pk = txn.pk
+
+    @retry.on_lock
+    def delete():
+        txn.pk = pk
+        with sharding.atomic(txn):
+            old = _stored_values(txn)
+            txn._loaded_values = old
+            posted = old['balance_after'] is not None
+            if posted:
+                apply_balance_delta(old['account_id'], -balance_delta(old['type'], old['amount']))
+            txn.delete()
+            if posted:
+                balances.recalculate(old['account_id'], old['date'])
+
+    delete()
+
+
+def create_transaction(**fields):
+    """Создать транзакцию и изменить баланс счета"""
+    return post_transaction(Transaction(**fields))
+
+
+def insert_transactions(transactions, starts=None, batch_size=1000):
+    """
+    Вставить новые транзакции через bulk_create, не меняя баланс счетов.
+    Возвращает {account_id: самая ранняя дата} - откуда пересчитать остатки
+    (balances.recalculate_from), дополняя переданный starts.
+    """
+    starts = {} if starts is None else starts
+    for txn in transactions:
+        # Временное значение: транзакция участвует в пересчёте остатков
+        txn.balance_after = 0
+        if txn.account_id not in starts or txn.date < starts[txn.account_id]:
+            starts[txn.account_id] = txn.date
+    Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+    return starts
@@ -0,0 +1,226 @@
+"""
+Генерация больших синтетических наборов данных для нагрузочных тестов.
+
+Пользователи, категории и счета создаются bulk_create в основном процессе,
+а транзакции - пачками в пуле процессов: каждый процесс получает часть
+счетов, генерирует их историю детерминированно от seed и порядкового
+номера счета и пишет её (в шард владельца) executemany короткими транзакциями БД, минуя
+построение объектов модели и компилятор ORM. Итоговый
+баланс счета равен начальному плюс сумма его транзакций, остаток после
+каждой транзакции считается по ходу генерации, дневная сводка
+пересобирается в конце.
+"""
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import ledger, processes, rollups, sharding
+from .models import Account, Category, Transaction
+from .sample_data import EXPENSE_CATEGORIES, INCOME_CATEGORIES
+
+CHUNK_SIZE = 5000
+INSERT_FIELDS = ('account', 'category', 'type', 'amount', 'description', 'date', 'created_at', 'balance_after')
+DEFAULT_PASSWORD = 'loadtest123'
+
+ACCOUNT_TEMPLATES = [
+    ('Основной счет', 'UZS', '💳'),
+    ('USD счет', 'USD', '💵'),
+    ('EUR счет', 'EUR', '💶'),
+]
+DESCRIPTIONS = {
+    'expense': ['Магазин', 'Кафе', 'Такси', 'Аптека', 'Подписка', 'Рынок', ''],
+    'income': ['Зарплата', 'Перевод', 'Кешбэк', 'Проценты', ''],
+}
+# Доля доходов среди транзакций и диапазоны сумм
+INCOME_SHARE = 0.1
+EXPENSE_RANGE = (Decimal('1.00'), Decimal('300.00'))
+INCOME_RANGE = (Decimal('200.00'), Decimal('3000.00'))
+
+
+def _amount(rng, bounds):
+    low, high = (int(bound * 100) for bound in bounds)
+    # Мелкие суммы встречаются чаще крупных
+    return Decimal(int(low + (high - low) * rng.random() ** 3)) / 100
+
+
+def generate_account_transactions(spec, seed, count, days, now):
+    """
+    История одного счета по возрастанию даты: кортежи
+    (category_id, type, amount, description, date). Детерминирована seed
+    и порядковым номером счета.
+    """
+    ordinal, account_id, opening_balance, expense_categories, income_categories = spec
+    rng = random.Random(seed * 1_000_003 + ordinal)
+    seconds = days * 24 * 60 * 60
+    offsets = sorted((rng.randrange(seconds) for _ in range(count)), reverse=True)
+    for offset in offsets:
+        if income_categories and rng.random() < INCOME_SHARE:
+            type, categories, bounds = 'income', income_categories, INCOME_RANGE
+        else:
+            type, categories, bounds = 'expense', expense_categories, EXPENSE_RANGE
+        yield (
+            rng.choice(categories) if categories else None,
+            type,
+            _amount(rng, bounds),
+            rng.choice(DESCRIPTIONS[type]),
+            now - timedelta(seconds=offset),
+        )
+
+
+def _insert_sql(connection):
+    """INSERT транзакции без компилятора ORM (executemany на пачку)"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(Transaction._meta.get_field(name).column) for name in INSERT_FIELDS)
+    placeholders = ', '.join(['%s'] * len(INSERT_FIELDS))
+    return f'INSERT INTO {quote(Transaction._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+
+def write_transactions(task):
+    """Записать транзакции пачки счетов; возвращает ({account_id: дельта баланса}, строк)"""
+    alias, specs, seed, count, days, now, chunk_size = task
+    connection = connections[alias]
+    sql = _insert_sql(connection)
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    created_at = adapt_datetime(timezone.now())
+    deltas = {}
+    chunk = []
+    written = 0
+
+    def flush():
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.executemany(sql, chunk)
+        chunk.clear()
+
+    for spec in specs:
+        account_id, opening_balance = spec[1], spec[2]
+        delta = Decimal('0')
+        # История идёт по возрастанию даты - остаток копится по ходу
+        for category_id, type, amount, description, date in generate_account_transactions(
+            spec, seed, count, days, now,
+        ):
+            delta += ledger.balance_delta(type, amount)
+            chunk.append((
+                account_id, category_id, type, amount, description, adapt_datetime(date), created_at,
+                opening_balance + delta,
+            ))
+            if len(chunk) >= chunk_size:
+                written += len(chunk)
+                flush()
+        deltas[account_id] = delta
+    if chunk:
+        written += len(chunk)
+        flush()
+    return deltas, written
+
+
+def create_users(users, prefix, seed):
+    """Пользователи с токенами; возвращает их в порядке создания"""
+    password = make_password(DEFAULT_PASSWORD)
+    created = User.objects.bulk_create(
+        [User(username=f'{prefix}_{seed}_{i}', password=password) for i in range(users)],
+        batch_size=CHUNK_SIZE,
+    )
+    if any(user.pk is None for user in created):
+        # Бэкенд без RETURNING - перечитываем id
+        created = list(User.objects.filter(username__startswith=f'{prefix}_{seed}_').order_by('id'))
+    Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in created],
+        batch_size=CHUNK_SIZE,
+    )
+    sharding.copy_users(created)
+    return created
+
+
+def create_categories(users):
+    """Категории init_data для каждого пользователя; {user_id: (расходные id, доходные id)}"""
+    categories = Category.objects.bulk_create([
+        Category(user=user, type=type, **template)
+        for user in users
+        for type, templates in (('expense', EXPENSE_CATEGORIES), ('income', INCOME_CATEGORIES))
+        for template in templates
+    ], batch_size=CHUNK_SIZE)
+    by_user = {user.pk: ([], []) for user in users}
+    for category in categories:
+        by_user[category.user_id][category.type == 'income'].append(category.pk)
+    return by_user
+
+
+def create_accounts(users, accounts_per_user, rng):
+    accounts = []
+    for user in users:
+        for i in range(accounts_per_user):
+            name, currency, icon = ACCOUNT_TEMPLATES[i % len(ACCOUNT_TEMPLATES)]
+            if i >= len(ACCOUNT_TEMPLATES):
+                name = f'{name} {i // len(ACCOUNT_TEMPLATES) + 1}'
+            balance = Decimal(rng.randrange(0, 1_000_000)) / 100
+            accounts.append(Account(
+                user=user, name=name, currency=currency, icon=icon,
+                balance=balance, opening_balance=balance,
+            ))
+    return Account.objects.bulk_create(accounts, batch_size=CHUNK_SIZE)
+
+
+def generate(users, accounts_per_user, transactions_per_account, seed=0, days=365,
+             workers=None, prefix='load', chunk_size=CHUNK_SIZE, log=None):
+    """Сгенерировать набор данных; возвращает счетчики созданных объектов"""
+    log = log or (lambda message: None)
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    created_users = create_users(users, prefix, seed)
+    categories = {}
+    accounts = {}
+    for alias, shard_users in sharding.group_users(created_users).items():
+        with sharding.using_shard(alias):
+            categories.update(create_categories(shard_users))
+            accounts[alias] = create_accounts(shard_users, accounts_per_user, rng)
+    log(f'Пользователей: {len(created_users)}, счетов: {sum(map(len, accounts.values()))}')
+
+    specs = {}
+    ordinal = 0
+    for alias, shard_accounts in accounts.items():
+        specs[alias] = []
+        for account in shard_accounts:
+            specs[alias].append((ordinal, account.pk, account.opening_balance, *categories[account.user_id]))
+            ordinal += 1
+    workers = processes.pool_size(workers, ordinal)
+    # Несколько задач на процесс, чтобы медленные пачки не держали весь пул
+    step = max(1, ordinal // (workers * 4))
+    tasks = [
+        (alias, shard_specs[start:start + step], seed, transactions_per_account, days, now, chunk_size)
+        for alias, shard_specs in specs.items()
+        for start in range(0, len(shard_specs), step)
+    ]
+
+    # Шарды выдают id из непересекающихся диапазонов, поэтому id счета уникален
+    deltas = {}
+    written = 0
+    for task_deltas, task_written in processes.imap_unordered(write_transactions, tasks, workers):
+        deltas.update(task_deltas)
+        written += task_written
+        log(f'Транзакций: {written}')
+
+    # Баланс = начальный + сумма транзакций счета
+    for alias, shard_accounts in accounts.items():
+        for account in shard_accounts:
+            account.balance += deltas.get(account.pk, 0)
+        Account.objects.using(alias).bulk_update(shard_accounts, ['balance'], batch_size=CHUNK_SIZE)
+    user_ids = [user.pk for user in created_users]
+    rollup_rows = sum(
+        rollups.rebuild(user_ids=user_ids[start:start + 1000])
+        for start in range(0, len(user_ids), 1000)
+    )
+
+    return {
+        'users': len(created_users),
+        'accounts': ordinal,
+        'transactions': written,
+        'rollups': rollup_rows,
+    }
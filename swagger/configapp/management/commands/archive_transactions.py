@@ -0,0 +1,45 @@
+"""
+Management command для переноса старых транзакций в архив.
+Запустите: python manage.py archive_transactions --older-than DAYS [--user ID ...]
+"""
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from configapp import archive, periods
+
+
+class Command(BaseCommand):
+    help = 'Переносит транзакции старше --older-than дней из рабочей таблицы в архив пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, required=True, dest='days',
+            help='Возраст транзакций в днях: переносятся транзакции раньше начала этого дня',
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='ID пользователя (можно указать несколько раз). По умолчанию - все пользователи',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=archive.CHUNK_SIZE,
+            help='Сколько транзакций переносить в одной транзакции БД',
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] < 0 or options['chunk_size'] < 1:
+            raise CommandError('--older-than не может быть отрицательным, --chunk-size - меньше 1')
+        cutoff = periods.day_start(timezone.localdate() - timedelta(days=options['days']))
+        started = time.monotonic()
+        accounts = transactions = 0
+        for account_id, moved in archive.archive(cutoff, options['users'], options['chunk_size']):
+            accounts += 1
+            transactions += moved
+            self.stdout.write(f'  Счет {account_id}: транзакций {moved}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Перенесено в архив транзакций: {transactions} со счетов: {accounts} '
+            f'(раньше {cutoff:%Y-%m-%d}) за {time.monotonic() - started:.1f} с'
+        ))
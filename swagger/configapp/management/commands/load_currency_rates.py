@@ -0,0 +1,26 @@
+"""
+Management command для загрузки курсов валют из локального файла.
+Запустите: python manage.py load_currency_rates [path/to/currency_rates.json]
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from configapp import currency
+
+
+class Command(BaseCommand):
+    help = 'Загружает курсы валют к базовой валюте из JSON-файла в таблицу CurrencyRate'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(settings.CURRENCY_RATES_FILE),
+            help='JSON-файл с курсами (по умолчанию CURRENCY_RATES_FILE)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            loaded = currency.load_rates(options['path'])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f"✓ Загружено курсов: {loaded}"))
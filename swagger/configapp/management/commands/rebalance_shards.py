@@ -0,0 +1,61 @@
+"""
+Management command для переноса пользователей в их шарды после изменения SHARDS.
+Запустите: python manage.py rebalance_shards [--user ID ...] [--dry-run]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from configapp import rebalance, sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает копии пользователей в их шарды, находит пользователей, чьи данные '
+        'лежат не в вычисленном для них шарде (или в default), и переносит их данные в нужный шард'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='ID пользователя (можно указать несколько раз). По умолчанию - все пользователи',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', help='Только показать, кого нужно перенести',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Шардирование выключено: задайте DJANGO_SHARDS')
+        started = time.monotonic()
+        if not options['dry_run']:
+            synced = rebalance.sync_users(options['users'])
+            self.stdout.write(f'  Копии пользователей в шардах: {synced}')
+        moves = list(rebalance.misplaced(options['users']))
+        users = transactions = failed = 0
+        for move in moves:
+            if options['dry_run']:
+                self.stdout.write(f'  Пользователь {move.user_id}: {move.source} → {move.target}')
+                continue
+            try:
+                moved = rebalance.move_user(*move)
+            except ValueError as error:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'✗ {error}'))
+                continue
+            users += 1
+            transactions += moved
+            self.stdout.write(
+                f'  Пользователь {move.user_id}: {move.source} → {move.target}, транзакций: {moved}'
+            )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✓ Нужно перенести пользователей: {len(moves)}'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Перенесено пользователей: {users}, транзакций: {transactions} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+        if failed:
+            raise CommandError(f'Не перенесено пользователей: {failed}')
@@ -0,0 +1,26 @@
+"""
+Management command для пересборки дневных сводок транзакций.
+Запустите: python manage.py rebuild_rollups [--user ID ...]
+"""
+
+from django.core.management.base import BaseCommand
+
+from configapp import rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает таблицу дневных сводок (TransactionRollup) из транзакций'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='ID пользователя (можно указать несколько раз). По умолчанию - все пользователи',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки для bulk_create',
+        )
+
+    def handle(self, *args, **options):
+        created = rollups.rebuild(user_ids=options['users'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"✓ Создано строк сводки: {created}"))
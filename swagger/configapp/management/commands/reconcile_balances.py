@@ -0,0 +1,91 @@
+"""
+Management command для сверки балансов счетов с журналом транзакций.
+Запустите: python manage.py reconcile_balances [--workers 4] [--report drift.csv] [--fix]
+"""
+
+import csv
+import heapq
+import time
+
+from django.core.management.base import BaseCommand
+
+from configapp import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет баланс каждого счета с начальным балансом и суммой его транзакций, '
+        'выводит расхождения и при --fix исправляет их'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=reconcile.BATCH_SIZE, help='Счетов в одной пачке',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None, help='Число процессов. По умолчанию - число ядер',
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='ID пользователя (можно указать несколько раз). По умолчанию - все пользователи',
+        )
+        parser.add_argument('--report', help='Записать все расхождения в CSV-файл')
+        parser.add_argument('--show', type=int, default=20, help='Сколько крупнейших расхождений вывести')
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Сдвинуть балансы на величину расхождения и пересчитать остатки транзакций',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        checked = drifted = 0
+        total_drift = 0
+        # Крупнейшие расхождения - куча фиксированного размера
+        largest = []
+        report = writer = None
+        if options['report']:
+            report = open(options['report'], 'w', encoding='utf-8', newline='')
+            writer = csv.writer(report)
+            writer.writerow(reconcile.Drift._fields)
+        try:
+            for count, drifts in reconcile.reconcile(
+                batch_size=options['batch_size'], workers=options['workers'],
+                fix=options['fix'], user_ids=options['users'],
+            ):
+                checked += count
+                drifted += len(drifts)
+                for drift in drifts:
+                    total_drift += abs(drift.drift)
+                    if writer:
+                        writer.writerow(drift)
+                    item = (abs(drift.drift), drift.account_id, drift)
+                    if len(largest) < options['show']:
+                        heapq.heappush(largest, item)
+                    elif largest and item > largest[0]:
+                        heapq.heapreplace(largest, item)
+        finally:
+            if report:
+                report.close()
+        elapsed = time.monotonic() - started
+
+        if largest:
+            self.stdout.write(
+                f"{'счет':>10}{'польз.':>10}{'валюта':>8}{'баланс':>18}{'ожидается':>18}{'расхождение':>16}"
+            )
+            for _, _, drift in sorted(largest, reverse=True):
+                self.stdout.write(
+                    f'{drift.account_id:>10}{drift.user_id:>10}{drift.currency:>8}'
+                    f'{drift.balance:>18}{drift.expected:>18}{drift.drift:>16}'
+                )
+        summary = (
+            f'Проверено счетов: {checked} за {elapsed:.1f} с, '
+            f'с расхождением: {drifted} (сумма модулей {total_drift})'
+        )
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f'✓ {summary}'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✓ {summary} - исправлено'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{summary}. Для исправления запустите с --fix'))
+        if options['report']:
+            self.stdout.write(f"  Отчёт: {options['report']}")
@@ -0,0 +1,52 @@
+"""
+Management command для обновления реплики БД, из которой читают отчёты.
+Запустите: python manage.py refresh_analytics_db [--interval 60]
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from configapp import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную БД в реплику для отчётов через sqlite3 backup API; '
+        'с --interval повторяет копирование периодически'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=str(settings.ANALYTICS_DB_PATH),
+            help='Файл реплики (по умолчанию ANALYTICS_DB_PATH)',
+        )
+        parser.add_argument(
+            '--pages', type=int, default=-1,
+            help='Страниц за шаг backup. По умолчанию все за один шаг',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=None,
+            help='Обновлять каждые N секунд до остановки (должно быть меньше ANALYTICS_MAX_STALENESS)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is not None and interval >= settings.ANALYTICS_MAX_STALENESS:
+            self.stdout.write(self.style.WARNING(
+                f'Интервал {interval} с не меньше ANALYTICS_MAX_STALENESS '
+                f'({settings.ANALYTICS_MAX_STALENESS} с): между обновлениями отчёты будут читать основную БД'
+            ))
+        while True:
+            started = time.monotonic()
+            try:
+                analytics.refresh(options['path'], options['pages'])
+            except (OSError, ValueError) as error:
+                raise CommandError(str(error))
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Реплика обновлена: {options['path']} за {time.monotonic() - started:.2f} с"
+            ))
+            if interval is None:
+                return
+            time.sleep(max(0, interval - (time.monotonic() - started)))
@@ -0,0 +1,103 @@
+"""
+Management command для бенчмарков эндпоинтов.
+Запустите: python manage.py run_benchmarks [--transactions-per-account 2000] [--update-baseline]
+"""
+
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks import suite
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку (p50/p95/p99), число запросов и пиковую память основных '
+        'эндпоинтов во временной БД и сравнивает с базовыми значениями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2, help='Пользователей в наборе данных')
+        parser.add_argument('--accounts-per-user', type=int, default=3, help='Счетов на пользователя')
+        parser.add_argument(
+            '--transactions-per-account', type=int, default=2000, help='Транзакций на счет',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора данных')
+        parser.add_argument('--workers', type=int, default=None, help='Процессов для генерации данных')
+        parser.add_argument('--requests', type=int, default=50, help='Замеряемых запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=3, help='Прогревочных запросов на сценарий')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', choices=[s.name for s in suite.SCENARIOS],
+            help='Запустить только указанный сценарий (можно указать несколько раз)',
+        )
+        parser.add_argument('--output', help='Сохранить результат в JSON-файл')
+        parser.add_argument(
+            '--baseline', default=str(DEFAULT_BASELINE), help='Файл базовых значений',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост задержки и памяти относительно базовых (доля, 0.25 = 25%%)',
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true', help='Записать результат как новые базовые значения',
+        )
+
+    def handle(self, *args, **options):
+        dataset = {
+            'users': options['users'],
+            'accounts_per_user': options['accounts_per_user'],
+            'transactions_per_account': options['transactions_per_account'],
+            'seed': options['seed'],
+            'requests': options['requests'],
+        }
+
+        # Без DEBUG: журнал всех SQL-запросов искажает замеры
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self.stdout.write('Генерация данных...')
+            user, account_id = suite.seed(
+                options['users'], options['accounts_per_user'], options['transactions_per_account'],
+                seed=options['seed'], workers=options['workers'],
+            )
+            self.stdout.write(
+                f"{'сценарий':<26}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'запросов':>10}{'память, КБ':>12}"
+            )
+            results = suite.run(
+                user, account_id, options['requests'], options['warmup'], options['scenarios'],
+                log=lambda name, m: self.stdout.write(
+                    f"{name:<26}{m['p50_ms']:>10.2f}{m['p95_ms']:>10.2f}{m['p99_ms']:>10.2f}"
+                    f"{m['queries']:>10}{m['peak_memory_kb']:>12.1f}"
+                ),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = suite.report(dataset, results)
+        if options['output']:
+            suite.save(options['output'], report)
+            self.stdout.write(f"✓ Результат сохранён: {options['output']}")
+        if options['update_baseline']:
+            suite.save(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"✓ Базовые значения обновлены: {options['baseline']}"))
+            return
+
+        baseline_path = Path(options['baseline'])
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f'Базовые значения не найдены: {baseline_path}'))
+            return
+        baseline = suite.load(baseline_path)
+        if baseline['dataset'] != dataset:
+            self.stdout.write(self.style.WARNING(
+                f"Набор данных отличается от базового ({baseline['dataset']}) - сравнение приблизительное"
+            ))
+        regressions = suite.compare(results, baseline['results'], options['tolerance'])
+        if regressions:
+            raise CommandError('Регрессии относительно базовых значений:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('✓ Регрессий нет'))
@@ -0,0 +1,38 @@
+"""
+Management command для исполнения регулярных платежей.
+Запустите: python manage.py run_recurring_payments [--loop --interval 60]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from configapp import recurring
+
+
+class Command(BaseCommand):
+    help = 'Создаёт транзакции по наступившим регулярным платежам (с догоном пропущенных периодов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=recurring.BATCH_SIZE,
+            help='Сколько платежей обрабатывать в одной транзакции БД',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Работать постоянно, проверяя платежи каждые --interval секунд',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=60,
+            help='Пауза между проходами в режиме --loop (секунды)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            payments, transactions = recurring.run_due_payments(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Обработано платежей: {payments}, создано транзакций: {transactions}"
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,160 @@
+"""
+Метрики запросов в памяти процесса и их вывод в формате Prometheus.
+
+Гистограммы с фиксированными границами корзин: наблюдение - это поиск
+корзины bisect и два сложения под блокировкой, поэтому сбор можно держать
+включённым постоянно. Метрики живут в памяти процесса: при нескольких
+воркерах каждый отдаёт свои значения.
+"""
+
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счетчик с метками"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+    """Гистограмма с метками и фиксированными границами корзин"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Счетчики по корзинам (последняя - +Inf) и сумма наблюдений
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                yield (
+                    f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", _number(bound))])} '
+                    f'{cumulative}'
+                )
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+REQUEST_LABELS = ('view', 'method')
+
+requests_total = Counter(
+    'bank_http_requests_total', 'Количество запросов по представлению, методу и статусу',
+    (*REQUEST_LABELS, 'status'),
+)
+request_duration = Histogram(
+    'bank_http_request_duration_seconds', 'Время обработки запроса',
+    LATENCY_BUCKETS, REQUEST_LABELS,
+)
+sql_queries = Histogram(
+    'bank_http_request_sql_queries', 'Количество SQL-запросов на запрос',
+    QUERY_BUCKETS, REQUEST_LABELS,
+)
+sql_duration = Histogram(
+    'bank_http_request_sql_duration_seconds', 'Суммарное время SQL-запросов на запрос',
+    LATENCY_BUCKETS, REQUEST_LABELS,
+)
+response_size = Histogram(
+    'bank_http_response_size_bytes', 'Размер тела ответа (без потоковых ответов)',
+    SIZE_BUCKETS, REQUEST_LABELS,
+)
+
+db_lock_retries = Counter(
+    'bank_db_lock_retries_total', 'Повторы записи из-за блокировки БД',
+    ('operation',),
+)
+
+REGISTRY = [requests_total, request_duration, sql_queries, sql_duration, response_size, db_lock_retries]
+
+
+def record(view, method, status, duration, queries, query_duration, size=None):
+    """Учесть один обработанный запрос"""
+    labels = (view, method)
+    requests_total.inc((view, method, str(status)))
+    request_duration.observe(labels, duration)
+    sql_queries.observe(labels, queries)
+    sql_duration.observe(labels, query_duration)
+    if size is not None:
+        response_size.observe(labels, size)
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.reset()
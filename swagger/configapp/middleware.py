@@ -0,0 +1,140 @@
+"""
+Middleware с метриками запросов и выбором шарда.
+
+Для каждого запроса по имени разрешённого URL учитываются время обработки,
+число и суммарное время SQL-запросов и размер ответа. SQL считает одна
+постоянная обертка на каждом соединении (install_query_timer), а таймер
+текущего запроса она берёт из контекстной переменной: одновременные
+ASGI-запросы на общем соединении не смешивают свои счётчики. Контекст
+переходит и в потоки sync_to_async, поэтому параллельные запросы
+асинхронных представлений тоже учитываются; SQL при чтении потокового
+ответа - нет.
+
+ShardMiddleware делает пользователя запроса источником шарда для данных
+пользователей (configapp.sharding) на время обработки запроса.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics, sharding
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Таймер SQL текущего запроса (None - вне запроса)
+_current_timer = ContextVar('query_timer', default=None)
+
+
+class QueryTimer:
+    """Количество SQL-запросов и их суммарное время (запросы могут идти из нескольких потоков)"""
+
+    __slots__ = ('count', 'duration', '_lock')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, duration):
+        with self._lock:
+            self.duration += duration
+            self.count += 1
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add(time.perf_counter() - started)
+
+
+def install_query_timer(connection):
+    """Поставить постоянную обертку SQL на соединение (повторный вызов ничего не делает)"""
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики каждого запроса в configapp.metrics. Работает и в
+    асинхронной цепочке (ASGI), чтобы асинхронные представления не
+    оборачивались в async_to_sync.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        token = _current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        _record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        # Контекст запроса копируется в потоки sync_to_async, где выполняется SQL
+        token = _current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        _record(request, response, time.perf_counter() - started, timer)
+        return response
+
+
+def _record(request, response, duration, timer):
+    match = getattr(request, 'resolver_match', None)
+    # Метки ограничены именами URL и известными методами, чтобы их число не росло
+    view = match.view_name if match is not None and match.view_name else 'unresolved'
+    method = request.method if request.method in KNOWN_METHODS else 'OTHER'
+    size = None if response.streaming else len(response.content)
+    metrics.record(view, method, response.status_code, duration, timer.count, timer.duration, size)
+
+
+class ShardMiddleware:
+    """
+    Данные пользователей в запросе берутся из шарда request.user. Пользователь
+    читается при первом обращении к данным, поэтому токен-аутентификация DRF,
+    которая выполняется уже в представлении, тоже учитывается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with sharding.for_request(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Контекстная переменная видна и в вызовах sync_to_async внутри запроса
+        with sharding.for_request(request):
+            return await self.get_response(request)
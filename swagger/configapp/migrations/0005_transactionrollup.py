@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:38
+
+import django.db.models.deletion
+import django.db.models.functions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    """Заполняем сводку по уже существующим транзакциям"""
+    Transaction = apps.get_model('configapp', 'Transaction')
+    TransactionRollup = apps.get_model('configapp', 'TransactionRollup')
+    db_alias = schema_editor.connection.alias
+    grouped = Transaction.objects.using(db_alias).annotate(
+        day=django.db.models.functions.TruncDate('date')
+    ).values('account__user_id', 'account_id', 'category_id', 'type', 'day').annotate(
+        total=models.Sum('amount'), count=models.Count('id')
+    ).order_by()
+    TransactionRollup.objects.using(db_alias).bulk_create([
+        TransactionRollup(
+            user_id=row['account__user_id'],
+            account_id=row['account_id'],
+            category_id=row['category_id'],
+            type=row['type'],
+            day=row['day'],
+            total=row['total'],
+            count=row['count'],
+        )
+        for row in grouped.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0004_account_user_category_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('transfer', 'Transfer'), ('expense', 'Expense'), ('income', 'Income')], max_length=10)),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='configapp.account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='configapp.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transaction rollup',
+                'verbose_name_plural': 'Transaction rollups',
+                'indexes': [models.Index(fields=['user', 'type', 'day'], name='configapp_rollup_user_day')],
+                'constraints': [models.UniqueConstraint(models.F('account'), django.db.models.functions.comparison.Coalesce('category', 0), models.F('type'), models.F('day'), name='configapp_rollup_unique_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
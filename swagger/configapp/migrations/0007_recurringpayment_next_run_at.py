@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:44
+
+import calendar
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Копии schedules.add_months, schedules.occurrence_after и periods.day_start
+# на момент миграции: изменения модулей не должны менять миграцию
+
+def add_months(day, months, anchor_day=None):
+    anchor_day = anchor_day or day.day
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return day.replace(year=year, month=month, day=min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_after(frequency, start_date, after=None):
+    if after is None or after < start_date:
+        return start_date
+    if frequency == 'daily':
+        return after + timedelta(days=1)
+    if frequency == 'weekly':
+        weeks = (after - start_date).days // 7 + 1
+        return start_date + timedelta(weeks=weeks)
+    step = 12 if frequency == 'yearly' else 1
+    months = (after.year - start_date.year) * 12 + after.month - start_date.month
+    months -= months % step
+    candidate = add_months(start_date, months)
+    while candidate <= after:
+        months += step
+        candidate = add_months(start_date, months)
+    return candidate
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def schedule_existing_payments(apps, schema_editor):
+    """Заполняем next_run_at для уже существующих платежей (ближайшая дата с сегодняшнего дня)"""
+    RecurringPayment = apps.get_model('configapp', 'RecurringPayment')
+    db_alias = schema_editor.connection.alias
+    # Даты до развёртывания не догоняются: первый запуск планировщика не должен
+    # списать все периоды с начала расписания. Продолжаем с даты после последнего
+    # выполнения, но не раньше сегодняшнего дня
+    yesterday = timezone.localdate() - timedelta(days=1)
+    batch = []
+    for payment in RecurringPayment.objects.using(db_alias).order_by('id').iterator(chunk_size=1000):
+        last_day = timezone.localdate(payment.last_executed) if payment.last_executed else None
+        after = max(last_day, yesterday) if last_day else yesterday
+        day = occurrence_after(payment.frequency, payment.start_date, after)
+        payment.next_run_at = None if payment.end_date and day > payment.end_date else day_start(day)
+        batch.append(payment)
+        if len(batch) >= 1000:
+            RecurringPayment.objects.using(db_alias).bulk_update(batch, ['next_run_at'])
+            batch = []
+    if batch:
+        RecurringPayment.objects.using(db_alias).bulk_update(batch, ['next_run_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0006_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurringpayment',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Next run'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringpayment',
+            index=models.Index(fields=['is_active', 'next_run_at'], name='configapp_recur_due'),
+        ),
+        migrations.RunPython(schedule_existing_payments, migrations.RunPython.noop),
+    ]
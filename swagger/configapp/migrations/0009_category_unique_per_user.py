@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:58
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0008_account_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='category',
+            unique_together={('user', 'name', 'type')},
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+# Копия ledger.BALANCE_SIGNS на момент миграции: изменения модуля не должны менять миграцию
+BALANCE_SIGNS = {
+    'income': 1,
+    'expense': -1,
+}
+
+
+def balance_delta(type, amount):
+    return BALANCE_SIGNS.get(type, 0) * amount
+
+
+def fill_running_balances(apps, schema_editor):
+    """
+    Начальный баланс счета - текущий минус все его транзакции,
+    остатки - накопленная сумма в порядке (date, id)
+    """
+    Account = apps.get_model('configapp', 'Account')
+    Transaction = apps.get_model('configapp', 'Transaction')
+    db_alias = schema_editor.connection.alias
+    for account in Account.objects.using(db_alias).order_by('id').iterator(chunk_size=1000):
+        transactions = list(
+            Transaction.objects.using(db_alias).filter(account_id=account.pk).order_by('date', 'id').only('type', 'amount')
+        )
+        balance = account.balance - sum(
+            (balance_delta(txn.type, txn.amount) for txn in transactions), 0,
+        )
+        Account.objects.using(db_alias).filter(pk=account.pk).update(opening_balance=balance)
+        for txn in transactions:
+            balance += balance_delta(txn.type, txn.amount)
+            txn.balance_after = balance
+        Transaction.objects.using(db_alias).bulk_update(transactions, ['balance_after'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0010_currencyrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Opening balance'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True, verbose_name='Balance after'),
+        ),
+        migrations.RunPython(fill_running_balances, migrations.RunPython.noop),
+    ]
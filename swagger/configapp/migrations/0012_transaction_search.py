@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+import configapp.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Индексируются только непустые описания; owner - токен пользователя (u<id>)
+FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE configapp_transaction_fts USING fts5(
+        description, owner,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER configapp_transaction_fts_insert AFTER INSERT ON configapp_transaction
+    WHEN NEW.description != ''
+    BEGIN
+        INSERT INTO configapp_transaction_fts (rowid, description, owner)
+        SELECT NEW.id, NEW.description, 'u' || user_id FROM configapp_account WHERE id = NEW.account_id;
+    END
+    """,
+    """
+    CREATE TRIGGER configapp_transaction_fts_delete AFTER DELETE ON configapp_transaction
+    WHEN OLD.description != ''
+    BEGIN
+        DELETE FROM configapp_transaction_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER configapp_transaction_fts_update AFTER UPDATE OF description, account_id ON configapp_transaction
+    BEGIN
+        DELETE FROM configapp_transaction_fts WHERE rowid = OLD.id;
+        INSERT INTO configapp_transaction_fts (rowid, description, owner)
+        SELECT NEW.id, NEW.description, 'u' || user_id FROM configapp_account
+        WHERE id = NEW.account_id AND NEW.description != '';
+    END
+    """,
+    """
+    INSERT INTO configapp_transaction_fts (rowid, description, owner)
+    SELECT t.id, t.description, 'u' || a.user_id
+    FROM configapp_transaction t JOIN configapp_account a ON a.id = t.account_id
+    WHERE t.description != ''
+    """,
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS configapp_transaction_fts_insert',
+    'DROP TRIGGER IF EXISTS configapp_transaction_fts_delete',
+    'DROP TRIGGER IF EXISTS configapp_transaction_fts_update',
+    'DROP TABLE IF EXISTS configapp_transaction_fts',
+]
+
+
+def run_on_sqlite(statements):
+    """FTS5 есть только в SQLite; на других СУБД поиск работает через icontains"""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0011_running_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSearch',
+            fields=[
+                ('transaction', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='configapp.transaction')),
+                ('description', models.TextField()),
+                ('owner', models.TextField()),
+                ('document', configapp.models.SearchDocumentField(db_column='configapp_transaction_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'configapp_transaction_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(run_on_sqlite(FTS_SQL), run_on_sqlite(DROP_SQL)),
+    ]
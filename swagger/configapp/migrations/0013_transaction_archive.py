@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configapp', '0012_transaction_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('transfer', 'Transfer'), ('expense', 'Expense'), ('income', 'Income')], max_length=10, verbose_name='Type')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Amount')),
+                ('description', models.CharField(blank=True, max_length=200, verbose_name='Description')),
+                ('date', models.DateTimeField(verbose_name='Date')),
+                ('created_at', models.DateTimeField()),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=14, null=True, verbose_name='Balance after')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='configapp.account', verbose_name='Account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='configapp.category', verbose_name='Category')),
+            ],
+            options={
+                'verbose_name': 'Archived transaction',
+                'verbose_name_plural': 'Archived transactions',
+                'db_table': 'configapp_transaction_archive',
+                'indexes': [models.Index(fields=['account', 'date'], name='configapp_archive_acct_date')],
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.db.models.signals import post_save
@@ -6,6 +9,8 @@ from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 
+from . import periods, schedules
+
 class Account(models.Model):
     """Счет/Кошелек пользователя"""
     CURRENCY_CHOICES = [
@@ -17,9 +22,16 @@ class Account(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='accounts')
     name = models.CharField(max_length=100, verbose_name=_('Account name'))
     balance = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=_('Balance'))
+    # Баланс до первой транзакции рабочей таблицы (основа остатков balance_after);
+    # перенос транзакций в архив прибавляет к нему их сумму
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2, editable=False, verbose_name=_('Opening balance'))
     currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default='UZS', verbose_name=_('Currency'))
     icon = models.CharField(max_length=50, default='💳', verbose_name=_('Icon'))
     created_at = models.DateTimeField(auto_now_add=True)
+    # Счетчик изменений счета и его транзакций (основа ETag)
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    # Транзакции раньше этого момента перенесены в архив (ArchivedTransaction)
+    archived_until = models.DateTimeField(null=True, blank=True, editable=False)
     
     class Meta:
         verbose_name = _('Account')
@@ -28,6 +40,33 @@ class Account(models.Model):
     def __str__(self):
         return f"{self.name} ({self.currency})"
 
+    def save(self, *args, **kwargs):
+        """Любое сохранение существующего счета увеличивает version"""
+        if self._state.adding:
+            if self.opening_balance is None:
+                self.opening_balance = self.balance
+            return super().save(*args, **kwargs)
+        self.version = models.F('version') + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+
+class CurrencyRate(models.Model):
+    """Курс валюты: стоимость единицы валюты в базовой валюте (BASE_CURRENCY)"""
+    currency = models.CharField(max_length=3, unique=True, choices=Account.CURRENCY_CHOICES, verbose_name=_('Currency'))
+    rate = models.DecimalField(max_digits=20, decimal_places=8, verbose_name=_('Rate'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Currency rate')
+        verbose_name_plural = _('Currency rates')
+
+    def __str__(self):
+        return f"{self.currency}: {self.rate}"
+
 
 class Category(models.Model):
     """Категория расходов/доходов"""
@@ -45,7 +84,7 @@ class Category(models.Model):
     class Meta:
         verbose_name = _('Category')
         verbose_name_plural = _('Categories')
-        unique_together = ('name', 'type')
+        unique_together = ('user', 'name', 'type')
     
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
@@ -66,15 +105,121 @@ class Transaction(models.Model):
     description = models.CharField(max_length=200, blank=True, verbose_name=_('Description'))
     date = models.DateTimeField(default=timezone.now, verbose_name=_('Date'))
     created_at = models.DateTimeField(auto_now_add=True)
+    # Баланс счета после транзакции в порядке (date, id); NULL - создана в обход ledger
+    balance_after = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True, editable=False, verbose_name=_('Balance after'),
+    )
     
     class Meta:
         verbose_name = _('Transaction')
         verbose_name_plural = _('Transactions')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['account', 'type', 'date'], name='configapp_txn_acct_type_date'),
+            models.Index(fields=['account', 'date'], name='configapp_txn_acct_date'),
+        ]
     
     def __str__(self):
         return f"{self.get_type_display()}: {self.amount} {self.account.currency}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы при изменении откатить их из сводки
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Транзакция в холодном архиве (см. archive). Колонки идут в том же
+    порядке, что у Transaction, и id сохраняется, поэтому выборки из двух
+    таблиц объединяются через UNION ALL.
+    """
+    id = models.IntegerField(primary_key=True)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_transactions', verbose_name=_('Account'))
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_('Category'))
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES, verbose_name=_('Type'))
+    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name=_('Amount'))
+    description = models.CharField(max_length=200, blank=True, verbose_name=_('Description'))
+    date = models.DateTimeField(verbose_name=_('Date'))
+    created_at = models.DateTimeField()
+    balance_after = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True, editable=False, verbose_name=_('Balance after'),
+    )
+
+    class Meta:
+        verbose_name = _('Archived transaction')
+        verbose_name_plural = _('Archived transactions')
+        db_table = 'configapp_transaction_archive'
+        indexes = [
+            models.Index(fields=['account', 'date'], name='configapp_archive_acct_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_type_display()}: {self.amount}"
+
+
+class SearchDocumentField(models.TextField):
+    """Скрытая колонка FTS5 с именем таблицы: по ней выполняется MATCH"""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class TransactionSearch(models.Model):
+    """
+    Полнотекстовый индекс описаний транзакций - виртуальная таблица SQLite
+    FTS5, которую ведут триггеры (см. миграцию 0012). owner - токен
+    пользователя, чтобы поиск сразу сужался до его транзакций.
+    """
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        related_name='search_entry',
+    )
+    description = models.TextField()
+    owner = models.TextField()
+    document = SearchDocumentField(db_column='configapp_transaction_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'configapp_transaction_fts'
+
+
+class TransactionRollup(models.Model):
+    """Дневная сводка транзакций (пользователь, счет, категория, тип, день)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_rollups')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='rollups')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    day = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Transaction rollup')
+        verbose_name_plural = _('Transaction rollups')
+        constraints = [
+            models.UniqueConstraint(
+                'account', Coalesce('category', 0), 'type', 'day',
+                name='configapp_rollup_unique_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'type', 'day'], name='configapp_rollup_user_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.type}: {self.total}"
+
 
 class RecurringPayment(models.Model):
     """Регулярный платеж"""
@@ -94,14 +239,52 @@ class RecurringPayment(models.Model):
     end_date = models.DateField(null=True, blank=True, verbose_name=_('End date'))
     is_active = models.BooleanField(default=True, verbose_name=_('Active'))
     last_executed = models.DateTimeField(null=True, blank=True, verbose_name=_('Last executed'))
+    next_run_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_('Next run'))
+    
+    SCHEDULE_FIELDS = ('frequency', 'start_date', 'end_date')
     
     class Meta:
         verbose_name = _('Recurring payment')
         verbose_name_plural = _('Recurring payments')
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_at'], name='configapp_recur_due'),
+        ]
     
     def __str__(self):
         return f"{self.description} - {self.amount} ({self.get_frequency_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def compute_next_run(self, resumed=None):
+        """
+        Ближайшая невыполненная дата платежа (None - расписание закончилось).
+        resumed - день возобновления: даты за время паузы не догоняются.
+        """
+        last_day = timezone.localdate(self.last_executed) if self.last_executed else None
+        if resumed is not None and (last_day is None or last_day < resumed - timedelta(days=1)):
+            last_day = resumed - timedelta(days=1)
+        day = schedules.occurrence_after(self.frequency, self.start_date, last_day)
+        if self.end_date and day > self.end_date:
+            return None
+        return periods.day_start(day)
+
+    def save(self, *args, **kwargs):
+        # Пересчитываем расписание для новых платежей и при изменении его полей
+        loaded = getattr(self, '_loaded_values', {})
+        changed = any(
+            field in loaded and loaded[field] != getattr(self, field)
+            for field in self.SCHEDULE_FIELDS
+        )
+        # Возобновлённый платёж продолжает расписание с сегодняшнего дня
+        resumed = timezone.localdate() if loaded.get('is_active') is False and self.is_active else None
+        if self._state.adding or changed or resumed:
+            self.next_run_at = self.compute_next_run(resumed)
+        super().save(*args, **kwargs)
+
 
 # Signal для создания токена при создании пользователя
 @receiver(post_save, sender=User)
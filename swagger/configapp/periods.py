@@ -0,0 +1,74 @@
+"""
+Фильтр транзакций по периоду.
+
+Периоды today/week/month/custom превращаются в полуинтервалы
+[start, end) по datetime, поэтому условие ложится на индекс по колонке
+date, а не оборачивает её в DATE().
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+PERIODS = ('today', 'week', 'month', 'custom')
+
+
+def day_start(day):
+    """Начало дня в текущем часовом поясе"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_day(value):
+    """Дата YYYY-MM-DD или None для пустого и некорректного значения"""
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def period_range(period, date_from=None, date_to=None, today=None):
+    """
+    Полуинтервал [start, end) для периода.
+
+    Любая из границ может быть None (без ограничения). Для custom
+    date_from и date_to - даты в формате YYYY-MM-DD, обе включительно.
+    """
+    today = today or timezone.localdate()
+    if period == 'today':
+        return day_start(today), day_start(today + timedelta(days=1))
+    if period == 'week':
+        return day_start(today - timedelta(days=7)), None
+    if period == 'month':
+        return day_start(today.replace(day=1)), None
+    if period == 'custom':
+        start_day = parse_day(date_from)
+        end_day = parse_day(date_to)
+        return (
+            day_start(start_day) if start_day else None,
+            day_start(end_day + timedelta(days=1)) if end_day else None,
+        )
+    return None, None
+
+
+def filter_period(queryset, period, date_from=None, date_to=None, field='date'):
+    """Ограничить queryset периодом по полю field"""
+    start, end = period_range(period, date_from, date_to)
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+
+def filter_by_params(queryset, params, default='all', field='date'):
+    """Период из параметров запроса: period, from, to"""
+    return filter_period(
+        queryset,
+        params.get('period', default),
+        params.get('from'),
+        params.get('to'),
+        field=field,
+    )
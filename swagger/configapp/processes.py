@@ -0,0 +1,37 @@
+"""
+Пул процессов для пакетных команд (генерация данных, сверка балансов).
+
+Процессы создаются через fork: дочерним нужны настроенный Django и модели
+родителя. Где fork недоступен, задачи выполняются в текущем процессе.
+"""
+
+import multiprocessing
+
+from django.db import connections
+
+
+def pool_size(workers, jobs):
+    """Число процессов: не больше задач, по умолчанию - число ядер; 1 без fork"""
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return 1
+    return max(1, min(workers or multiprocessing.cpu_count(), jobs or 1))
+
+
+def _init_worker():
+    # Соединения, унаследованные от родителя при fork, использовать нельзя
+    connections.close_all()
+
+
+def imap_unordered(func, tasks, workers):
+    """Результаты func по задачам по мере готовности (workers == 1 - в текущем процессе)"""
+    if workers == 1:
+        yield from map(func, tasks)
+        return
+
+    connections.close_all()
+    pool = multiprocessing.get_context('fork').Pool(workers, initializer=_init_worker)
+    try:
+        yield from pool.imap_unordered(func, tasks)
+    finally:
+        pool.close()
+        pool.join()
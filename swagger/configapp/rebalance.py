@@ -0,0 +1,169 @@
+"""
+Перенос данных пользователей между шардами.
+
+Шард пользователя вычисляется по его id (sharding.shard_for), поэтому после
+изменения SHARDS часть пользователей оказывается не в своём шарде. Их
+находит misplaced(): пользователи с данными в БД, которая не совпадает с
+вычисленным шардом, в том числе в default, если шардирование включено на
+существующей БД. move_user() копирует категории, счета, транзакции (и
+архивные), регулярные платежи и сводку в целевой шард и удаляет их из
+исходной БД. sync_users() записывает копии всех пользователей в их шарды -
+и тех, у кого ещё нет данных, - чтобы их первые записи в новом шарде не
+нарушали внешние ключи.
+
+Строки копируются со своими id: шарды выдают id из непересекающихся
+диапазонов (sharding.id_range). Копия в целевом шарде фиксируется раньше
+удаления в исходной БД, поэтому прерванный перенос оставляет данные в
+обеих, а не ни в одной; повторный запуск дописывает недостающие строки
+(строки с уже существующими id пропускаются) и удаляет исходные.
+Индекс поиска в целевом шарде заполняют триггеры при вставке транзакций.
+"""
+
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import choices, retry, sharding, user_cache
+from .models import (
+    Account, ArchivedTransaction, Category, RecurringPayment, Transaction, TransactionRollup,
+)
+
+BATCH_SIZE = 1000
+
+Move = namedtuple('Move', 'user_id source target')
+
+
+def users_in(alias):
+    """id пользователей, у которых есть счета или категории в БД alias"""
+    accounts = Account.objects.using(alias).values_list('user_id', flat=True).distinct()
+    categories = Category.objects.using(alias).values_list('user_id', flat=True).distinct()
+    return set(accounts) | set(categories)
+
+
+def misplaced(user_ids=None):
+    """Переносы (пользователь, где лежат данные, где должны) для текущих SHARDS"""
+    for alias in [DEFAULT_DB_ALIAS, *sharding.shards()]:
+        for user_id in sorted(users_in(alias)):
+            if user_ids and user_id not in user_ids:
+                continue
+            target = sharding.shard_for(user_id)
+            if target != alias:
+                yield Move(user_id, alias, target)
+
+
+def sync_users(user_ids=None):
+    """
+    Записать копии пользователей в их шарды и удалить копии без данных из
+    чужих шардов (копии с данными удаляет move_user); возвращает число пользователей.
+    """
+    users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    if user_ids:
+        users = users.filter(pk__in=user_ids)
+    synced = 0
+    for batch in _batches(users, BATCH_SIZE):
+        sharding.copy_users(batch)
+        synced += len(batch)
+    for alias in sharding.shards():
+        copies = User.objects.using(alias)
+        if user_ids:
+            copies = copies.filter(pk__in=user_ids)
+        stale = {
+            user_id for user_id in copies.values_list('pk', flat=True)
+            if sharding.shard_for(user_id) != alias
+        } - users_in(alias)
+        if stale:
+            User.objects.using(alias).filter(pk__in=stale).delete()
+    return synced
+
+
+def _batches(queryset, size):
+    """Строки queryset списками по size"""
+    batch = []
+    for row in queryset.iterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy(model, rows, target):
+    """Вставить строки в шард target с их id (уже существующие id пропускаются); возвращает число строк"""
+    _, end = sharding.id_range(target)
+    if any(row.pk >= end for row in rows):
+        # Такие id шард target выдаст сам - перенос нарушил бы их уникальность
+        raise ValueError(f'id {model._meta.label} выше диапазона шарда {target}: уменьшать число шардов нельзя')
+    # bulk_create проставляет auto_now_add заново - исходные значения возвращаем следом
+    stamps = [field.attname for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    old_stamps = [[getattr(row, name) for name in stamps] for row in rows]
+    created = model.objects.using(target).bulk_create(rows, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    if stamps:
+        for row, values in zip(created, old_stamps):
+            for name, value in zip(stamps, values):
+                setattr(row, name, value)
+        model.objects.using(target).bulk_update(created, stamps, batch_size=BATCH_SIZE)
+    return len(rows)
+
+
+def _delete_sql(connection, model, column, user_id_sql):
+    quote = connection.ops.quote_name
+    return f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({user_id_sql})'
+
+
+def _delete_user_data(alias, user_id):
+    """
+    Удалить данные пользователя из БД alias без сборки объектов: каскад ORM
+    загрузил бы каждую транзакцию ради сигналов, которые здесь не нужны.
+    """
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    accounts = (
+        f'SELECT {quote(Account._meta.pk.column)} FROM {quote(Account._meta.db_table)}'
+        f' WHERE {quote(Account._meta.get_field("user").column)} = %s'
+    )
+    statements = [
+        _delete_sql(connection, ArchivedTransaction, ArchivedTransaction._meta.get_field('account').column, accounts),
+        _delete_sql(connection, Transaction, Transaction._meta.get_field('account').column, accounts),
+        _delete_sql(connection, RecurringPayment, RecurringPayment._meta.get_field('account').column, accounts),
+        _delete_sql(connection, TransactionRollup, TransactionRollup._meta.get_field('account').column, accounts),
+        _delete_sql(connection, Account, Account._meta.get_field('user').column, '%s'),
+        _delete_sql(connection, Category, Category._meta.get_field('user').column, '%s'),
+    ]
+    # В default хранится сам пользователь, а не копия
+    if alias != DEFAULT_DB_ALIAS:
+        statements.append(_delete_sql(connection, User, User._meta.pk.column, '%s'))
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql, [user_id])
+
+
+def _user_rows(source, user_id):
+    """(модель, queryset) данных пользователя в БД source в порядке вставки"""
+    yield Category, Category.objects.using(source).filter(user_id=user_id)
+    yield Account, Account.objects.using(source).filter(user_id=user_id)
+    for model in (Transaction, ArchivedTransaction, RecurringPayment):
+        yield model, model.objects.using(source).filter(account__user_id=user_id)
+    yield TransactionRollup, TransactionRollup.objects.using(source).filter(user_id=user_id)
+
+
+@retry.on_lock
+def move_user(user_id, source, target):
+    """Перенести данные пользователя из БД source в шард target; возвращает число перенесённых транзакций"""
+    user = User.objects.get(pk=user_id)
+    moved = 0
+    # Внутренний блок (target) фиксируется первым: удаление в source - только после надёжной копии
+    with transaction.atomic(using=source), transaction.atomic(using=target):
+        sharding.copy_users([user], alias=target)
+        for model, queryset in _user_rows(source, user_id):
+            for batch in _batches(queryset.order_by('pk'), BATCH_SIZE):
+                copied = _copy(model, batch, target)
+                if model in (Transaction, ArchivedTransaction):
+                    moved += copied
+        _delete_user_data(source, user_id)
+
+    # Кешированные ответы и списки выбора строились по исходной БД
+    user_cache.bump(user_id)
+    choices.bump(user_id)
+    return moved
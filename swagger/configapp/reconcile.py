@@ -0,0 +1,100 @@
+"""
+Сверка сохранённых балансов счетов с журналом транзакций.
+
+Ожидаемый баланс счета - начальный (opening_balance) плюс изменения всех
+его транзакций. Счета обходятся пачками по диапазонам id (keyset), для
+каждой пачки (в пределах одного шарда) ожидаемые балансы считаются одним сгруппированным запросом,
+который возвращает только счета с расхождением, поэтому память не
+зависит от числа счетов. Пачки распределяются по пулу процессов.
+
+Исправление сдвигает баланс на величину расхождения (F('balance') + drift),
+а не записывает вычисленное значение: проводка, успевшая пройти между
+сверкой и исправлением, меняет баланс и журнал одинаково и не теряется.
+"""
+
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import balances, ledger, processes, retry, sharding, user_cache
+from .models import Account
+
+BATCH_SIZE = 1000
+# Расхождения меньше полкопейки - погрешность суммирования, а не ошибка
+TOLERANCE = Decimal('0.005')
+CENT = Decimal('0.01')
+
+Drift = namedtuple('Drift', 'account_id user_id currency balance expected drift')
+
+
+def account_batches(batch_size=BATCH_SIZE, user_ids=None):
+    """Диапазоны (первый id, последний id, счетов) по batch_size счетов"""
+    accounts = Account.objects.order_by('pk')
+    if user_ids:
+        accounts = accounts.filter(user_id__in=user_ids)
+    last_id = 0
+    while True:
+        ids = list(accounts.filter(pk__gt=last_id).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids[0], ids[-1], len(ids)
+        last_id = ids[-1]
+
+
+def find_drifts(first_id, last_id, user_ids=None):
+    """Счета диапазона с расхождением - один запрос с группировкой по счету"""
+    accounts = Account.objects.filter(pk__gte=first_id, pk__lte=last_id)
+    if user_ids:
+        accounts = accounts.filter(user_id__in=user_ids)
+    rows = (
+        accounts
+        .annotate(expected=F('opening_balance') + ledger.delta_sum('transactions__'))
+        .annotate(drift=F('expected') - F('balance'))
+        .filter(Q(drift__gte=TOLERANCE) | Q(drift__lte=-TOLERANCE))
+        .order_by('pk')
+        .values_list('pk', 'user_id', 'currency', 'balance', 'expected')
+    )
+    return [
+        Drift(pk, user_id, currency, balance, expected.quantize(CENT), expected.quantize(CENT) - balance)
+        for pk, user_id, currency, balance, expected in rows
+    ]
+
+
+@retry.on_lock
+def fix_drifts(drifts):
+    """Сдвинуть балансы на расхождение и пересчитать остатки транзакций (счета текущего шарда)"""
+    with transaction.atomic(using=sharding.current_db()):
+        accounts = []
+        for drift in drifts:
+            account = Account(pk=drift.account_id)
+            account.balance = F('balance') + drift.drift
+            account.version = F('version') + 1
+            accounts.append(account)
+        Account.objects.bulk_update(accounts, ['balance', 'version'])
+        for drift in drifts:
+            balances.rebuild(drift.account_id)
+    for user_id in {drift.user_id for drift in drifts}:
+        user_cache.bump(user_id)
+
+
+def check_batch(task):
+    """Сверить (и при fix исправить) пачку; возвращает (счетов, расхождения)"""
+    alias, first_id, last_id, count, user_ids, fix = task
+    with sharding.using_shard(alias):
+        drifts = find_drifts(first_id, last_id, user_ids)
+        if fix and drifts:
+            fix_drifts(drifts)
+    return count, drifts
+
+
+def reconcile(batch_size=BATCH_SIZE, workers=None, fix=False, user_ids=None):
+    """Сверить балансы; отдаёт (счетов в пачке, расхождения пачки) по мере готовности"""
+    # Пачка - три числа, так что список границ мал даже для миллионов счетов
+    tasks = [
+        (alias, first_id, last_id, count, user_ids, fix)
+        for alias in sharding.each_shard()
+        for first_id, last_id, count in account_batches(batch_size, user_ids)
+    ]
+    yield from processes.imap_unordered(check_batch, tasks, processes.pool_size(workers, len(tasks)))
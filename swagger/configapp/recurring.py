@@ -0,0 +1,116 @@
+"""
+Исполнение регулярных платежей.
+
+Платежи к исполнению выбираются по индексу (is_active, next_run_at)
+пачками. Для каждой пачки в одной транзакции БД создаются транзакции
+за все пропущенные периоды, одним F()-обновлением на счет меняются
+балансы, пересчитываются остатки после новых транзакций и сдвигается
+next_run_at. Прерванный запуск ничего не
+оставляет наполовину, а повторный продолжает с того же места.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import balances, ledger, periods, retry, rollups, schedules, sharding, user_cache
+from .models import RecurringPayment, Transaction
+
+BATCH_SIZE = 500
+# Сколько пропущенных периодов одного платежа догоняем за один проход пачки;
+# остаток будет выбран следующей пачкой
+MAX_CATCH_UP = 366
+
+
+def due_payments(now):
+    return RecurringPayment.objects.filter(is_active=True, next_run_at__lte=now)
+
+
+def _transaction_type(payment):
+    if payment.category is not None and payment.category.type == 'income':
+        return 'income'
+    return 'expense'
+
+
+def execute_payment(payment, now):
+    """Транзакции за все наступившие даты платежа; сдвигает next_run_at"""
+    transactions = []
+    run_at = payment.next_run_at
+    while run_at is not None and run_at <= now and len(transactions) < MAX_CATCH_UP:
+        transactions.append(Transaction(
+            account_id=payment.account_id,
+            category_id=payment.category_id,
+            type=_transaction_type(payment),
+            amount=payment.amount,
+            description=payment.description,
+            date=run_at,
+        ))
+        payment.last_executed = run_at
+        day = schedules.occurrence_after(payment.frequency, payment.start_date, timezone.localdate(run_at))
+        run_at = None if payment.end_date and day > payment.end_date else periods.day_start(day)
+    payment.next_run_at = run_at
+    return transactions
+
+
+@retry.on_lock
+def run_batch(now, batch_size=BATCH_SIZE):
+    """Исполнить одну пачку платежей текущего шарда; возвращает (платежей, транзакций)"""
+    with transaction.atomic(using=sharding.current_db()):
+        payments = list(
+            due_payments(now)
+            .select_related('account', 'category')
+            .order_by('next_run_at', 'id')[:batch_size]
+        )
+        if not payments:
+            return 0, 0
+
+        created = []
+        deltas = defaultdict(Decimal)
+        rollup_deltas = None
+        for payment in payments:
+            transactions = execute_payment(payment, now)
+            created.extend(transactions)
+            for txn in transactions:
+                deltas[txn.account_id] += ledger.balance_delta(txn.type, txn.amount)
+            rollup_deltas = rollups.group_rows(
+                (
+                    {
+                        'user_id': payment.account.user_id,
+                        'account_id': txn.account_id,
+                        'category_id': txn.category_id,
+                        'type': txn.type,
+                        'date': txn.date,
+                        'amount': txn.amount,
+                    }
+                    for txn in transactions
+                ),
+                deltas=rollup_deltas,
+            )
+
+        starts = ledger.insert_transactions(created)
+        for account_id, delta in deltas.items():
+            ledger.apply_balance_delta(account_id, delta)
+        balances.recalculate_from(starts)
+        if rollup_deltas:
+            rollups.apply_grouped(rollup_deltas)
+        RecurringPayment.objects.bulk_update(payments, ['next_run_at', 'last_executed'], batch_size=1000)
+
+    for user_id in {payment.account.user_id for payment in payments}:
+        user_cache.bump(user_id)
+    return len(payments), len(created)
+
+
+def run_due_payments(now=None, batch_size=BATCH_SIZE):
+    """Исполнить все наступившие платежи; возвращает (платежей, транзакций)"""
+    now = now or timezone.now()
+    total_payments = total_transactions = 0
+    for _ in sharding.each_shard():
+        while True:
+            payments, transactions = run_batch(now, batch_size)
+            if not payments:
+                break
+            total_payments += payments
+            total_transactions += transactions
+    return total_payments, total_transactions
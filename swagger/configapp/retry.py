@@ -0,0 +1,65 @@
+"""
+Повтор записи, упавшей с "database is locked".
+
+SQLite допускает одного писателя. Если блокировку не удалось получить за
+timeout соединения (или SQLite вернул SQLITE_BUSY сразу, чтобы избежать
+взаимной блокировки), транзакция откатывается целиком, и её можно
+безопасно выполнить заново после паузы. Пауза растёт экспоненциально со
+случайным разбросом, чтобы повторы конкурентов не совпадали.
+
+Повторяется только внешняя транзакция: внутри чужого atomic() откат
+затронул бы и то, что выполнено до вызова, поэтому там ошибка пробрасывается.
+"""
+
+import functools
+import random
+import time
+
+from django.db import OperationalError, connections
+
+from . import metrics
+
+ATTEMPTS = 5
+BASE_DELAY = 0.05
+MAX_DELAY = 1.0
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return any(text in message for text in LOCK_MESSAGES)
+
+
+def delay(attempt):
+    """Пауза перед повтором номер attempt (с нуля)"""
+    return min(MAX_DELAY, BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1)
+
+
+def in_atomic_block():
+    """Открыт ли atomic() на каком-либо соединении (в том числе на шарде)"""
+    return any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+
+
+def on_lock(func=None, *, attempts=ATTEMPTS):
+    """Декоратор: повторить func при блокировке БД (до attempts попыток)"""
+    def decorator(func):
+        operation = f'{func.__module__.rsplit(".", 1)[-1]}.{func.__name__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if (
+                        attempt == attempts - 1
+                        or not is_lock_error(exc)
+                        or in_atomic_block()
+                    ):
+                        raise
+                metrics.db_lock_retries.inc((operation,))
+                time.sleep(delay(attempt))
+        return wrapper
+
+    return decorator if func is None else decorator(func)
@@ -0,0 +1,184 @@
+"""
+Дневные сводки транзакций (TransactionRollup).
+
+Сводка хранит сумму и количество транзакций в разрезе
+(пользователь, счет, категория, тип, день) и обновляется инкрементально
+при создании, изменении и удалении транзакций. Дашборд и статистика
+читают только сводку, поэтому их стоимость не растёт вместе с историей.
+"""
+
+import heapq
+import itertools
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import sharding
+from .models import ArchivedTransaction, Transaction, TransactionRollup
+
+
+def rollup_day(value):
+    """День транзакции в текущем часовом поясе"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localdate(value)
+
+
+def apply_delta(user_id, account_id, category_id, type, day, amount, count):
+    """Прибавить сумму и количество к строке сводки (создаёт строку при необходимости)"""
+    lookup = {
+        'account_id': account_id,
+        'category_id': category_id,
+        'type': type,
+        'day': day,
+    }
+    updated = TransactionRollup.objects.filter(**lookup).update(
+        total=F('total') + amount,
+        count=F('count') + count,
+    )
+    if not updated:
+        try:
+            with transaction.atomic(using=sharding.db_for_user(user_id)):
+                TransactionRollup.objects.create(user_id=user_id, total=amount, count=count, **lookup)
+        except IntegrityError:
+            # Строку успел создать параллельный запрос
+            TransactionRollup.objects.filter(**lookup).update(
+                total=F('total') + amount,
+                count=F('count') + count,
+            )
+    elif count < 0:
+        TransactionRollup.objects.filter(count__lte=0, **lookup).delete()
+
+
+def merge_into_uncategorized(category):
+    """
+    Перенести строки сводки категории в строки «без категории» тремя
+    запросами при любом числе строк: прибавить к существующим, удалить
+    перенесённые, у остальных обнулить категорию
+    """
+    rows = TransactionRollup.objects.filter(category=category)
+    same_key = rows.filter(account_id=OuterRef('account_id'), type=OuterRef('type'), day=OuterRef('day'))
+    TransactionRollup.objects.filter(user_id=category.user_id, category__isnull=True).filter(Exists(same_key)).update(
+        total=F('total') + Subquery(same_key.values('total')[:1]),
+        count=F('count') + Subquery(same_key.values('count')[:1]),
+    )
+    uncategorized = TransactionRollup.objects.filter(
+        account_id=OuterRef('account_id'), category__isnull=True, type=OuterRef('type'), day=OuterRef('day'),
+    )
+    rows.filter(Exists(uncategorized)).delete()
+    rows.update(category=None)
+
+
+def group_rows(rows, sign=1, deltas=None):
+    """
+    Сгруппировать транзакции по ключу сводки.
+
+    rows - словари с ключами user_id, account_id, category_id, type, date, amount.
+    Можно передать уже накопленный deltas, чтобы добавлять строки пачками.
+    """
+    if deltas is None:
+        deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for row in rows:
+        key = (row['user_id'], row['account_id'], row['category_id'], row['type'], rollup_day(row['date']))
+        deltas[key][0] += sign * Decimal(row['amount'])
+        deltas[key][1] += sign
+    return deltas
+
+
+def apply_grouped(deltas):
+    """Применить сгруппированные изменения: один UPDATE на ключ сводки"""
+    for (user_id, account_id, category_id, type, day), (amount, count) in deltas.items():
+        apply_delta(user_id, account_id, category_id, type, day, amount, count)
+
+
+def apply_rows(rows, sign=1):
+    """Применить к сводке набор транзакций"""
+    apply_grouped(group_rows(rows, sign))
+
+
+def _grouped(transactions):
+    """Суммы по (счет, категория, тип, день), отсортированные по этому ключу"""
+    return transactions.annotate(day=TruncDate('date')).values(
+        'account__user_id', 'account_id', 'category_id', 'type', 'day'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by(
+        'account_id', F('category_id').asc(nulls_first=True), 'type', 'day'
+    )
+
+
+def _group_key(row):
+    # Порядок совпадает с ORDER BY в _grouped: категория NULL - первой
+    return (row['account_id'], row['category_id'] or 0, row['type'], row['day'])
+
+
+def _merged(hot, archived, chunk_size):
+    """Суммы рабочей таблицы и архива; день на границе архива есть в обеих"""
+    rows = heapq.merge(
+        hot.iterator(chunk_size=chunk_size), archived.iterator(chunk_size=chunk_size), key=_group_key,
+    )
+    for _, group in itertools.groupby(rows, key=_group_key):
+        first, *rest = group
+        for row in rest:
+            first['total'] += row['total']
+            first['count'] += row['count']
+        yield first
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    """Пересобрать сводку из таблиц транзакций и архива (полностью или для указанных пользователей)"""
+    rollups = TransactionRollup.objects.all()
+    transactions = Transaction.objects.all()
+    archived = ArchivedTransaction.objects.all()
+    if user_ids is not None:
+        rollups = rollups.filter(user_id__in=user_ids)
+        transactions = transactions.filter(account__user_id__in=user_ids)
+        archived = archived.filter(account__user_id__in=user_ids)
+
+    hot, archived = _grouped(transactions), _grouped(archived)
+
+    created = 0
+    # Запросы ленивые: в каждом шарде выполняются заново
+    for alias in sharding.each_shard():
+        with transaction.atomic(using=alias):
+            rollups.delete()
+            batch = []
+            for row in _merged(hot, archived, batch_size):
+                batch.append(TransactionRollup(
+                    user_id=row['account__user_id'],
+                    account_id=row['account_id'],
+                    category_id=row['category_id'],
+                    type=row['type'],
+                    day=row['day'],
+                    total=row['total'],
+                    count=row['count'],
+                ))
+                if len(batch) >= batch_size:
+                    TransactionRollup.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            if batch:
+                TransactionRollup.objects.bulk_create(batch)
+                created += len(batch)
+    return created
+
+
+def for_user(user):
+    """Сводка текущего пользователя"""
+    return TransactionRollup.objects.filter(user=user)
+
+
+def month_start(today=None):
+    """Первый день текущего месяца"""
+    today = today or timezone.localdate()
+    return today.replace(day=1)
+
+
+def period_total(user, type, start, end=None):
+    """Сумма транзакций типа type за дни [start, end]"""
+    rollups = for_user(user).filter(type=type, day__gte=start)
+    if end is not None:
+        rollups = rollups.filter(day__lte=end)
+    return rollups.aggregate(Sum('total'))['total__sum'] or 0
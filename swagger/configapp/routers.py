@@ -0,0 +1,48 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from . import analytics, sharding
+
+
+class ShardRouter:
+    """Данные пользователей - в шард пользователя, остальные модели - в default (см. sharding)"""
+
+    def _db(self, model, **hints):
+        if not sharding.enabled():
+            return None
+        if not sharding.is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        return sharding.shard_from_hints(hints) or sharding.current_shard()
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding.enabled():
+            return None
+        if sharding.is_sharded(type(obj1)) and sharding.is_sharded(type(obj2)):
+            return obj1._state.db == obj2._state.db
+        # Пользователь из default и его данные из шарда
+        return True
+
+
+class AnalyticsRouter:
+    """Отчёты (внутри analytics.reporting()) читают из реплики, всё остальное - основная БД"""
+
+    def db_for_read(self, model, **hints):
+        alias = analytics.current_alias()
+        return alias if alias == analytics.ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной БД, связи между их объектами допустимы
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, analytics.ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема реплики приходит вместе с копией
+        if db == analytics.ALIAS:
+            return False
+        return None
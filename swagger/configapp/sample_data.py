@@ -0,0 +1,24 @@
+"""
+Категории, которые получает пример пользователя.
+
+Используются командой init_data (и скриптом init_data.py), а также
+генератором нагрузочных данных (loadgen).
+"""
+
+# Категории расходов
+EXPENSE_CATEGORIES = [
+    {"name": "Еда", "icon": "🍔", "color": "#FF6B6B"},
+    {"name": "Транспорт", "icon": "🚗", "color": "#4ECDC4"},
+    {"name": "Развлечения", "icon": "🎮", "color": "#45B7D1"},
+    {"name": "Коммунальные услуги", "icon": "💡", "color": "#FFA07A"},
+    {"name": "Здоровье", "icon": "⚕️", "color": "#98D8C8"},
+    {"name": "Одежда", "icon": "👔", "color": "#F7DC6F"},
+]
+
+# Категории доходов
+INCOME_CATEGORIES = [
+    {"name": "Зарплата", "icon": "💼", "color": "#52C41A"},
+    {"name": "Фриланс", "icon": "💻", "color": "#1890FF"},
+    {"name": "Инвестиции", "icon": "📈", "color": "#722ED1"},
+    {"name": "Подарки", "icon": "🎁", "color": "#EB2F96"},
+]
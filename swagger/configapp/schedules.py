@@ -0,0 +1,42 @@
+"""
+Календарь регулярных платежей.
+
+Даты выплат считаются от start_date без накопления сдвига: платёж от
+31 января выполняется 28/29 февраля и снова 31 марта.
+"""
+
+import calendar
+from datetime import timedelta
+
+
+def add_months(day, months, anchor_day=None):
+    """Сдвинуть дату на months месяцев, прижимая день к концу месяца"""
+    anchor_day = anchor_day or day.day
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    month += 1
+    return day.replace(year=year, month=month, day=min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_after(frequency, start_date, after=None):
+    """
+    Первая дата выплаты строго после after (или start_date, если after не задан).
+
+    Считается арифметически, без перебора пропущенных периодов.
+    """
+    if after is None or after < start_date:
+        return start_date
+    if frequency == 'daily':
+        return after + timedelta(days=1)
+    if frequency == 'weekly':
+        weeks = (after - start_date).days // 7 + 1
+        return start_date + timedelta(weeks=weeks)
+    step = 12 if frequency == 'yearly' else 1
+    months = (after.year - start_date.year) * 12 + after.month - start_date.month
+    months -= months % step
+    candidate = add_months(start_date, months)
+    while candidate <= after:
+        months += step
+        candidate = add_months(start_date, months)
+    return candidate
+
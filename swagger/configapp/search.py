@@ -0,0 +1,49 @@
+"""
+Полнотекстовый поиск по описаниям транзакций.
+
+В SQLite описания индексируются виртуальной таблицей FTS5
+(TransactionSearch), которую триггеры держат в согласии с таблицей
+транзакций. Каждое слово запроса ищется как префикс, результаты
+упорядочены по релевантности (bm25). В индексе вместе с описанием лежит
+токен владельца, поэтому MATCH сразу отбирает только транзакции
+пользователя и не проходит по чужим совпадениям. На других СУБД поиск
+сводится к icontains по каждому слову.
+"""
+
+import re
+
+from django.db import connections
+
+# Больше слов почти не сужает выдачу, а запрос становится дороже
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+_TERM = re.compile(r'\w+')
+
+
+def terms(q):
+    """Слова запроса в нижнем регистре, без повторов"""
+    return list(dict.fromkeys(term.lower() for term in _TERM.findall(q or '')))[:MAX_TERMS]
+
+
+def owner_token(user_id):
+    return f'u{user_id}'
+
+
+def match_expression(user_id, words):
+    """Выражение FTS5: транзакции владельца, описание содержит все слова как префиксы"""
+    phrases = ' '.join(f'description:"{word}"*' for word in words)
+    return f'owner:"{owner_token(user_id)}" {phrases}'
+
+
+def search(queryset, user, q):
+    """Транзакции queryset, описание которых содержит все слова q; сначала релевантные"""
+    words = terms(q)
+    if connections[queryset.db].vendor == 'sqlite':
+        return queryset.filter(
+            search_entry__document__match=match_expression(user.pk, words),
+        ).order_by('search_entry__rank', '-date', '-pk')
+    for word in words:
+        queryset = queryset.filter(description__icontains=word)
+    return queryset.order_by('-date', '-pk')
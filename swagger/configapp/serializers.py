@@ -1,6 +1,14 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Prefetch, prefetch_related_objects
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema_field
 from .models import Account, Category, Transaction, RecurringPayment
+from .pagination import KeysetPagination
+from . import ledger
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -62,22 +70,29 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = [
             'id', 'account', 'account_name', 'category', 'category_name',
-            'type', 'type_display', 'amount', 'description', 'date', 'created_at'
+            'type', 'type_display', 'amount', 'balance_after', 'description', 'date', 'created_at'
         ]
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'balance_after', 'created_at']
 
     def create(self, validated_data):
-        transaction = Transaction.objects.create(**validated_data)
-        account = transaction.account
+        # Вставка и атомарное обновление баланса счета
+        return ledger.create_transaction(**validated_data)
+
+    def update(self, instance, validated_data):
+        # Разница сумм переносится на баланс счетов вместе с сохранением
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        return ledger.update_transaction(instance)
 
-        # Обновляем баланс счета
-        if transaction.type == 'income':
-            account.balance += transaction.amount
-        elif transaction.type == 'expense':
-            account.balance -= transaction.amount
-        account.save()
 
-        return transaction
+class TransactionImportRowSerializer(serializers.Serializer):
+    """Строка массового импорта транзакций (CSV/NDJSON)"""
+    account = serializers.IntegerField()
+    category = serializers.IntegerField(required=False, allow_null=True)
+    type = serializers.ChoiceField(choices=Transaction.TRANSACTION_TYPES)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    description = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    date = serializers.DateTimeField(required=False)
 
 
 class RecurringPaymentSerializer(serializers.ModelSerializer):
@@ -91,17 +106,60 @@ class RecurringPaymentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'account', 'account_name', 'category', 'category_name',
             'amount', 'description', 'frequency', 'frequency_display',
-            'start_date', 'end_date', 'is_active', 'last_executed'
+            'start_date', 'end_date', 'is_active', 'last_executed', 'next_run_at'
         ]
-        read_only_fields = ['id', 'last_executed']
+        read_only_fields = ['id', 'last_executed', 'next_run_at']
 
 
 class AccountDetailSerializer(serializers.ModelSerializer):
-    """Детальный сериализатор для счета с транзакциями"""
-    transactions = TransactionSerializer(many=True, read_only=True)
+    """
+    Детальный сериализатор для счета с последними транзакциями.
+
+    Вложенный список ограничен окном ACCOUNT_DETAIL_TRANSACTIONS, а
+    transactions_next ведёт на курсорную историю счета с места, где окно
+    закончилось.
+    """
+    transactions = serializers.SerializerMethodField()
+    transactions_next = serializers.SerializerMethodField()
     currency_display = serializers.CharField(source='get_currency_display', read_only=True)
 
     class Meta:
         model = Account
-        fields = ['id', 'name', 'balance', 'currency', 'currency_display', 'icon', 'created_at', 'transactions']
-        read_only_fields = ['id', 'created_at', 'transactions']
+        fields = [
+            'id', 'name', 'balance', 'currency', 'currency_display', 'icon', 'created_at',
+            'transactions', 'transactions_next'
+        ]
+        read_only_fields = ['id', 'created_at', 'transactions', 'transactions_next']
+
+    @staticmethod
+    def recent_limit():
+        return settings.ACCOUNT_DETAIL_TRANSACTIONS
+
+    @classmethod
+    def prefetch_transactions(cls):
+        """Последние транзакции счетов одним запросом (на одну больше окна)"""
+        return Prefetch(
+            'transactions',
+            queryset=Transaction.objects.select_related('category')
+            .order_by('-date', '-id')[:cls.recent_limit() + 1],
+            to_attr='recent_transactions',
+        )
+
+    def _recent(self, account):
+        if not hasattr(account, 'recent_transactions'):
+            prefetch_related_objects([account], self.prefetch_transactions())
+        return account.recent_transactions
+
+    @extend_schema_field(TransactionSerializer(many=True))
+    def get_transactions(self, account):
+        recent = self._recent(account)[:self.recent_limit()]
+        return TransactionSerializer(recent, many=True, context=self.context).data
+
+    @extend_schema_field(OpenApiTypes.URI)
+    def get_transactions_next(self, account):
+        recent = self._recent(account)
+        limit = self.recent_limit()
+        if len(recent) <= limit:
+            return None
+        url = reverse('account-transactions', args=[account.pk], request=self.context.get('request'))
+        return replace_query_param(url, KeysetPagination.cursor_query_param, KeysetPagination.encode_cursor(recent[limit - 1]))
@@ -0,0 +1,206 @@
+"""
+Данные пользователей в нескольких файлах БД (шардах).
+
+settings.SHARDS - псевдонимы БД-шардов; пустой список - шардирования нет
+и всё хранится в default. Счета, категории, транзакции, регулярные
+платежи и сводка пользователя лежат в одном шарде, который вычисляется по
+id пользователя (jump consistent hash): карта детерминирована, а при
+добавлении шарда переезжает лишь около 1/N пользователей. Пользователи,
+токены, сессии и курсы валют остаются в default. Копия строки пользователя
+хранится и в его шарде, чтобы внешние ключи и соединения с auth_user
+работали внутри шарда.
+
+Шард для запроса выбирает ShardRouter: по объекту из подсказок роутера,
+по явно выбранному шарду (using_shard) или по пользователю текущего
+HTTP-запроса (ShardMiddleware). Обращение к данным пользователей без
+выбранного шарда - ошибка ShardNotSelected, а не тихое чтение из default.
+
+id строк уникальны во всех шардах: каждый шард выдаёт id из своего
+диапазона (seed_sequences), default - из первого. Поэтому данные
+переносятся между шардами (rebalance) со своими id, и ссылки клиентов на
+счета и транзакции, курсоры и ETag после переноса остаются верными.
+"""
+
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, models, router, transaction
+
+SHARDED_MODELS = frozenset({
+    'configapp.account',
+    'configapp.category',
+    'configapp.transaction',
+    'configapp.archivedtransaction',
+    'configapp.recurringpayment',
+    'configapp.transactionrollup',
+    'configapp.transactionsearch',
+})
+
+# Размер диапазона id одного шарда: id остаются точными и в JavaScript (до 2**53)
+ID_RANGE = 2 ** 40
+
+_shard = contextvars.ContextVar('shard', default=None)
+_request = contextvars.ContextVar('shard_request', default=None)
+
+
+class ShardNotSelected(RuntimeError):
+    """Запрос к данным пользователей, когда шард не выбран"""
+
+
+def shards():
+    return list(settings.SHARDS)
+
+
+def enabled():
+    return bool(settings.SHARDS)
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping, Veach): номер корзины 0..buckets-1 для ключа"""
+    key &= 0xFFFFFFFFFFFFFFFF
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(user_id, aliases=None):
+    """Шард пользователя"""
+    aliases = shards() if aliases is None else aliases
+    return aliases[jump_hash(int(user_id), len(aliases))]
+
+
+def id_range(alias):
+    """Диапазон [начало, конец) id, которые выдаёт БД alias"""
+    index = shards().index(alias) + 1 if alias in shards() else 0
+    return index * ID_RANGE, (index + 1) * ID_RANGE
+
+
+def _sequence_tables():
+    return [
+        model._meta.db_table for model in apps.get_models()
+        if is_sharded(model) and model._meta.managed and isinstance(model._meta.pk, models.AutoField)
+    ]
+
+
+def seed_sequences(alias):
+    """
+    Сдвинуть счётчики AUTOINCREMENT таблиц шарда alias в начало его
+    диапазона id (счётчики, уже стоящие в диапазоне, не меняются).
+    """
+    start, _ = id_range(alias)
+    with connections[alias].cursor() as cursor:
+        for table in _sequence_tables():
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, start, table],
+            )
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
+
+
+def db_for_user(user_id):
+    """БД с данными пользователя (default без шардирования)"""
+    return shard_for(user_id) if enabled() else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def using_shard(alias):
+    """Обращения к данным пользователей внутри блока идут в шард alias"""
+    token = _shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _shard.reset(token)
+
+
+def for_user(user_id):
+    """Контекст шарда пользователя (без шардирования ничего не меняет)"""
+    return using_shard(shard_for(user_id)) if enabled() else nullcontext(DEFAULT_DB_ALIAS)
+
+
+@contextmanager
+def for_request(request):
+    """Шард берётся из пользователя запроса - при первом обращении к данным"""
+    token = _request.set(request)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def current_shard():
+    """Шард текущего контекста: явно выбранный или шард пользователя запроса"""
+    alias = _shard.get()
+    if alias is not None:
+        return alias
+    request = _request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return shard_for(user.pk)
+    raise ShardNotSelected('Шард не выбран: используйте sharding.using_shard() или sharding.for_user()')
+
+
+def current_db():
+    """БД данных пользователя в текущем контексте (default без шардирования)"""
+    return current_shard() if enabled() else DEFAULT_DB_ALIAS
+
+
+def shard_from_hints(hints):
+    """Шард по объекту из подсказок роутера или None"""
+    instance = hints.get('instance')
+    if instance is None:
+        return None
+    if isinstance(instance, User):
+        return shard_for(instance.pk) if instance.pk is not None else None
+    if instance._state.db in settings.SHARDS:
+        return instance._state.db
+    user_id = getattr(instance, 'user_id', None)
+    return shard_for(user_id) if user_id is not None else None
+
+
+def each_shard():
+    """Перебрать все БД с данными пользователей, выбирая каждую как текущую"""
+    if not enabled():
+        yield DEFAULT_DB_ALIAS
+        return
+    for alias in shards():
+        with using_shard(alias):
+            yield alias
+
+
+def atomic(instance=None):
+    """transaction.atomic() на БД данных пользователя (по объекту или текущему контексту)"""
+    if instance is not None:
+        return transaction.atomic(using=router.db_for_write(type(instance), instance=instance))
+    return transaction.atomic(using=current_db())
+
+
+def group_users(users):
+    """{БД данных: пользователи} с сохранением порядка (без шардирования - всё в default)"""
+    groups = {}
+    for user in users:
+        groups.setdefault(db_for_user(user.pk), []).append(user)
+    return groups
+
+
+def copy_users(users, alias=None):
+    """Записать копии строк пользователей в их шарды или в alias (вставка или обновление)"""
+    if not enabled():
+        return
+    fields = [field.name for field in User._meta.concrete_fields if not field.primary_key]
+    groups = group_users(users) if alias is None else {alias: list(users)}
+    for alias, shard_users in groups.items():
+        User.objects.using(alias).bulk_create(
+            [User(pk=user.pk, **{name: getattr(user, name) for name in fields}) for user in shard_users],
+            update_conflicts=True, unique_fields=['id'], update_fields=fields,
+        )
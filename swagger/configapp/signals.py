@@ -0,0 +1,167 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, QuerySet
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import choices, currency, ledger, middleware, rollups, sharding, user_cache
+from .models import Account, Category, CurrencyRate, RecurringPayment, Transaction
+
+ROLLUP_FIELDS = ('account_id', 'category_id', 'type', 'date', 'amount')
+
+
+def _deleted_directly(origin, model):
+    """Удаление начато с самого объекта модели (а не каскадом от счета/пользователя)"""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+def _rollup_row(values, instance):
+    """Строка для сводки из значений транзакции"""
+    row = {field: values[field] for field in ROLLUP_FIELDS}
+    if row['account_id'] == instance.account_id:
+        row['user_id'] = instance.account.user_id
+    else:
+        row['user_id'] = Account.objects.values_list('user_id', flat=True).get(pk=row['account_id'])
+    return row
+
+
+def _current_values(instance):
+    return {field: getattr(instance, field) for field in ROLLUP_FIELDS}
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_values(sender, instance, raw=False, **kwargs):
+    """Для транзакций, созданных не из БД, подгружаем прежние значения"""
+    if raw or instance.pk is None:
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and all(field in loaded for field in ROLLUP_FIELDS):
+        return
+    instance._loaded_values = Transaction.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_save(sender, instance, created, raw=False, **kwargs):
+    """Обновляем дневную сводку при создании и изменении транзакции"""
+    if raw:
+        return
+    old = None if created else getattr(instance, '_loaded_values', None)
+    current = _current_values(instance)
+    if old and all(old[field] == current[field] for field in ROLLUP_FIELDS):
+        return
+    if old:
+        rollups.apply_rows([_rollup_row(old, instance)], sign=-1)
+    rollups.apply_rows([_rollup_row(current, instance)])
+    instance._loaded_values = current
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_delete(sender, instance, origin=None, **kwargs):
+    """Вычитаем удалённую транзакцию из сводки"""
+    # При каскадном удалении счета или пользователя сводка удаляется вместе с ними
+    if not _deleted_directly(origin, Transaction):
+        return
+    values = getattr(instance, '_loaded_values', None) or _current_values(instance)
+    rollups.apply_rows([_rollup_row(values, instance)], sign=-1)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_accounts(sender, instance, raw=False, **kwargs):
+    """Запоминаем счета, которых касается изменение (транзакцию могли перенести)"""
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    instance._touched_account_ids = {instance.account_id, loaded.get('account_id', instance.account_id)}
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def touch_accounts_on_transaction_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Изменение транзакций меняет version счета (и его ETag)"""
+    if raw or (origin is not None and not _deleted_directly(origin, Transaction)):
+        return
+    ledger.touch_accounts(getattr(instance, '_touched_account_ids', None) or {instance.account_id})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def touch_accounts_on_category_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Название категории входит в ответы по счетам, поэтому меняем version всех счетов пользователя"""
+    if raw or (origin is not None and not _deleted_directly(origin, Category)):
+        return
+    Account.objects.filter(user_id=instance.user_id).update(version=F('version') + 1)
+
+
+@receiver(pre_delete, sender=Category)
+def merge_rollup_on_category_delete(sender, instance, origin=None, **kwargs):
+    """Переносим суммы удаляемой категории в строки «без категории»"""
+    if not _deleted_directly(origin, Category):
+        return
+    rollups.merge_into_uncategorized(instance)
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=RecurringPayment)
+@receiver(post_delete, sender=RecurringPayment)
+def bump_version_on_account_child_change(sender, instance, origin=None, using=None, **kwargs):
+    """Новая версия данных пользователя при изменении транзакций и регулярных платежей"""
+    # Каскадное удаление вместе со счетом обрабатывается сигналом счета
+    if origin is not None and not _deleted_directly(origin, sender):
+        return
+    user_id = instance.account.user_id
+    # Только после фиксации: иначе параллельный читатель закеширует под новой
+    # версией ещё не зафиксированное состояние
+    transaction.on_commit(lambda: user_cache.bump(user_id), using=using)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_version_on_user_change(sender, instance, using=None, **kwargs):
+    """Новая версия данных и списков выбора пользователя при изменении счетов и категорий"""
+    user_id = instance.user_id
+
+    def bump():
+        user_cache.bump(user_id)
+        choices.bump(user_id)
+
+    transaction.on_commit(bump, using=using)
+
+
+@receiver(post_save, sender=CurrencyRate)
+@receiver(post_delete, sender=CurrencyRate)
+def clear_rates_on_change(sender, instance, **kwargs):
+    """Изменённый курс сразу виден в этом процессе (в остальных - по истечении TTL)"""
+    currency.clear_rates()
+
+
+@receiver(post_save, sender=User)
+def copy_user_to_shard(sender, instance, raw=False, **kwargs):
+    """Копия пользователя в его шарде - для внешних ключей его данных"""
+    if raw or not sharding.enabled() or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    sharding.copy_users([instance])
+
+
+@receiver(post_delete, sender=User)
+def delete_user_from_shard(sender, instance, **kwargs):
+    """Удаление копии пользователя каскадно удаляет его данные в шарде"""
+    if not sharding.enabled() or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    User.objects.using(sharding.shard_for(instance.pk)).filter(pk=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def seed_shard_sequences(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """После migrate шард выдаёт id из своего диапазона"""
+    if sender.name == 'configapp' and using in sharding.shards():
+        sharding.seed_sequences(using)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Метрики запросов считают SQL каждого нового соединения"""
+    middleware.install_query_timer(connection)
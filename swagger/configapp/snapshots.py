@@ -0,0 +1,78 @@
+"""
+Снимок дашборда пользователя.
+
+Все итоги за сегодня и текущий месяц считаются одним запросом с условной
+агрегацией по дневной сводке, а общий баланс - по уже выбранным счетам, так что
+промах стоит трёх запросов: счета, последние операции и итоги. Готовый снимок
+хранится в версионированном кеше пользователя (user_cache) и устаревает при
+изменении его транзакций или счетов. При промахе снимок собирается из реплики
+для отчётов (analytics), если она подходит. Общий баланс считается в валюте
+отчёта, поэтому она и текущие курсы входят в ключ снимка.
+"""
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import analytics, currency, rollups, user_cache
+from .models import Account, Transaction
+
+SNAPSHOT_TIMEOUT = 60 * 60
+RECENT_TRANSACTIONS = 10
+
+
+def snapshot_params(reporting_currency, today=None):
+    today = today or timezone.localdate()
+    return f'{today.isoformat()}|{reporting_currency}|{currency.rates_token(currency.get_rates())}'
+
+
+def snapshot_key(user_id, reporting_currency, today=None):
+    return user_cache.key(user_id, 'dashboard', snapshot_params(reporting_currency, today))
+
+
+def period_totals(user, today=None):
+    """Доходы и расходы за сегодня и за месяц одним запросом"""
+    today = today or timezone.localdate()
+    month_start = rollups.month_start(today)
+
+    def total(type, **period):
+        return Sum('total', filter=Q(type=type, **period), default=0)
+
+    return rollups.for_user(user).filter(day__gte=month_start, day__lte=today).aggregate(
+        today_expenses=total('expense', day=today),
+        today_income=total('income', day=today),
+        month_expenses=total('expense'),
+        month_income=total('income'),
+    )
+
+
+def build_snapshot(user, reporting_currency, today=None):
+    """Собрать данные дашборда из БД"""
+    accounts = list(Account.objects.filter(user=user).order_by('id'))
+    recent_transactions = list(
+        Transaction.objects.filter(account__user=user)
+        .select_related('account', 'category')
+        .order_by('-date')[:RECENT_TRANSACTIONS]
+    )
+    return {
+        'accounts': accounts,
+        'first_account': accounts[0] if accounts else None,
+        # Счета уже загружены - общий баланс считается по ним без отдельного запроса
+        'total_balance': currency.loaded_total(accounts, reporting_currency),
+        'reporting_currency': reporting_currency,
+        'recent_transactions': recent_transactions,
+        **period_totals(user, today),
+    }
+
+
+def get_snapshot(user, reporting_currency):
+    """Снимок дашборда из кеша (или собранный заново при промахе)"""
+    today = timezone.localdate()
+
+    def build():
+        with analytics.reporting(user.pk):
+            return build_snapshot(user, reporting_currency, today)
+
+    return user_cache.cached(
+        user.pk, 'dashboard', build,
+        params=snapshot_params(reporting_currency, today), timeout=SNAPSHOT_TIMEOUT,
+    )
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F, Q, Sum
+from django.db import OperationalError, connection, connections, transaction
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from benchmarks import suite
+
+from . import (
+    analytics, archive, balances, currency, ledger, loadgen, metrics, periods, rebalance, reconcile, recurring, retry,
+    rollups, schedules, sharding, snapshots, user_cache,
+)
+from .forms import RecurringPaymentForm, TransactionForm
+from .models import (
+    Account, ArchivedTransaction, Category, CurrencyRate, RecurringPayment, Transaction, TransactionRollup,
+)
+
+
+class RollupTests(TestCase):
+    """Дневная сводка поддерживается при изменении транзакций"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=0)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+
+    def snapshot(self):
+        return list(
+            TransactionRollup.objects.order_by('account_id', 'category_id', 'type', 'day')
+            .values_list('account_id', 'category_id', 'type', 'day', 'total', 'count')
+        )
+
+    def test_create_update_delete(self):
+        today = timezone.localdate()
+        txn = Transaction.objects.create(account=self.account, category=self.food, type='expense', amount=10)
+        Transaction.objects.create(account=self.account, category=self.food, type='expense', amount=5)
+        self.assertEqual(rollups.period_total(self.user, 'expense', today, today), Decimal('15'))
+
+        txn.amount = 20
+        txn.date = timezone.now() - timedelta(days=1)
+        txn.save()
+        self.assertEqual(rollups.period_total(self.user, 'expense', today, today), Decimal('5'))
+        self.assertEqual(rollups.period_total(self.user, 'expense', today - timedelta(days=1)), Decimal('25'))
+
+        txn.delete()
+        self.assertEqual(rollups.period_total(self.user, 'expense', today - timedelta(days=1)), Decimal('5'))
+        self.assertEqual(TransactionRollup.objects.count(), 1)
+
+    def test_category_delete_merges_into_uncategorized(self):
+        Transaction.objects.create(account=self.account, category=self.food, type='expense', amount=10)
+        Transaction.objects.create(account=self.account, type='expense', amount=7)
+        Transaction.objects.create(
+            account=self.account, category=self.food, type='expense', amount=4,
+            date=timezone.now() - timedelta(days=3),
+        )
+        self.food.delete()
+        self.assertEqual(
+            list(TransactionRollup.objects.order_by('day').values_list('category_id', 'total', 'count')),
+            [(None, Decimal('4'), 1), (None, Decimal('17'), 2)],
+        )
+
+    def test_rebuild_matches_incremental(self):
+        now = timezone.now()
+        for days, amount in [(0, 3), (0, 4), (2, 8), (40, 1)]:
+            Transaction.objects.create(
+                account=self.account, category=self.food, type='expense',
+                amount=amount, date=now - timedelta(days=days),
+            )
+        Transaction.objects.create(account=self.account, type='income', amount=100)
+        incremental = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), incremental)
+
+
+class DashboardSnapshotTests(TestCase):
+    """Снимок дашборда: один запрос на итоги, ноль запросов при попадании в кеш"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='snapshot', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        Transaction.objects.create(account=self.account, type='expense', amount=10)
+        Transaction.objects.create(account=self.account, type='income', amount=30)
+        Transaction.objects.create(
+            account=self.account, type='expense', amount=5,
+            date=timezone.now() - timedelta(days=40),
+        )
+
+    def test_period_totals_single_query(self):
+        with self.assertNumQueries(1):
+            totals = snapshots.period_totals(self.user)
+        self.assertEqual(totals['today_expenses'], Decimal('10'))
+        self.assertEqual(totals['today_income'], Decimal('30'))
+
+    def test_snapshot_miss_cost(self):
+        currency.get_rates()
+        # Счета, последние операции и итоги; общий баланс - по загруженным счетам
+        with self.assertNumQueries(3):
+            snapshot = snapshots.build_snapshot(self.user, 'UZS')
+        self.assertEqual(snapshot['total_balance'], Decimal('100'))
+
+    def test_snapshot_cached_and_invalidated(self):
+        snapshots.get_snapshot(self.user, 'UZS')
+        with self.assertNumQueries(0):
+            snapshot = snapshots.get_snapshot(self.user, 'UZS')
+        self.assertEqual(snapshot['total_balance'], Decimal('100'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(account=self.account, type='expense', amount=1)
+        self.assertEqual(snapshots.get_snapshot(self.user, 'UZS')['today_expenses'], Decimal('11'))
+
+
+class UserCacheTests(APITestCase):
+    """Версионированный кеш: попадание без запросов, запись пользователя сбрасывает кеш"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        self.category = Category.objects.create(user=self.user, name='Food', type='expense')
+        Category.objects.create(user=self.other, name='Foreign', type='expense')
+        self.client.force_authenticate(self.user)
+
+    def test_summary_hit_and_bump(self):
+        self.client.get('/api/accounts/summary/')
+        with self.assertNumQueries(0):
+            data = self.client.get('/api/accounts/summary/').json()
+        self.assertEqual(data['accounts_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.create_transaction(account=self.account, category=self.category, type='expense', amount=10)
+        data = self.client.get('/api/accounts/summary/').json()
+        self.assertEqual(data['total_balance'], 90.0)
+        self.assertEqual(data['month_expenses'], 10.0)
+
+    def test_bump_seeds_missing_version(self):
+        # Без ключа версии bump заводит его и увеличивает: версия всегда новая
+        user_cache.bump(self.user.pk)
+        version = user_cache.get_version(self.user.pk)
+        user_cache.bump(self.user.pk)
+        self.assertEqual(user_cache.get_version(self.user.pk), version + 1)
+
+    def test_categories_scoped_and_invalidated(self):
+        names = [row['name'] for row in self.client.get('/api/categories/').json()['results']]
+        self.assertEqual(names, ['Food'])
+        with self.assertNumQueries(0):
+            self.client.get('/api/categories/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/categories/', {'name': 'Salary', 'type': 'income'})
+        names = {row['name'] for row in self.client.get('/api/categories/').json()['results']}
+        self.assertEqual(names, {'Food', 'Salary'})
+
+    def test_form_choices_cached_and_scoped(self):
+        Account.objects.create(user=self.other, name='Foreign wallet', balance=0)
+        self.assertIn('Food', RecurringPaymentForm(user=self.user).as_p())
+        with self.assertNumQueries(0):
+            html = RecurringPaymentForm(user=self.user).as_p() + TransactionForm(user=self.user).as_p()
+        self.assertNotIn('Foreign', html)
+
+        # Проводка меняет баланс, но не списки выбора
+        with self.captureOnCommitCallbacks(execute=True):
+            ledger.create_transaction(account=self.account, category=self.category, type='expense', amount=10)
+        with self.assertNumQueries(0):
+            TransactionForm(user=self.user).as_p()
+        self.account.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.save()
+        self.assertIn('Renamed (UZS)', RecurringPaymentForm(user=self.user).as_p())
+
+        foreign = Category.objects.get(name='Foreign')
+        form = TransactionForm({'type': 'expense', 'category': foreign.pk, 'amount': 5}, user=self.user)
+        self.assertIn('category', form.errors)
+
+    def test_versions_are_per_user(self):
+        version = user_cache.get_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(user=self.other, name='Other', balance=0)
+        self.assertEqual(user_cache.get_version(self.user.pk), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            Account.objects.create(user=self.user, name='Second', balance=0)
+            # До фиксации версия прежняя: читатель не закеширует незафиксированные данные
+            self.assertEqual(user_cache.get_version(self.user.pk), version)
+        self.assertNotEqual(user_cache.get_version(self.user.pk), version)
+
+
+class CurrencyTests(APITestCase):
+    """Общий баланс пересчитывается в валюту отчёта в самом агрегате"""
+
+    def setUp(self):
+        cache.clear()
+        call_command('load_currency_rates', stdout=StringIO())
+        self.user = User.objects.create_user(username='currency', password='pass')
+        Account.objects.create(user=self.user, name='Main', balance=126500, currency='UZS')
+        Account.objects.create(user=self.user, name='Dollars', balance=10, currency='USD')
+        Account.objects.create(user=self.user, name='Euro', balance=100, currency='EUR')
+        self.client.force_authenticate(self.user)
+
+    def test_total_single_query(self):
+        accounts = Account.objects.filter(user=self.user)
+        currency.get_rates()
+        with self.assertNumQueries(1):
+            self.assertEqual(currency.total_balance(accounts, 'UZS'), Decimal('1623000.00'))
+        self.assertEqual(currency.total_balance(accounts, 'USD'), Decimal('128.30'))
+        for target in ('UZS', 'USD', 'EUR'):
+            self.assertEqual(currency.loaded_total(list(accounts), target), currency.total_balance(accounts, target))
+
+    def test_summary_currency(self):
+        data = self.client.get('/api/accounts/summary/?currency=EUR').json()
+        self.assertEqual((data['total_balance'], data['currency']), (118.47, 'EUR'))
+        self.assertEqual(self.client.get('/api/accounts/summary/').json()['total_balance'], 1623000)
+
+        # Новый курс меняет ключ кеша сводки
+        CurrencyRate.objects.filter(currency='EUR').update(rate=12650)
+        currency.clear_rates()
+        self.assertEqual(self.client.get('/api/accounts/summary/?currency=USD').json()['total_balance'], 120)
+
+    def test_missing_rate(self):
+        CurrencyRate.objects.get(currency='EUR').delete()
+        self.assertIsNone(currency.total_balance(Account.objects.filter(user=self.user), 'UZS'))
+        self.assertIsNone(currency.loaded_total(list(Account.objects.filter(user=self.user)), 'UZS'))
+
+    def test_session_currency(self):
+        self.client.force_login(self.user)
+        self.client.get('/set-currency/?currency=usd')
+        response = self.client.get('/accounts/')
+        self.assertEqual(response.context['reporting_currency'], 'USD')
+        self.assertEqual(response.context['total_balance'], Decimal('128.30'))
+        self.assertEqual(self.client.get('/dashboard/').context['total_balance'], Decimal('128.30'))
+
+
+class ETagTests(APITestCase):
+    """Условные GET: 304 до выборки транзакций, любое изменение меняет ETag"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='etag', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        ledger.create_transaction(account=self.account, type='expense', amount=10)
+        self.client.force_authenticate(self.user)
+
+    def assert_revalidates(self, url, change):
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        # Один запрос версий счетов, без транзакций и сериализации
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_account_detail(self):
+        self.assert_revalidates(
+            f'/api/accounts/{self.account.pk}/',
+            lambda: ledger.create_transaction(account=self.account, type='income', amount=5),
+        )
+
+    def test_account_list_on_rename(self):
+        def rename():
+            self.account.name = 'Renamed'
+            self.account.save()
+        self.assert_revalidates('/api/accounts/', rename)
+
+    def test_transactions_on_edit(self):
+        def edit():
+            txn = Transaction.objects.get()
+            txn.description = 'edited'
+            txn.save()
+        self.assert_revalidates(f'/api/transactions/?account_id={self.account.pk}', edit)
+
+    def test_transactions_on_category_rename(self):
+        category = Category.objects.create(user=self.user, name='Food', type='expense')
+
+        def rename():
+            category.name = 'Groceries'
+            category.save()
+        self.assert_revalidates('/api/transactions/', rename)
+
+
+@override_settings(ACCOUNT_DETAIL_TRANSACTIONS=5)
+class AccountDetailTests(APITestCase):
+    """Детали счета: ограниченное окно транзакций без N+1 и ссылка на продолжение"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='detail', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=0)
+        categories = [
+            Category.objects.create(user=self.user, name=f'Category {i}', type='expense')
+            for i in range(3)
+        ]
+        now = timezone.now()
+        for i in range(12):
+            Transaction.objects.create(
+                account=self.account, category=categories[i % 3], type='expense', amount=1,
+                date=now - timedelta(hours=i),
+            )
+        self.expected = list(
+            Transaction.objects.order_by('-date', '-id').values_list('id', flat=True)
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_window_and_cursor_link(self):
+        # Версии счетов для ETag, счет и окно транзакций с категориями
+        with self.assertNumQueries(3):
+            data = self.client.get(f'/api/accounts/{self.account.pk}/').json()
+        self.assertEqual([row['id'] for row in data['transactions']], self.expected[:5])
+        self.assertEqual(data['transactions'][0]['account_name'], 'Main')
+
+        rest = self.client.get(data['transactions_next']).json()
+        self.assertEqual([row['id'] for row in rest['results']], self.expected[5:])
+
+    def test_no_link_when_history_fits(self):
+        Transaction.objects.filter(pk__in=self.expected[5:]).delete()
+        data = self.client.get(f'/api/accounts/{self.account.pk}/').json()
+        self.assertEqual(len(data['transactions']), 5)
+        self.assertIsNone(data['transactions_next'])
+
+
+class KeysetPaginationTests(APITestCase):
+    """Курсорная пагинация проходит историю без пропусков и повторов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cursor', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=0)
+        now = timezone.now()
+        # Часть транзакций с одинаковой датой - порядок внутри держится на id
+        for i in range(25):
+            Transaction.objects.create(
+                account=self.account, type='expense', amount=1,
+                date=now - timedelta(hours=i // 3),
+            )
+        self.expected = list(
+            Transaction.objects.order_by('-date', '-id').values_list('id', flat=True)
+        )
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link):
+        ids, pages = [], []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([row['id'] for row in data['results']])
+            ids.extend(pages[-1])
+            url = data[link]
+        return ids, pages
+
+    def test_forward_and_backward(self):
+        ids, pages = self.walk('/api/transactions/?cursor=&page_size=10', 'next')
+        self.assertEqual(ids, self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+        last_page = self.client.get('/api/transactions/?cursor=&page_size=10').json()
+        last_page = self.client.get(last_page['next']).json()
+        last_page = self.client.get(last_page['next']).json()
+        previous = self.client.get(last_page['previous']).json()
+        self.assertEqual([row['id'] for row in previous['results']], pages[1])
+
+    def test_account_transactions_paginated(self):
+        ids, _ = self.walk(f'/api/accounts/{self.account.pk}/transactions/?page_size=7', 'next')
+        self.assertEqual(ids, self.expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/transactions/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class PeriodFilterTests(TestCase):
+    """Фильтры по периоду используют составные индексы Transaction"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='periods', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=0)
+        now = timezone.now()
+        for days in (0, 3, 20, 45):
+            Transaction.objects.create(
+                account=self.account, type='expense', amount=1, date=now - timedelta(days=days),
+            )
+
+    def test_period_range_half_open(self):
+        today = timezone.localdate()
+        start, end = periods.period_range('today', today=today)
+        self.assertEqual(end - start, timedelta(days=1))
+        self.assertEqual(start.date(), today)
+        start, end = periods.period_range('custom', '2024-01-01', '2024-01-31')
+        self.assertEqual((start.date().isoformat(), end.date().isoformat()), ('2024-01-01', '2024-02-01'))
+        self.assertEqual(periods.period_range('all'), (None, None))
+
+    def test_filters_match_counts(self):
+        transactions = Transaction.objects.filter(account=self.account)
+        self.assertEqual(periods.filter_period(transactions, 'today').count(), 1)
+        self.assertEqual(periods.filter_period(transactions, 'week').count(), 2)
+        self.assertEqual(periods.filter_period(transactions, 'all').count(), 4)
+
+    def test_account_listing_uses_account_date_index(self):
+        queryset = periods.filter_period(
+            Transaction.objects.filter(account=self.account), 'week'
+        ).order_by('-date', '-id')
+        plan = queryset.explain()
+        self.assertIn('configapp_txn_acct_date', plan)
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_type_aggregate_uses_account_type_date_index(self):
+        queryset = periods.filter_period(
+            Transaction.objects.filter(account=self.account, type='expense'), 'month'
+        )
+        self.assertNotIn('django_datetime', str(queryset.query))
+        plan = queryset.values('account').annotate(total=Sum('amount')).order_by().explain()
+        self.assertIn('configapp_txn_acct_type_date', plan)
+
+
+class ConcurrentBalanceTests(TransactionTestCase):
+    """Параллельные проводки по одному счету не теряют обновлений баланса"""
+
+    THREADS = 8
+    PER_THREAD = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='concurrent', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=1000)
+
+    def post_many(self, worker, errors):
+        try:
+            for i in range(self.PER_THREAD):
+                ledger.create_transaction(
+                    account=self.account,
+                    type='income' if (worker + i) % 2 else 'expense',
+                    amount=Decimal('1.25') * (worker + 1),
+                )
+        except Exception as exc:  # pragma: no cover - сообщение об ошибке в тесте
+            errors.append(exc)
+        finally:
+            connection.close()
+
+    def test_parallel_inserts_keep_exact_balance(self):
+        errors = []
+        threads = [
+            threading.Thread(target=self.post_many, args=(worker, errors))
+            for worker in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        expected = Decimal('1000')
+        for txn in Transaction.objects.filter(account=self.account):
+            expected += ledger.balance_delta(txn.type, txn.amount)
+        self.account.refresh_from_db()
+        self.assertEqual(Transaction.objects.filter(account=self.account).count(), self.THREADS * self.PER_THREAD)
+        self.assertEqual(self.account.balance, expected)
+
+
+class LockRetryTests(TransactionTestCase):
+    """Повтор записи при "database is locked" - только вне внешней транзакции"""
+
+    def setUp(self):
+        metrics.reset()
+        patcher = mock.patch.object(retry, 'BASE_DELAY', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flaky(self, failures):
+        calls = []
+
+        @retry.on_lock
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError('database is locked')
+            return len(calls)
+        return write, calls
+
+    def test_retries_until_success_or_limit(self):
+        write, _ = self.flaky(2)
+        self.assertEqual(write(), 3)
+        write, calls = self.flaky(retry.ATTEMPTS)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), retry.ATTEMPTS)
+        self.assertIn(f'bank_db_lock_retries_total{{operation="tests.write"}} {1 + retry.ATTEMPTS}', metrics.render())
+
+        write, calls = self.flaky(1)
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_post_transaction_retried_from_scratch(self):
+        user = User.objects.create_user(username='locked', password='pass')
+        account = Account.objects.create(user=user, name='Main', balance=100)
+        shift_later = balances.shift_later
+        failures = [OperationalError('database is locked')]
+
+        def locked_once(txn, delta):
+            if failures:
+                raise failures.pop()
+            return shift_later(txn, delta)
+
+        with mock.patch.object(balances, 'shift_later', locked_once):
+            txn = ledger.create_transaction(account=account, type='expense', amount=30)
+        account.refresh_from_db()
+        self.assertEqual(account.balance, 70)
+        self.assertEqual(list(account.transactions.values_list('pk', 'balance_after')), [(txn.pk, 70)])
+
+
+class AnalyticsReplicaTests(TransactionTestCase):
+    """Отчёты читают из свежей реплики, из основной БД - если реплика устарела или отстаёт от записей"""
+
+    databases = {'default', 'analytics'}
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'analytics.sqlite3')
+        # Реплика читается только с общим для процессов кешем
+        override = override_settings(ANALYTICS_DB_PATH=self.path, CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(directory.name, 'cache'),
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='analyst', password='pass')
+        account = Account.objects.create(user=self.user, name='Main', balance=100)
+        ledger.create_transaction(account=account, type='expense', amount=10)
+        self.client.force_login(self.user)
+        self.client.force_authenticate(self.user)
+
+    def from_replica(self, path, written_ago):
+        """Прочитан ли отчёт из реплики, если пользователь писал written_ago секунд назад"""
+        cache.clear()
+        cache.set(f'user-written:{self.user.pk}', time.time() - written_ago, None)
+        with CaptureQueriesContext(connections['analytics']) as replica:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return len(replica) > 0
+
+    def test_refresh_copies_database(self):
+        self.assertEqual(analytics.replica_alias(self.user.pk), 'default')
+        taken = analytics.refresh()
+        self.assertAlmostEqual(os.path.getmtime(self.path), taken, places=3)
+        with sqlite3.connect(self.path) as replica:
+            self.assertEqual(replica.execute('SELECT COUNT(*) FROM configapp_transaction').fetchone(), (1,))
+            self.assertEqual(replica.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+
+    def test_routing_and_fallback(self):
+        analytics.refresh()
+        for path in ('/statistics/', '/dashboard/', '/api/transactions/statistics/'):
+            self.assertTrue(self.from_replica(path, written_ago=60), path)
+        with analytics.reporting(self.user.pk):
+            self.assertEqual(Transaction.objects.all().db, 'analytics')
+            Category.objects.create(user=self.user, name='Written', type='expense')
+        self.assertEqual(Transaction.objects.all().db, 'default')
+
+        # Запись после снимка: пользователь должен видеть свои данные
+        self.assertFalse(self.from_replica('/statistics/', written_ago=-1))
+        # Кеш в памяти процесса не знает о записях в других воркерах
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertFalse(self.from_replica('/statistics/', written_ago=60))
+        # Реплика старше допустимого
+        stale = time.time() - settings.ANALYTICS_MAX_STALENESS - 1
+        os.utime(self.path, (stale, stale))
+        self.assertFalse(self.from_replica('/statistics/', written_ago=600))
+
+
+class RunningBalanceTests(APITestCase):
+    """Остаток после транзакции: вставка по порядку и задним числом, история баланса"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='running', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        self.now = timezone.now()
+        self.client.force_authenticate(self.user)
+
+    def post(self, type, amount, days_ago):
+        return ledger.create_transaction(
+            account=self.account, type=type, amount=amount, date=self.now - timedelta(days=days_ago),
+        )
+
+    def running(self):
+        return list(self.account.transactions.order_by('date', 'id').values_list('balance_after', flat=True))
+
+    def balance(self, account=None):
+        return Account.objects.values_list('balance', flat=True).get(pk=(account or self.account).pk)
+
+    def test_backdated_insert_shifts_suffix(self):
+        self.post('income', 50, days_ago=5)
+        self.post('expense', 30, days_ago=1)
+        self.assertEqual(self.running(), [150, 120])
+
+        self.post('expense', 20, days_ago=3)
+        self.assertEqual(self.running(), [150, 130, 100])
+        self.account.refresh_from_db()
+        self.assertEqual((self.account.opening_balance, self.account.balance), (100, 100))
+        # Пересчёт с нуля даёт то же самое
+        self.assertEqual(balances.recalculate(self.account.pk), 0)
+
+    def test_edit_and_delete_recalculate(self):
+        first = self.post('income', 50, days_ago=5)
+        second = self.post('expense', 30, days_ago=1)
+        url = f'/api/transactions/{first.pk}/'
+        response = self.client.patch(url, {'amount': '70.00'}, format='json')
+        self.assertEqual(response.json()['balance_after'], '170.00')
+        self.assertEqual(self.running(), [170, 140])
+        self.assertEqual(self.balance(), 140)
+        # Перенос позже другой транзакции меняет порядок остатков
+        self.client.patch(url, {'date': self.now.isoformat()}, format='json')
+        self.assertEqual(self.running(), [70, 140])
+        self.assertEqual(self.balance(), 140)
+
+        other = Account.objects.create(user=self.user, name='Other', balance=0)
+        self.client.patch(url, {'account': other.pk}, format='json')
+        self.assertEqual(self.running(), [70])
+        self.assertEqual(list(other.transactions.values_list('balance_after', flat=True)), [70])
+        self.assertEqual(self.balance(), 70)
+        self.assertEqual(self.balance(other), 70)
+        self.client.delete(f'/api/transactions/{second.pk}/')
+        self.assertEqual(self.running(), [])
+        self.assertEqual(self.balance(), 100)
+        self.client.delete(url)
+        self.assertEqual(self.balance(other), 0)
+
+    def test_balance_history(self):
+        self.post('income', 50, days_ago=20)
+        self.post('expense', 30, days_ago=10)
+        today = timezone.localdate()
+        days = balances.history_days(today - timedelta(days=21), today, 'week')
+        with self.assertNumQueries(1):
+            points = balances.balances_on(self.account.pk, days)
+        self.assertEqual([balance for _, balance in points], [100, 150, 120, 120])
+
+        url = f'/api/accounts/{self.account.pk}/balance-history/'
+        data = self.client.get(url, {'from': (today - timedelta(days=2)).isoformat()}).json()
+        self.assertEqual([point['balance'] for point in data['points']], ['120.00'] * 3)
+        self.assertEqual(self.client.get(url, {'step': 'hour'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'from': '2000-01-01'}).status_code, 400)
+
+
+class SearchTests(APITestCase):
+    """Полнотекстовый поиск: префиксы, релевантность, фильтры, согласованность индекса"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=1000)
+        self.card = Account.objects.create(user=self.user, name='Card', balance=1000)
+        self.client.force_authenticate(self.user)
+
+    def post(self, description, account=None, type='expense'):
+        return ledger.create_transaction(
+            account=account or self.account, type=type, amount=10, description=description,
+            date=timezone.now(),
+        )
+
+    def search(self, q, **params):
+        response = self.client.get('/api/transactions/search/', {'q': q, **params})
+        return [item['description'] for item in response.json()['results']]
+
+    def test_prefix_match_and_ranking(self):
+        self.post('Кофе и булочка')
+        self.post('Кофейня: кофе, кофе навынос')
+        self.post('Такси')
+        self.assertEqual(self.search('кофе'), ['Кофейня: кофе, кофе навынос', 'Кофе и булочка'])
+        self.assertEqual(self.search('коф бул'), ['Кофе и булочка'])
+        self.assertEqual(self.search('такс'), ['Такси'])
+
+    def test_filters_and_isolation(self):
+        self.post('Обед')
+        self.post('Обед с коллегами', account=self.card)
+        self.post('Обед вернули', type='income')
+        other = User.objects.create_user(username='other-searcher', password='pass')
+        ledger.create_transaction(
+            account=Account.objects.create(user=other, name='Other', balance=0),
+            type='expense', amount=1, description='Обед', date=timezone.now(),
+        )
+        self.assertEqual(len(self.search('обед')), 3)
+        self.assertEqual(self.search('обед', account_id=self.card.pk), ['Обед с коллегами'])
+        self.assertEqual(self.search('обед', type='income'), ['Обед вернули'])
+        self.assertEqual(len(self.search('обед', limit=2)), 2)
+        self.assertEqual(self.client.get('/api/transactions/search/', {'q': ' ,'}).status_code, 400)
+
+    def test_index_follows_updates_and_deletes(self):
+        txn = self.post('Бензин')
+        txn.description = 'Парковка'
+        txn.save()
+        self.assertEqual(self.search('бенз'), [])
+        self.assertEqual(self.search('парк'), ['Парковка'])
+        Transaction.objects.filter(pk=txn.pk).delete()
+        self.assertEqual(self.search('парк'), [])
+
+
+class ReconcileTests(TestCase):
+    """Сверка балансов: расхождения находятся одним запросом на пачку и исправляются сдвигом"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reconcile', password='pass')
+        self.clean = Account.objects.create(user=self.user, name='Clean', balance=100)
+        self.drifted = Account.objects.create(user=self.user, name='Drifted', balance=100)
+        ledger.create_transaction(account=self.clean, type='expense', amount=Decimal('10.10'))
+        ledger.create_transaction(account=self.drifted, type='income', amount=50)
+        # Транзакция в обход ledger и потерянное обновление баланса
+        Transaction.objects.create(account=self.drifted, type='expense', amount=Decimal('20.25'))
+        Account.objects.filter(pk=self.drifted.pk).update(balance=F('balance') - 5)
+
+    def test_find_drifts_single_query(self):
+        with self.assertNumQueries(1):
+            drifts = reconcile.find_drifts(self.clean.pk, self.drifted.pk)
+        self.assertEqual(
+            [(drift.account_id, drift.balance, drift.expected, drift.drift) for drift in drifts],
+            [(self.drifted.pk, Decimal('145.00'), Decimal('129.75'), Decimal('-15.25'))],
+        )
+
+    def test_command_fix(self):
+        out = StringIO()
+        call_command('reconcile_balances', '--workers', '1', '--batch-size', '1', stdout=out)
+        self.assertIn('с расхождением: 1', out.getvalue())
+        self.assertEqual(Account.objects.get(pk=self.drifted.pk).balance, Decimal('145.00'))
+
+        call_command('reconcile_balances', '--workers', '1', '--fix', stdout=StringIO())
+        self.drifted.refresh_from_db()
+        self.assertEqual(self.drifted.balance, Decimal('129.75'))
+        last = self.drifted.transactions.order_by('date', 'id').last()
+        self.assertEqual(last.balance_after, self.drifted.balance)
+        self.assertEqual(sum(len(drifts) for _, drifts in reconcile.reconcile(workers=1)), 0)
+
+
+class BulkImportTests(APITestCase):
+    """Массовый импорт: пачки, один сдвиг баланса на счет, отчёт об ошибках"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        self.food = Category.objects.create(user=self.user, name='Food', type='expense')
+        other = User.objects.create_user(username='other', password='pass')
+        self.foreign = Account.objects.create(user=other, name='Foreign', balance=0)
+        self.client.force_authenticate(self.user)
+
+    def test_csv_import_reports_bad_rows(self):
+        body = (
+            'account,category,type,amount,description,date\n'
+            f'{self.account.pk},{self.food.pk},expense,10.50,Lunch,2024-05-01T12:00:00Z\n'
+            f'{self.account.pk},,income,200,Salary,\n'
+            f'{self.account.pk},,expense,abc,Broken,\n'
+            f'{self.foreign.pk},,income,5,Not mine,\n'
+        )
+        response = self.client.generic('POST', '/api/transactions/bulk/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertIn('amount', report['errors'][0]['errors'])
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('289.50'))
+        self.assertEqual(
+            rollups.for_user(self.user).aggregate(Sum('count'))['count__sum'], 2
+        )
+        self.assertEqual(
+            list(self.account.transactions.order_by('date').values_list('balance_after', flat=True)),
+            [Decimal('89.50'), Decimal('289.50')],
+        )
+
+    def test_ndjson_import_in_chunks(self):
+        lines = [
+            json.dumps({'account': self.account.pk, 'type': 'expense', 'amount': '1.00'})
+            for _ in range(2500)
+        ]
+        lines.insert(10, '{not json')
+        response = self.client.generic(
+            'POST', '/api/transactions/bulk/', '\n'.join(lines), content_type='application/x-ndjson'
+        )
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2500, 1))
+        self.assertEqual(report['errors'][0]['row'], 11)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('-2400'))
+
+    def test_unsupported_media_type(self):
+        response = self.client.post('/api/transactions/bulk/', {'rows': []}, format='json')
+        self.assertEqual(response.status_code, 415)
+
+
+class ExportTests(APITestCase):
+    """Потоковый экспорт с фильтрами списка"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='export', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=0)
+        for amount in (1, 2, 3):
+            Transaction.objects.create(account=self.account, type='expense', amount=amount, description='Кофе')
+        Transaction.objects.create(account=self.account, type='income', amount=50)
+        other = User.objects.create_user(username='other-export', password='pass')
+        other_account = Account.objects.create(user=other, name='Other', balance=0)
+        Transaction.objects.create(account=other_account, type='expense', amount=9)
+        self.client.force_authenticate(self.user)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export(self):
+        response = self.client.get('/api/transactions/export/?format=csv&type=expense')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'date', 'account'])
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Кофе', lines[1])
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/transactions/export/?format=ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['account_name'] for row in rows}, {'Main'})
+        self.assertEqual(rows[0]['amount'], '50.00')
+
+
+class ArchiveTests(APITestCase):
+    """Архив старых транзакций: чтения не меняются, архив читается только когда период до него доходит"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='archive', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=100)
+        category = Category.objects.create(user=self.user, name='Еда', type='expense')
+        now = timezone.now()
+        for days_ago, type, amount in ((40, 'income', 50), (35, 'expense', 30), (20, 'expense', 5),
+                                       (10, 'income', 7), (2, 'expense', 12)):
+            ledger.create_transaction(
+                account=self.account, type=type, amount=amount, description=f'Платёж {days_ago}',
+                category=category if type == 'expense' else None, date=now - timedelta(days=days_ago),
+            )
+        self.client.force_authenticate(self.user)
+        self.since = (timezone.localdate() - timedelta(days=45)).isoformat()
+
+    def ids(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+        return ids
+
+    def reads(self):
+        return (
+            self.ids('/api/transactions/?cursor=&page_size=2'),
+            self.ids(f'/api/accounts/{self.account.pk}/transactions/?page_size=2'),
+            b''.join(self.client.get('/api/transactions/export/?format=csv').streaming_content),
+            self.client.get(f'/api/accounts/{self.account.pk}/balance-history/', {'from': self.since}).json(),
+        )
+
+    def rollup_rows(self):
+        return list(
+            TransactionRollup.objects.order_by('day', 'type')
+            .values_list('account_id', 'category_id', 'type', 'day', 'total', 'count')
+        )
+
+    def test_reads_unchanged_after_archiving(self):
+        before, rows = self.reads(), self.rollup_rows()
+        out = StringIO()
+        call_command('archive_transactions', '--older-than', '15', '--chunk-size', '1', stdout=out)
+        self.assertIn('транзакций: 3', out.getvalue())
+        self.assertEqual((Transaction.objects.count(), ArchivedTransaction.objects.count()), (2, 3))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.opening_balance, Decimal('115.00'))
+
+        self.assertEqual(self.reads(), before)
+        # Рабочая таблица по-прежнему сходится с балансом, сводка из обеих таблиц - та же
+        self.assertEqual(reconcile.find_drifts(self.account.pk, self.account.pk), [])
+        self.assertEqual(balances.recalculate(self.account.pk), 0)
+        rollups.rebuild()
+        self.assertEqual(self.rollup_rows(), rows)
+
+    def test_unposted_rows_stay_for_reconcile(self):
+        # Транзакция в обход ledger: баланс не менялся, сверка показывает расхождение
+        Transaction.objects.create(
+            account=self.account, type='expense', amount=3, date=timezone.now() - timedelta(days=30),
+        )
+        drifts = [drift.drift for drift in reconcile.find_drifts(self.account.pk, self.account.pk)]
+        self.assertEqual(drifts, [Decimal('-3.00')])
+        list(archive.archive(periods.day_start(timezone.localdate() - timedelta(days=15))))
+        self.assertEqual(ArchivedTransaction.objects.count(), 3)
+        self.assertTrue(Transaction.objects.filter(balance_after__isnull=True).exists())
+        self.assertEqual([drift.drift for drift in reconcile.find_drifts(self.account.pk, self.account.pk)], drifts)
+
+    def test_history_before_archive_starts_from_zero(self):
+        account = Account.objects.create(user=self.user, name='Zero', balance=0)
+        ledger.create_transaction(account=account, type='income', amount=20, date=timezone.now() - timedelta(days=30))
+        list(archive.archive(periods.day_start(timezone.localdate() - timedelta(days=15)), [self.user.pk]))
+        account.refresh_from_db()
+        self.assertEqual(account.opening_balance, 20)
+        today = timezone.localdate()
+        points = balances.balances_on(account.pk, [today - timedelta(days=40), today], account.archived_until)
+        self.assertEqual([balance for _, balance in points], [0, 20])
+
+    def test_archive_read_only_when_period_reaches_it(self):
+        list(archive.archive(periods.day_start(timezone.localdate() - timedelta(days=15))))
+        table = ArchivedTransaction._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/transactions/', {'period': 'week'}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertFalse(any(table in query['sql'] for query in queries.captured_queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/transactions/', {'from': self.since}).json()
+        self.assertEqual(data['count'], 5)
+        self.assertTrue(any(table in query['sql'] for query in queries.captured_queries))
+
+
+class RecurringPaymentTests(TestCase):
+    """Исполнение регулярных платежей с догоном и идемпотентностью"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='recurring', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=1000)
+
+    def test_month_end_anchor(self):
+        start = date(2024, 1, 31)
+        self.assertEqual(schedules.occurrence_after('monthly', start, start), date(2024, 2, 29))
+        self.assertEqual(schedules.occurrence_after('monthly', start, date(2024, 2, 29)), date(2024, 3, 31))
+        self.assertEqual(schedules.occurrence_after('weekly', start, date(2024, 2, 6)), date(2024, 2, 7))
+        self.assertEqual(schedules.occurrence_after('yearly', start, date(2024, 6, 1)), date(2025, 1, 31))
+
+    def test_catch_up_and_idempotent(self):
+        today = timezone.localdate()
+        payment = RecurringPayment.objects.create(
+            account=self.account, amount=10, description='Netflix',
+            frequency='daily', start_date=today - timedelta(days=4),
+        )
+        self.assertEqual(payment.next_run_at, periods.day_start(today - timedelta(days=4)))
+
+        self.assertEqual(recurring.run_due_payments(), (1, 5))
+        self.assertEqual(recurring.run_due_payments(), (0, 0))
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.next_run_at, periods.day_start(today + timedelta(days=1)))
+        self.assertEqual(payment.last_executed, periods.day_start(today))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('950'))
+        self.assertEqual(rollups.period_total(self.user, 'expense', today - timedelta(days=4)), Decimal('50'))
+
+    def test_resume_skips_paused_periods(self):
+        today = timezone.localdate()
+        payment = RecurringPayment.objects.create(
+            account=self.account, amount=10, description='Cloud',
+            frequency='daily', start_date=today - timedelta(days=30), is_active=False,
+        )
+        payment = RecurringPayment.objects.get(pk=payment.pk)
+        payment.is_active = True
+        payment.save()
+        self.assertEqual(payment.next_run_at, periods.day_start(today))
+        self.assertEqual(recurring.run_due_payments(), (1, 1))
+
+    def test_end_date_stops_schedule(self):
+        today = timezone.localdate()
+        payment = RecurringPayment.objects.create(
+            account=self.account, amount=5, description='Gym',
+            frequency='weekly', start_date=today - timedelta(days=30),
+            end_date=today - timedelta(days=10),
+        )
+        self.assertEqual(recurring.run_due_payments(), (1, 3))
+        payment.refresh_from_db()
+        self.assertIsNone(payment.next_run_at)
+
+
+class AsyncSummaryTests(TransactionTestCase):
+    """Асинхронные сводки совпадают с синхронными"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='async', password='pass')
+        self.account = Account.objects.create(user=self.user, name='Main', balance=500)
+        food = Category.objects.create(user=self.user, name='Food', type='expense')
+        ledger.create_transaction(account=self.account, category=food, type='expense', amount=12)
+        ledger.create_transaction(account=self.account, type='income', amount=40)
+        self.headers = {'Authorization': f'Token {Token.objects.get(user=self.user).key}'}
+
+    async def test_statistics_matches_sync(self):
+        async_data = (await self.async_client.get('/api/async/transactions/statistics/', headers=self.headers)).json()
+        sync_data = (await self.async_client.get('/api/transactions/statistics/', headers=self.headers)).json()
+        self.assertEqual(async_data['month_expenses'], sync_data['month_expenses'])
+        self.assertEqual(async_data['expenses_by_category'], sync_data['expenses_by_category'])
+
+    async def test_summary(self):
+        data = (await self.async_client.get('/api/async/accounts/summary/', headers=self.headers)).json()
+        self.assertEqual(data['total_balance'], 528)
+        self.assertEqual((data['month_expenses'], data['month_income']), (12, 40))
+
+    async def test_shares_cache_with_sync(self):
+        await sync_to_async(cache.clear)()
+        for sync_url, async_url in (
+            ('/api/accounts/summary/', '/api/async/accounts/summary/'),
+            ('/api/transactions/statistics/', '/api/async/transactions/statistics/'),
+        ):
+            sync_data = (await self.async_client.get(sync_url, headers=self.headers)).json()
+            # Запись в обход сигналов версию кеша не меняет: ответ берётся из кеша синхронного варианта
+            await Account.objects.filter(pk=self.account.pk).aupdate(balance=0)
+            await TransactionRollup.objects.filter(user=self.user).aupdate(total=0)
+            self.assertEqual((await self.async_client.get(async_url, headers=self.headers)).json(), sync_data)
+
+    def test_middleware_chain_stays_async(self):
+        # Django пишет в django.request (при DEBUG) о каждом обработчике, адаптированном под sync
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_metrics_in_async_chain(self):
+        metrics.reset()
+        response = await self.async_client.get('/api/async/accounts/summary/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        lines = metrics.render().splitlines()
+        self.assertIn(
+            'bank_http_requests_total{view="async-account-summary",method="GET",status="200"} 1', lines,
+        )
+        # SQL аутентификации выполняется в потоке sync_to_async запроса и учитывается
+        labels = '{view="async-account-summary",method="GET"}'
+        sql_sum = next(line for line in lines if line.startswith(f'bank_http_request_sql_queries_sum{labels}'))
+        self.assertGreater(float(sql_sum.split()[-1]), 0)
+
+    async def test_concurrent_requests_count_own_sql(self):
+        # Одновременные запросы делят поток sync_to_async, но не счётчики SQL
+        urls = ('/api/async/accounts/summary/', '/api/async/transactions/statistics/')
+
+        async def sql_sums(concurrently):
+            metrics.reset()
+            await sync_to_async(cache.clear)()
+            currency.clear_rates()
+            requests = [self.async_client.get(url, headers=self.headers) for url in urls]
+            if concurrently:
+                await asyncio.gather(*requests)
+            else:
+                for request in requests:
+                    await request
+            return [line for line in metrics.render().splitlines() if line.startswith('bank_http_request_sql_queries_sum')]
+
+        self.assertEqual(await sql_sums(concurrently=True), await sql_sums(concurrently=False))
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get('/api/async/accounts/summary/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_dashboard_renders(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/dashboard/async/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_balance'], Decimal('528'))
+
+
+class ShardedApiTests(TransactionTestCase):
+    """Весь API поверх четырёх файлов-шардов: данные пользователя только в его шарде"""
+
+    SHARDS = [f'shard_{i}' for i in range(4)]
+
+    @classmethod
+    def setUpClass(cls):
+        # Шарды - временные файлы с той же схемой, что и тестовая основная БД;
+        # тестовый раннер о них не знает, поэтому databases задаётся здесь
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.added = [alias for alias in cls.SHARDS if alias not in connections.settings]
+        for alias in cls.added:
+            connections.settings[alias] = {
+                **connections.settings['default'],
+                'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3'),
+            }
+        cls.databases = {'default', *cls.SHARDS}
+        super().setUpClass()
+        cls.override = override_settings(SHARDS=cls.SHARDS)
+        cls.override.enable()
+        for alias in cls.added:
+            call_command('migrate', database=alias, verbosity=0, interactive=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.override.disable()
+        super().tearDownClass()
+        for alias in cls.added:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.directory.cleanup()
+
+    def setUp(self):
+        cache.clear()
+
+    def exercise(self, user):
+        """Создать и прочитать данные пользователя через API; возвращает id счета"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=user).key}')
+        category = client.post('/api/categories/', {'name': 'Food', 'type': 'expense'}).json()['id']
+        account = client.post('/api/accounts/', {'name': 'Main', 'balance': '100.00', 'currency': 'UZS'}).json()['id']
+        response = client.post('/api/transactions/', {
+            'account': account, 'category': category, 'type': 'expense', 'amount': '10.00',
+            'description': 'Coffee beans',
+        })
+        self.assertEqual(response.status_code, 201)
+        body = '\n'.join(json.dumps({'account': account, 'type': 'expense', 'amount': '1.00'}) for _ in range(2))
+        response = client.generic('POST', '/api/transactions/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['created'], 2)
+        response = client.post('/api/recurring-payments/', {
+            'account': account, 'category': category, 'amount': '5.00', 'description': 'Rent',
+            'frequency': 'monthly', 'start_date': timezone.localdate().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        for path in (
+            '/api/categories/', '/api/accounts/', f'/api/accounts/{account}/', '/api/accounts/summary/',
+            '/api/transactions/', '/api/transactions/statistics/', '/api/recurring-payments/',
+            f'/api/accounts/{account}/balance-history/', '/api/async/accounts/summary/',
+        ):
+            self.assertEqual(client.get(path).status_code, 200, path)
+        self.assertEqual(len(client.get('/api/transactions/search/?q=coff').json()['results']), 1)
+        export = client.get('/api/transactions/export/?format=csv')
+        self.assertEqual(len(b''.join(export.streaming_content).splitlines()), 4)
+        self.assertEqual(client.get(f'/api/accounts/{account}/').json()['balance'], '88.00')
+
+        client.force_login(user)
+        self.assertEqual(client.get('/dashboard/').status_code, 200)
+        self.assertEqual(client.get('/statistics/').status_code, 200)
+        return account
+
+    def stored_in(self, user):
+        """Псевдонимы БД, где лежат счета пользователя"""
+        return [
+            alias for alias in ('default', *self.SHARDS)
+            if Account.objects.using(alias).filter(user=user).exists()
+        ]
+
+    def test_api_on_four_shards(self):
+        users = [User.objects.create_user(username=f'shard-{i}', password='pass') for i in range(8)]
+        for user in users:
+            self.exercise(user)
+            self.assertEqual(self.stored_in(user), [sharding.shard_for(user.pk)])
+            self.assertEqual(Transaction.objects.using(sharding.shard_for(user.pk)).filter(
+                account__user=user).count(), 3)
+        self.assertGreater(len({sharding.shard_for(user.pk) for user in users}), 1)
+
+        with self.assertRaises(sharding.ShardNotSelected):
+            list(Account.objects.all())
+        self.assertEqual(recurring.run_due_payments(), (8, 8))
+        self.assertEqual(sum(Transaction.objects.using(alias).count() for alias in self.SHARDS), 8 * 4)
+        self.assertFalse(any(drifts for _, drifts in reconcile.reconcile(workers=1)))
+
+    def test_rebalance_after_adding_shards(self):
+        with override_settings(SHARDS=self.SHARDS[:2]):
+            users = [User.objects.create_user(username=f'grow-{i}', password='pass') for i in range(8)]
+            accounts = {user.pk: self.exercise(user) for user in users}
+            # Архивные транзакции переносятся вместе с остальными данными
+            list(archive.archive(timezone.now() + timedelta(days=1)))
+            idle = [User.objects.create_user(username=f'idle-{i}', password='pass') for i in range(8)]
+        moved = list(rebalance.misplaced())
+        # Jump hash переносит пользователей только в новые шарды
+        self.assertTrue(moved)
+        self.assertTrue(all(move.target in self.SHARDS[2:] for move in moved))
+
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(list(rebalance.misplaced()), [])
+        for user in users:
+            self.assertEqual(self.stored_in(user), [sharding.shard_for(user.pk)])
+            client = APIClient()
+            client.force_authenticate(user)
+            account = client.get('/api/accounts/').json()['results'][0]
+            # id не меняются при переносе
+            self.assertEqual((account['id'], account['balance']), (accounts[user.pk], '88.00'))
+            export = client.get('/api/transactions/export/?format=csv')
+            self.assertEqual(len(b''.join(export.streaming_content).splitlines()), 4)
+            with sharding.for_user(user.pk):
+                self.assertEqual(ArchivedTransaction.objects.filter(account__user=user).count(), 3)
+            self.assertEqual(len(client.get('/api/recurring-payments/').json()['results']), 1)
+        # Пользователи без данных тоже получают копию в новом шарде
+        self.assertTrue(any(sharding.shard_for(user.pk) in self.SHARDS[2:] for user in idle))
+        for user in idle:
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post('/api/accounts/', {'name': 'Main', 'balance': '1.00', 'currency': 'UZS'})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.stored_in(user), [sharding.shard_for(user.pk)])
+
+    def test_rebalance_from_default_resumes(self):
+        with override_settings(SHARDS=[]):
+            user = User.objects.create_user(username='legacy', password='pass')
+            account = self.exercise(user)
+        target = sharding.shard_for(user.pk)
+        self.assertEqual(list(rebalance.misplaced()), [rebalance.Move(user.pk, 'default', target)])
+
+        # Прерванный перенос: копия зафиксирована, исходные данные не удалены
+        with mock.patch.object(rebalance, '_delete_user_data'):
+            call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(self.stored_in(user), ['default', target])
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(self.stored_in(user), [target])
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get(f'/api/accounts/{account}/').json()['balance'], '88.00')
+        export = client.get('/api/transactions/export/?format=csv')
+        self.assertEqual(len(b''.join(export.streaming_content).splitlines()), 4)
+        # Новые строки шарда получают id из его диапазона
+        created = client.post('/api/accounts/', {'name': 'New', 'balance': '0.00', 'currency': 'UZS'}).json()['id']
+        start, end = sharding.id_range(target)
+        self.assertTrue(start < created < end)
+
+
+class LoadDataTests(TestCase):
+    """Генератор нагрузочных данных: воспроизводимость и согласованные балансы"""
+
+    def generate(self, prefix):
+        stats = loadgen.generate(2, 2, 40, seed=3, workers=1, prefix=prefix, chunk_size=25)
+        accounts = Account.objects.filter(user__username__startswith=f'{prefix}_').order_by('id')
+        return stats, accounts
+
+    def net(self, account):
+        totals = account.transactions.aggregate(
+            income=Sum('amount', filter=Q(type='income'), default=0),
+            expense=Sum('amount', filter=Q(type='expense'), default=0),
+        )
+        return totals['income'] - totals['expense']
+
+    def test_reproducible_and_consistent(self):
+        stats, first = self.generate('a')
+        self.assertEqual((stats['users'], stats['accounts'], stats['transactions']), (2, 4, 160))
+        _, second = self.generate('b')
+
+        for left, right in zip(first, second):
+            # Одинаковый seed - одинаковые начальные балансы и истории
+            self.assertEqual(left.balance - self.net(left), right.balance - self.net(right))
+            self.assertEqual(
+                list(left.transactions.order_by('date').values_list('type', 'amount')),
+                list(right.transactions.order_by('date').values_list('type', 'amount')),
+            )
+            # Остаток последней транзакции совпадает с балансом счета
+            self.assertEqual(left.transactions.order_by('date', 'id').last().balance_after, left.balance)
+            self.assertEqual(balances.recalculate(left.pk), 0)
+        user = first[0].user
+        self.assertEqual(
+            rollups.for_user(user).aggregate(Sum('count'))['count__sum'],
+            Transaction.objects.filter(account__user=user).count(),
+        )
+        self.assertTrue(Token.objects.filter(user=user).exists())
+
+
+class BenchmarkCompareTests(TestCase):
+    """Сравнение результата бенчмарка с базовыми значениями"""
+
+    BASE = {'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'queries': 4, 'peak_memory_kb': 100.0}
+
+    def test_tolerance_and_queries(self):
+        within = dict(self.BASE, p95_ms=24.0)
+        self.assertEqual(suite.compare({'summary': within}, {'summary': self.BASE}, 0.25), [])
+
+        slower = dict(self.BASE, p95_ms=26.0, queries=5)
+        regressions = suite.compare({'summary': slower}, {'summary': self.BASE}, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith('summary:') for line in regressions))
+
+    def test_new_scenario_without_baseline(self):
+        self.assertEqual(suite.compare({'new': self.BASE}, {}, 0.25), [])
+
+
+class MetricsTests(APITestCase):
+    """Метрики запросов по имени URL в формате Prometheus"""
+
+    def setUp(self):
+        metrics.reset()
+        self.user = User.objects.create_user(username='metrics', password='pass')
+        Account.objects.create(user=self.user, name='Main', balance=100)
+        self.client.force_authenticate(self.user)
+
+    def test_exposition(self):
+        cache.clear()
+        self.client.get('/api/accounts/summary/')
+        self.client.get('/api/accounts/summary/')
+        self.client.get('/no-such-page/')
+
+        # Метрики видны только персоналу или с разрешённых адресов
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        self.client.force_login(User.objects.create_user(username='ops', password='pass', is_staff=True))
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        labels = '{view="account-summary",method="GET"}'
+        self.assertIn(
+            'bank_http_requests_total{view="account-summary",method="GET",status="200"} 2', lines,
+        )
+        self.assertIn(f'bank_http_request_duration_seconds_count{labels} 2', lines)
+        self.assertIn('# TYPE bank_http_request_sql_queries histogram', lines)
+        self.assertIn('bank_http_requests_total{view="unresolved",method="GET",status="404"} 1', lines)
+
+        # Промах кеша делает SQL-запросы, попадание - нет
+        sql_sum = next(line for line in lines if line.startswith(f'bank_http_request_sql_queries_sum{labels}'))
+        self.assertGreater(float(sql_sum.split()[-1]), 0)
+        zero_bucket = '{view="account-summary",method="GET",le="0"}'
+        self.assertIn(f'bank_http_request_sql_queries_bucket{zero_bucket} 1', lines)
+
+    def test_histogram_buckets(self):
+        histogram = metrics.Histogram('test_seconds', 'test', (0.1, 1.0), ('view',))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(('home',), value)
+        lines = list(histogram.collect())
+        self.assertEqual(lines[:3], [
+            'test_seconds_bucket{view="home",le="0.1"} 2',
+            'test_seconds_bucket{view="home",le="1.0"} 3',
+            'test_seconds_bucket{view="home",le="+Inf"} 4',
+        ])
+        self.assertEqual(lines[-1], 'test_seconds_count{view="home"} 4')
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Бюджет SQL-запросов для каждого эндпоинта API и каждой HTML-страницы.
+
+    Данных достаточно, чтобы любой запрос на строку (N+1) вышел за бюджет.
+    Бюджеты считаются при пустом кеше и включают аутентификацию.
+    /dashboard/async/ выполняет запросы в других потоках на своих соединениях,
+    их здесь не посчитать - он проверяется в AsyncSummaryTests.
+    """
+
+    ROWS = 30
+
+    API_BUDGETS = [
+        ('get', '/api/users/', 3),
+        ('get', '/api/users/me/', 1),
+        ('get', '/api/users/{user}/', 2),
+        ('get', '/api/categories/', 2),
+        ('get', '/api/categories/by_type/?type=expense', 2),
+        ('get', '/api/categories/{category}/', 2),
+        ('get', '/api/accounts/', 4),
+        ('get', '/api/accounts/{account}/', 4),
+        ('get', '/api/accounts/summary/', 7),
+        ('get', '/api/accounts/{account}/transactions/', 3),
+        # Списки и экспорт: +1 запрос на границу архива (при пустом кеше)
+        ('get', '/api/transactions/', 5),
+        ('get', '/api/transactions/?cursor=', 4),
+        ('get', '/api/transactions/?account_id={account}&period=month', 5),
+        ('get', '/api/transactions/{transaction}/', 2),
+        ('get', '/api/transactions/statistics/', 4),
+        ('get', '/api/transactions/export/?format=csv', 3),
+        ('get', '/api/recurring-payments/', 3),
+        ('get', '/api/recurring-payments/{payment}/', 2),
+        ('post', '/api/recurring-payments/{payment}/deactivate/', 3),
+        ('get', '/api/accounts/{account}/balance-history/?step=week', 4),
+        ('get', '/api/transactions/search/?q=purch', 2),
+        ('post', '/api/transactions/bulk/', 11),
+    ]
+
+    # Запись: сигналы сводки, остатков, версий счетов и кеша входят в бюджет.
+    # Удаляются отдельные объекты (spare_*), чтобы не мешать остальным проверкам
+    WRITE_BUDGETS = [
+        ('post', '/api/categories/', 3),
+        ('put', '/api/categories/{category}/', 4),
+        ('patch', '/api/categories/{category}/', 4),
+        ('delete', '/api/categories/{spare_category}/', 11),
+        ('post', '/api/accounts/', 2),
+        ('put', '/api/accounts/{account}/', 4),
+        ('patch', '/api/accounts/{account}/', 4),
+        ('delete', '/api/accounts/{spare_account}/', 9),
+        ('post', '/api/transactions/', 11),
+        ('put', '/api/transactions/{transaction}/', 17),
+        ('patch', '/api/transactions/{transaction}/', 12),
+        ('delete', '/api/transactions/{spare_transaction}/', 12),
+        ('post', '/api/recurring-payments/', 4),
+        ('put', '/api/recurring-payments/{payment}/', 5),
+        ('patch', '/api/recurring-payments/{payment}/', 5),
+        ('delete', '/api/recurring-payments/{spare_payment}/', 3),
+    ]
+
+    HTML_BUDGETS = [
+        ('get', '/', 2),
+        ('get', '/dashboard/', 6),
+        ('get', '/accounts/', 5),
+        ('get', '/accounts/add/', 2),
+        ('get', '/account/{account}/', 7),
+        ('get', '/account/{account}/add-transaction/', 4),
+        ('get', '/categories/', 4),
+        ('get', '/categories/add/', 2),
+        ('get', '/recurring-payments/', 3),
+        ('get', '/recurring-payments/add/', 4),
+        ('get', '/recurring-payments/{payment}/edit/', 5),
+        ('get', '/statistics/', 7),
+        ('get', '/set-language/?language=en', 4),
+        ('get', '/set-currency/?currency=USD', 4),
+        ('post', '/recurring-payments/{payment}/delete/', 5),
+        ('get', '/metrics/', 2),
+        # Выход завершает сессию - проверяется последним
+        ('post', '/logout/', 4),
+    ]
+
+    # Страницы входа открываются без сессии
+    ANONYMOUS_BUDGETS = [
+        ('get', '/login/', 0),
+        ('get', '/register/', 0),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        # Персонал - чтобы в бюджет попал и /metrics/
+        cls.user = User.objects.create_user(username='budget', password='pass', is_staff=True)
+        accounts = [
+            Account.objects.create(user=cls.user, name=f'Account {i}', balance=1000)
+            for i in range(3)
+        ]
+        categories = [
+            Category.objects.create(user=cls.user, name=f'Category {i}', type=('expense', 'income')[i % 2])
+            for i in range(6)
+        ]
+        now = timezone.now()
+        for i in range(cls.ROWS):
+            category = categories[i % len(categories)]
+            ledger.create_transaction(
+                account=accounts[i % len(accounts)], category=category, type=category.type,
+                amount=i + 1, description=f'Purchase {i}', date=now - timedelta(hours=i),
+            )
+        for i in range(cls.ROWS // 3):
+            RecurringPayment.objects.create(
+                account=accounts[i % len(accounts)], category=categories[i % len(categories)],
+                amount=10, description=f'Payment {i}', frequency='monthly',
+                start_date=timezone.localdate() + timedelta(days=1),
+            )
+        cls.ids = {
+            'user': cls.user.pk,
+            'account': accounts[0].pk,
+            'category': categories[0].pk,
+            'transaction': Transaction.objects.filter(account=accounts[0]).first().pk,
+            'payment': RecurringPayment.objects.filter(account=accounts[0]).first().pk,
+            'spare_account': accounts[2].pk,
+            'spare_category': categories[5].pk,
+            'spare_transaction': Transaction.objects.filter(account=accounts[1]).first().pk,
+            'spare_payment': RecurringPayment.objects.filter(account=accounts[1]).first().pk,
+        }
+        cls.token = Token.objects.get(user=cls.user).key
+
+    def body(self, method, url):
+        """Тело запроса на запись по URL коллекции или объекта (имена различаются по методу)"""
+        ids = self.ids
+        if url.startswith('/api/categories/'):
+            return {'name': f'Budget {method}', 'type': 'expense'}
+        if url.startswith('/api/accounts/'):
+            return {'name': f'Budget {method}', 'balance': '10.00', 'currency': 'UZS'}
+        if url.startswith('/api/transactions/'):
+            return {'account': ids['account'], 'category': ids['category'], 'type': 'expense', 'amount': '5.00'}
+        return {
+            'account': ids['account'], 'category': ids['category'], 'amount': '10.00',
+            'description': 'Budget', 'frequency': 'monthly',
+            'start_date': (timezone.localdate() + timedelta(days=1)).isoformat(),
+        }
+
+    def request(self, client, method, url):
+        url = url.format(**self.ids)
+        if method in ('post', 'put', 'patch') and url.startswith('/api/') and not url.endswith(('/bulk/', '/deactivate/')):
+            return getattr(client, method)(url, self.body(method, url), content_type='application/json')
+        if url == '/api/transactions/bulk/':
+            body = '\n'.join(
+                json.dumps({'account': self.ids['account'], 'category': self.ids['category'],
+                            'type': 'expense', 'amount': '1.00'})
+                for _ in range(self.ROWS)
+            )
+            return client.generic('POST', url, body, content_type='application/x-ndjson')
+        response = getattr(client, method)(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def check_budgets(self, client, budgets):
+        for method, url, budget in budgets:
+            with self.subTest(method=method, url=url):
+                cache.clear()
+                currency.clear_rates()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.request(client, method, url)
+                self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:200])
+                self.assertLessEqual(
+                    len(queries), budget,
+                    '\n'.join(query['sql'] for query in queries.captured_queries),
+                )
+
+    def test_api_endpoints(self):
+        client = Client(headers={'Authorization': f'Token {self.token}'})
+        self.check_budgets(client, self.API_BUDGETS)
+
+    def test_html_views(self):
+        client = Client()
+        client.force_login(self.user)
+        self.check_budgets(client, self.HTML_BUDGETS)
+
+    def test_anonymous_views(self):
+        self.check_budgets(Client(), self.ANONYMOUS_BUDGETS)
+
+    def test_api_writes(self):
+        client = Client(headers={'Authorization': f'Token {self.token}'})
+        self.check_budgets(client, self.WRITE_BUDGETS)
+
+    def test_html_views_require_login(self):
+        client = Client()
+        for method, url, _ in self.HTML_BUDGETS:
+            if url.startswith(('/account', '/categories/', '/recurring-payments/', '/statistics/', '/dashboard/')):
+                with self.subTest(url=url):
+                    response = self.request(client, method, url)
+                    self.assertEqual((response.status_code, response.url.split('?')[0]), (302, '/login/'))
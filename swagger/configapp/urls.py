@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Authentication
@@ -8,9 +8,11 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
     path('set-language/', views.set_language, name='set_language'),
+    path('set-currency/', views.set_currency, name='set_currency'),
     
     # Dashboard and main views
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/async/', async_views.dashboard, name='dashboard_async'),
     path('accounts/', views.accounts_list, name='accounts_list'),
     path('accounts/add/', views.add_account, name='add_account'),
     path('account/<int:pk>/', views.account_detail, name='account_detail'),
@@ -22,4 +24,7 @@ urlpatterns = [
     path('recurring-payments/<int:pk>/edit/', views.edit_recurring_payment, name='edit_recurring_payment'),
     path('recurring-payments/<int:pk>/delete/', views.delete_recurring_payment, name='delete_recurring_payment'),
     path('statistics/', views.statistics, name='statistics'),
+    
+    # Метрики для Prometheus
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
@@ -0,0 +1,92 @@
+"""
+Кеш данных пользователя с версионированием.
+
+Ключ кеша включает текущую версию данных пользователя. Сигналы на запись
+Account, Transaction, Category и RecurringPayment увеличивают версию после
+фиксации транзакции БД, и все старые записи сразу становятся
+недостижимыми - без перебора ключей.
+Старые записи просто истекают по таймауту. Работает с любым бэкендом
+Django, в том числе locmem и файловым. Увеличение версии атомарно там, где
+атомарен incr() бэкенда (Redis, Memcached, locmem в пределах процесса).
+У файлового бэкенда (DJANGO_CACHE_DIR) incr() - это чтение и запись файла,
+поэтому при одновременных записях из разных процессов одно увеличение может
+потеряться: кеш остаётся устаревшим до следующей записи пользователя или до
+истечения таймаута.
+"""
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+DEFAULT_TIMEOUT = 5 * 60
+
+
+def _version_key(user_id, namespace):
+    return f'user-version:{namespace}:{user_id}'
+
+
+def _initial_version():
+    # Если ключ версии вытеснен из кеша, новая версия не совпадёт ни с одной старой
+    return int(time.time() * 1000)
+
+
+def get_version(user_id, namespace='data'):
+    """Текущая версия данных пользователя"""
+    key = _version_key(user_id, namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _written_key(user_id):
+    return f'user-written:{user_id}'
+
+
+def bump(user_id, namespace='data'):
+    """Увеличить версию: все закешированные данные пользователя устаревают"""
+    key = _version_key(user_id, namespace)
+    # add() не перезапишет версию, заведённую параллельным процессом, а incr()
+    # после него всегда находит ключ
+    cache.add(key, _initial_version(), None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add() и incr()
+        cache.add(key, _initial_version(), None)
+    if namespace == 'data':
+        cache.set(_written_key(user_id), time.time(), None)
+
+
+def written_at(user_id):
+    """Время последней записи данных пользователя (unix time) или None, если неизвестно"""
+    return cache.get(_written_key(user_id))
+
+
+def key(user_id, name, params='', namespace='data'):
+    """Ключ кеша для данных name пользователя с учётом версии и параметров"""
+    digest = hashlib.md5(str(params).encode('utf-8'), usedforsecurity=False).hexdigest() if params else ''
+    return f'user-cache:{user_id}:{get_version(user_id, namespace)}:{name}:{digest}'
+
+
+def cached(user_id, name, builder, params='', timeout=DEFAULT_TIMEOUT, namespace='data'):
+    """Значение из кеша или результат builder(), сохранённый в кеш"""
+    cache_key = key(user_id, name, params, namespace)
+    value = cache.get(cache_key)
+    if value is None:
+        value = builder()
+        cache.set(cache_key, value, timeout)
+    return value
+
+
+async def acached(user_id, name, builder, params='', timeout=DEFAULT_TIMEOUT, namespace='data'):
+    """cached() для асинхронных представлений: тот же ключ, builder - корутина"""
+    cache_key = await sync_to_async(key)(user_id, name, params, namespace)
+    value = await cache.aget(cache_key)
+    if value is None:
+        value = await builder()
+        await cache.aset(cache_key, value, timeout)
+    return value
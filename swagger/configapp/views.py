@@ -1,16 +1,17 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.utils import timezone, translation
+from django.utils import translation
 from django.db.models import Sum, Q
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect
 from django.views.decorators.http import require_http_methods
-from datetime import timedelta
-from .models import Account, Transaction, Category, RecurringPayment
+from .models import Account, Category, RecurringPayment
 from .forms import TransactionForm, RecurringPaymentForm, AccountForm
+from . import analytics, currency, ledger, metrics, periods, rollups, snapshots
 
 def landing_or_redirect(request):
     """Главная страница - редирект на login если не авторизован"""
@@ -81,75 +82,33 @@ def set_language(request):
         request.session['django_language'] = language
     return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/dashboard/'))
 
+def set_currency(request):
+    """Смена валюты отчёта для общего баланса"""
+    code = request.GET.get('currency', '').upper()
+    if code in currency.currencies():
+        request.session[currency.SESSION_KEY] = code
+    return HttpResponseRedirect(request.META.get('HTTP_REFERER', '/dashboard/'))
+
 @login_required(login_url='login')
 def dashboard(request):
     """Главная страница с обзором счетов"""
 
-    accounts = Account.objects.filter(user=request.user)
-    first_account = accounts.first()
-
-    total_balance = accounts.aggregate(
-        total=Sum('balance')
-    )['total'] or 0
-
-    # Последние 10 транзакций текущего пользователя
-    recent_transactions = Transaction.objects.filter(
-        account__user=request.user
-    ).select_related('account', 'category').order_by('-date')[:10]
-
-    # Сегодня
-    today = timezone.now().date()
-
-    today_expenses = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__date=today
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-    today_income = Transaction.objects.filter(
-        account__user=request.user,
-        type='income',
-        date__date=today
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-    # Текущий месяц
-    current_month_start = timezone.now().replace(
-        day=1, hour=0, minute=0, second=0, microsecond=0
-    )
-
-    month_expenses = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__gte=current_month_start
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-    month_income = Transaction.objects.filter(
-        account__user=request.user,
-        type='income',
-        date__gte=current_month_start
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-    context = {
-        'accounts': accounts,
-        'first_account': first_account,
-        'total_balance': total_balance,
-        'recent_transactions': recent_transactions,
-        'today_expenses': today_expenses,
-        'today_income': today_income,
-        'month_expenses': month_expenses,
-        'month_income': month_income,
-    }
+    # Счета, последние 10 транзакций и итоги за сегодня/месяц - из снимка в кеше
+    context = snapshots.get_snapshot(request.user, currency.reporting_currency(request))
 
     return render(request, 'configapp/dashboard.html', context)
 
+@login_required(login_url='login')
 def accounts_list(request):
     """Список всех счетов"""
     accounts = Account.objects.filter(user=request.user)
-    total_balance = sum(acc.balance for acc in accounts)
+    reporting_currency = currency.reporting_currency(request)
     
     context = {
         'accounts': accounts,
-        'total_balance': total_balance,
+        # Сумма в валюте отчёта считается в БД
+        'total_balance': currency.total_balance(accounts, reporting_currency),
+        'reporting_currency': reporting_currency,
     }
     return render(request, 'configapp/accounts_list.html', context)
 
@@ -174,10 +133,11 @@ def add_account(request):
     return render(request, 'configapp/add_account.html', context)
 
 
+@login_required(login_url='login')
 def account_detail(request, pk):
     """Детали счета с транзакциями"""
     account = get_object_or_404(Account, pk=pk, user=request.user)
-    transactions = account.transactions.all()
+    transactions = account.transactions.select_related('category')
     
     # Фильтрация по типу
     transaction_type = request.GET.get('type')
@@ -191,20 +151,13 @@ def account_detail(request, pk):
     
     # Фильтрация по периоду
     period = request.GET.get('period', 'all')
-    today = timezone.now().date()
-    
-    if period == 'today':
-        transactions = transactions.filter(date__date=today)
-    elif period == 'week':
-        week_ago = today - timedelta(days=7)
-        transactions = transactions.filter(date__date__gte=week_ago)
-    elif period == 'month':
-        month_start = today.replace(day=1)
-        transactions = transactions.filter(date__date__gte=month_start)
+    transactions = periods.filter_by_params(transactions, request.GET)
     
     # Статистика
-    expenses = transactions.filter(type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
-    income = transactions.filter(type='income').aggregate(Sum('amount'))['amount__sum'] or 0
+    totals = transactions.aggregate(
+        expenses=Sum('amount', filter=Q(type='expense'), default=0),
+        income=Sum('amount', filter=Q(type='income'), default=0),
+    )
     
     categories = Category.objects.filter(transaction__account=account).distinct()
     
@@ -212,35 +165,31 @@ def account_detail(request, pk):
         'account': account,
         'transactions': transactions,
         'categories': categories,
-        'expenses': expenses,
-        'income': income,
+        'expenses': totals['expenses'],
+        'income': totals['income'],
         'period': period,
     }
     return render(request, 'configapp/account_detail.html', context)
 
 
+@login_required(login_url='login')
 def add_transaction(request, account_id):
     """Добавление новой транзакции"""
     account = get_object_or_404(Account, pk=account_id, user=request.user)
     
     if request.method == 'POST':
-        form = TransactionForm(request.POST)
+        form = TransactionForm(request.POST, user=request.user)
         if form.is_valid():
             transaction = form.save(commit=False)
             transaction.account = account
-            transaction.save()
             
-            # Обновление баланса счета
-            if transaction.type == 'income':
-                account.balance += transaction.amount
-            elif transaction.type == 'expense':
-                account.balance -= transaction.amount
-            account.save()
+            # Сохранение и обновление баланса счета одной транзакцией БД
+            ledger.post_transaction(transaction)
             
             messages.success(request, 'Транзакция успешно добавлена!')
             return redirect('account_detail', pk=account.id)
     else:
-        form = TransactionForm()
+        form = TransactionForm(user=request.user)
     
     context = {
         'form': form,
@@ -249,9 +198,10 @@ def add_transaction(request, account_id):
     return render(request, 'configapp/add_transaction.html', context)
 
 
+@login_required(login_url='login')
 def recurring_payments(request):
     """Список регулярных платежей"""
-    recurring = RecurringPayment.objects.filter(account__user=request.user)
+    recurring = RecurringPayment.objects.filter(account__user=request.user).select_related('account', 'category')
     
     context = {
         'recurring_payments': recurring,
@@ -259,10 +209,11 @@ def recurring_payments(request):
     return render(request, 'configapp/recurring_payments.html', context)
 
 
+@login_required(login_url='login')
 def add_recurring_payment(request):
     """Добавление регулярного платежа"""
     if request.method == 'POST':
-        form = RecurringPaymentForm(request.POST)
+        form = RecurringPaymentForm(request.POST, user=request.user)
         if form.is_valid():
             recurring = form.save(commit=False)
             recurring.account.user = request.user
@@ -270,7 +221,7 @@ def add_recurring_payment(request):
             messages.success(request, 'Регулярный платеж добавлен!')
             return redirect('recurring_payments')
     else:
-        form = RecurringPaymentForm()
+        form = RecurringPaymentForm(user=request.user)
     
     context = {
         'form': form,
@@ -278,18 +229,19 @@ def add_recurring_payment(request):
     return render(request, 'configapp/add_recurring_payment.html', context)
 
 
+@login_required(login_url='login')
 def edit_recurring_payment(request, pk):
     """Редактирование регулярного платежа"""
     recurring = get_object_or_404(RecurringPayment, pk=pk, account__user=request.user)
     
     if request.method == 'POST':
-        form = RecurringPaymentForm(request.POST, instance=recurring)
+        form = RecurringPaymentForm(request.POST, instance=recurring, user=request.user)
         if form.is_valid():
             form.save()
             messages.success(request, 'Платеж обновлен!')
             return redirect('recurring_payments')
     else:
-        form = RecurringPaymentForm(instance=recurring)
+        form = RecurringPaymentForm(instance=recurring, user=request.user)
     
     context = {
         'form': form,
@@ -298,6 +250,7 @@ def edit_recurring_payment(request, pk):
     return render(request, 'configapp/add_recurring_payment.html', context)
 
 
+@login_required(login_url='login')
 @require_POST
 def delete_recurring_payment(request, pk):
     """Удаление регулярного платежа"""
@@ -307,45 +260,33 @@ def delete_recurring_payment(request, pk):
     return redirect('recurring_payments')
 
 
+@login_required(login_url='login')
 def statistics(request):
-    """Статистика и графики"""
-    today = timezone.now().date()
-    month_start = today.replace(day=1)
+    """Статистика и графики (из реплики для отчётов, если она подходит)"""
+    # Запросы выполняются при отрисовке шаблона, поэтому она тоже внутри отчёта
+    with analytics.reporting(request.user.pk):
+        return _render_statistics(request)
+
+
+def _render_statistics(request):
+    month_start = rollups.month_start()
+    month_expenses = rollups.for_user(request.user).filter(type='expense', day__gte=month_start)
     
     # Расходы по категориям за месяц для текущего пользователя
-    expenses_by_category = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__date__gte=month_start
-    ).values('category__name').annotate(sum=Sum('amount')).order_by('-sum')
+    expenses_by_category = month_expenses.values('category__name').annotate(
+        sum=Sum('total')
+    ).order_by('-sum')
     
     # Расходы по дням за месяц для текущего пользователя
-    expenses_by_day = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__date__gte=month_start
-    ).extra(select={'day': 'DATE(date)'}).values('day').annotate(sum=Sum('amount')).order_by('day')
+    expenses_by_day = month_expenses.values('day').annotate(sum=Sum('total')).order_by('day')
     
     # Топ категорий за месяц для текущего пользователя
-    top_categories = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__date__gte=month_start
-    ).values('category__name', 'category__icon').annotate(
-        sum=Sum('amount')
+    top_categories = month_expenses.values('category__name', 'category__icon').annotate(
+        sum=Sum('total')
     ).order_by('-sum')[:5]
     
-    total_expenses = Transaction.objects.filter(
-        account__user=request.user,
-        type='expense',
-        date__date__gte=month_start
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
-    
-    total_income = Transaction.objects.filter(
-        account__user=request.user,
-        type='income',
-        date__date__gte=month_start
-    ).aggregate(Sum('amount'))['amount__sum'] or 0
+    total_expenses = rollups.period_total(request.user, 'expense', month_start)
+    total_income = rollups.period_total(request.user, 'income', month_start)
     
     context = {
         'expenses_by_category': expenses_by_category,
@@ -357,6 +298,7 @@ def statistics(request):
     return render(request, 'configapp/statistics.html', context)
 
 
+@login_required(login_url='login')
 def categories_list(request):
     """Список всех категорий"""
     categories = Category.objects.filter(user=request.user)
@@ -371,6 +313,7 @@ def categories_list(request):
     return render(request, 'configapp/categories_list.html', context)
 
 
+@login_required(login_url='login')
 def add_category(request):
     """Добавление новой категории"""
     if request.method == 'POST':
@@ -396,3 +339,11 @@ def add_category(request):
         'types': Category.TYPE_CHOICES,
     }
     return render(request, 'configapp/add_category.html', context)
+
+
+def prometheus_metrics(request):
+    """Метрики запросов процесса в формате Prometheus (персоналу или с адресов METRICS_ALLOWED_IPS)"""
+    # Адрес проверяется первым: сбор метрик не читает сессию
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
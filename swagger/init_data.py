@@ -7,6 +7,7 @@
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from configapp.models import Account, Category
+from configapp.sample_data import EXPENSE_CATEGORIES, INCOME_CATEGORIES
 
 # Создание пользователя
 username = "testuser"
@@ -34,26 +35,8 @@ if created:
 else:
     print(f"✓ Токен уже существует: {token.key}")
 
-# Категории расходов
-expense_categories = [
-    {"name": "Еда", "icon": "🍔", "color": "#FF6B6B"},
-    {"name": "Транспорт", "icon": "🚗", "color": "#4ECDC4"},
-    {"name": "Развлечения", "icon": "🎮", "color": "#45B7D1"},
-    {"name": "Коммунальные услуги", "icon": "💡", "color": "#FFA07A"},
-    {"name": "Здоровье", "icon": "⚕️", "color": "#98D8C8"},
-    {"name": "Одежда", "icon": "👔", "color": "#F7DC6F"},
-]
-
-# Категории доходов
-income_categories = [
-    {"name": "Зарплата", "icon": "💼", "color": "#52C41A"},
-    {"name": "Фриланс", "icon": "💻", "color": "#1890FF"},
-    {"name": "Инвестиции", "icon": "📈", "color": "#722ED1"},
-    {"name": "Подарки", "icon": "🎁", "color": "#EB2F96"},
-]
-
 # Создание категорий расходов
-for cat_data in expense_categories:
+for cat_data in EXPENSE_CATEGORIES:
     category, created = Category.objects.get_or_create(
         user=user,
         name=cat_data["name"],
@@ -69,7 +52,7 @@ for cat_data in expense_categories:
         print(f"✓ Категория расходов существует: {cat_data['name']}")
 
 # Создание категорий доходов
-for cat_data in income_categories:
+for cat_data in INCOME_CATEGORIES:
     category, created = Category.objects.get_or_create(
         user=user,
         name=cat_data["name"],